@@ -0,0 +1,127 @@
+"""
+Benchmark CharacterEncoder.encode on a 1 MB text report, against a
+per-character encoder like the one it replaced.
+
+Run with:
+
+    python -m benchmarks.character
+
+The per-character encoder picks a mode for every character and grows its
+buffer one character at a time, which is quadratic, so both encoders are
+compared on the first 64 KB of each report. Speedups at 1 MB are larger.
+"""
+
+import time
+from typing import Callable, List
+
+from imagewriter.encoding.base import Bytes, Command
+from imagewriter.encoding.character import (
+    CharacterEncoder,
+    extract_characters,
+    LANGUAGE_ENCODINGS,
+    LanguageMode,
+    Mode,
+    ModeState,
+    MouseTextMode,
+    printable_languages,
+    transition,
+)
+from imagewriter.encoding.character.mousetext import MouseTextCharacter
+from imagewriter.language import Language
+
+SIZE = 1024 * 1024
+BASELINE_SIZE = 64 * 1024
+
+LINE = "INV-00042  Widget, large (blue)      12 @    4.99     59.88\r\n"
+MOUSETEXT_LINE = "Total due → 59.88 … thank you ◆\r\n"
+BRITISH_LINE = "INV-00042  Widget, large (blue)      12 @   £4.99    £59.88\r\n"
+
+
+def report(line: str, size: int = SIZE) -> str:
+    return (line * (size // len(line) + 1))[:size]
+
+
+def mixed(size: int = SIZE) -> str:
+    block = LINE * 20 + MOUSETEXT_LINE
+    return report(block, size)
+
+
+def per_character(language: Language, text: str) -> List[Command]:
+    """
+    Encode text one character at a time.
+    """
+
+    default: LanguageMode = LanguageMode(language)
+    state: ModeState = (default, default)
+    encoded: List[Command] = list()
+    buffer: bytes = b""
+
+    for ch in extract_characters(text):
+        mode: Mode
+
+        if isinstance(ch, MouseTextCharacter):
+            mode = MouseTextMode()
+            encoded_ch: bytes = bytes([ch.value])
+        else:
+            assert isinstance(ch, str)
+            languages = printable_languages(ch)
+            language_mode: LanguageMode = state[1]
+
+            if language_mode.language not in languages:
+                language_mode = LanguageMode(
+                    next(lang for lang in Language if lang in languages)
+                )
+
+            mode = language_mode
+            table = LANGUAGE_ENCODINGS[language_mode.language]
+            encoded_ch = bytes(table.get(ch, ch), encoding="ascii")
+
+        if mode != state[0]:
+            encoded.append(Bytes(buffer))
+            buffer = b""
+            commands, state = transition(state, mode)
+            encoded += commands
+
+        buffer += encoded_ch
+
+    encoded.append(Bytes(buffer))
+    commands, _ = transition(state, default)
+
+    return encoded + commands
+
+
+def bench(encode: Callable[[], object], repeat: int = 3) -> float:
+    best: float = float("inf")
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encode()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main() -> None:
+    cases: List[tuple] = [
+        ("ascii", Language.AMERICAN, report(LINE)),
+        ("ascii + mousetext", Language.AMERICAN, mixed()),
+        ("british", Language.BRITISH, report(BRITISH_LINE)),
+    ]
+
+    for name, language, text in cases:
+        encoder = CharacterEncoder(language=language)
+        prefix: str = text[:BASELINE_SIZE]
+
+        best: float = bench(lambda: encoder.encode(text))
+        fast: float = bench(lambda: encoder.encode(prefix))
+        slow: float = bench(lambda: per_character(language, prefix), repeat=1)
+
+        print(
+            f"{name:<24} {SIZE / best / 1e6:>8.2f} MB/s  ({best * 1000:.1f} ms)"
+            f"  per-character {BASELINE_SIZE / slow / 1e6:>6.2f} MB/s"
+            f"  {slow / fast:>6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark rasterizing a full page of graphics, from a bitmap and through
+each dither.
+
+Run with:
+
+    python -m benchmarks.raster
+"""
+
+import time
+from typing import Callable, List
+
+import numpy as np
+import numpy.typing as npt
+
+from imagewriter.image import atkinson, floyd_steinberg, ordered, rasterize
+
+# A letter size page at 72 dpi, 1280 dots wide at the default pitch
+HEIGHT = 11 * 72
+WIDTH = 1280
+
+
+def bench(name: str, render: Callable[[], object], repeat: int = 3) -> float:
+    best: float = float("inf")
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        render()
+        best = min(best, time.perf_counter() - start)
+
+    print(f"{name:<24} {best * 1000:>8.1f} ms/page")
+    return best
+
+
+def main() -> None:
+    rng: np.random.Generator = np.random.default_rng(0)
+    bitmap: npt.NDArray = rng.random((HEIGHT, WIDTH)) < 0.5
+    image: npt.NDArray = (rng.random((HEIGHT, WIDTH)) * 255).astype(np.uint8)
+
+    cases: List[tuple] = [
+        ("bitmap", lambda: bitmap),
+        ("ordered", lambda: ordered(image)),
+        ("floyd-steinberg", lambda: floyd_steinberg(image)),
+        ("atkinson", lambda: atkinson(image)),
+    ]
+
+    for name, dither in cases:
+        bench(name, lambda: list(rasterize(dither())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+"""
+An asyncio connection to an ImageWriter II.
+
+`Connection` writes from a background thread, with blocking writes and
+flushes. An `AsyncConnection` instead runs on the event loop. The port's
+write timeout is set to 0, which makes writes non-blocking, and bursts are
+written whenever the loop reports the port's file descriptor as writable.
+Waiting for CTS, or for the UART to empty, is done with timers rather than
+by blocking. A single event loop thread can then drive many printers
+alongside HTTP clients.
+
+The serial port raises no events when its modem lines or its output queue
+change, so those are polled. Polls back off while CTS is low, and waits for
+the output queue to empty sleep for about as long as the queued bytes take
+to send at the port's baud rate.
+"""
+
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Deque, Optional, Self, Sequence, Tuple
+
+from imagewriter.encoding import Command, CommandBuffer
+from imagewriter.encoding.segment import segment_buffer
+from imagewriter.modem import MAX_POLL_INTERVAL, MIN_POLL_INTERVAL
+from imagewriter.serial import (
+    AVAILABLE_WHEN_CTS_HIGH,
+    AVAILABLE_WHEN_CTS_LOW,
+    BITS_PER_BYTE,
+    burst_budget,
+    Serial,
+    SerialProtocol,
+)
+
+
+class AsyncConnection:
+    """
+    A buffered connection to an ImageWriter II, driven by an asyncio event
+    loop.
+
+    Commands passed to `write` are queued, and sent in bursts of whole
+    commands while the printer's CTS signal is high, sized by CTS edges as
+    with `Connection`.
+    `write` returns a future which resolves once the commands have left the
+    host - the closest thing to an acknowledgement the printer offers.
+    """
+
+    def __init__(self: Self, port: Serial, segment: bool = True) -> None:
+        self._port: Serial = port
+        self.segment: bool = segment
+
+        # Encoded commands which have not yet been written
+        self._command_buffer: CommandBuffer = CommandBuffer()
+        # The number of bytes queued or being written
+        self._pending: int = 0
+        # The number of bytes which have been transmitted
+        self._transmitted: int = 0
+        # Futures waiting for the transmitted count to reach a mark
+        self._acknowledgements: Deque[Tuple[int, "asyncio.Future[None]"]] = deque()
+
+        # Held while a burst is being written
+        self._lock: asyncio.Lock = asyncio.Lock()
+        self._work: asyncio.Event = asyncio.Event()
+        self._idle: asyncio.Event = asyncio.Event()
+        self._idle.set()
+        self._writer: Optional["asyncio.Task[None]"] = None
+        self._error: Optional[BaseException] = None
+        # The port's write timeout, saved while writes are non-blocking
+        self._write_timeout: Optional[Tuple[Optional[float]]] = None
+        # The last CTS reading
+        self._cts: bool = False
+
+        self.paused: bool = False
+
+    @property
+    def port(self: Self) -> Serial:
+        return self._port
+
+    @property
+    def pending(self: Self) -> int:
+        """
+        The number of bytes which have been written but not yet transmitted.
+        """
+
+        return self._pending
+
+    @property
+    def transmitted(self: Self) -> int:
+        """
+        The total number of bytes which have been transmitted.
+        """
+
+        return self._transmitted
+
+    @property
+    def clear_to_send(self: Self) -> bool:
+        """
+        Whether or not the printer is currently accepting data.
+
+        Under XON/XOFF, flow control is handled by the operating system, and
+        the printer is always assumed to be accepting data.
+        """
+
+        if self.port.protocol == SerialProtocol.HARDWARE_HANDSHAKE:
+            return self.port.cts
+        return True
+
+    @property
+    def running(self: Self) -> bool:
+        return self._writer is not None and not self._writer.done()
+
+    def _raise_error(self: Self) -> None:
+        if self._error:
+            error = self._error
+            self._error = None
+            raise error
+
+    @property
+    def _segment_limit(self: Self) -> int:
+        """
+        The longest command which always fits in a burst. See `_budget`.
+        """
+
+        if self.port.protocol == SerialProtocol.HARDWARE_HANDSHAKE:
+            return AVAILABLE_WHEN_CTS_LOW
+
+        return AVAILABLE_WHEN_CTS_HIGH
+
+    def _budget(self: Self) -> int:
+        """
+        The number of bytes which may be sent in the next burst - 100 bytes
+        when CTS has just gone high, and 27 while it stays high. Under
+        XON/XOFF, bursts may always be 100 bytes.
+        """
+
+        if self.port.protocol != SerialProtocol.HARDWARE_HANDSHAKE:
+            return AVAILABLE_WHEN_CTS_HIGH
+
+        cts: bool = self.port.cts
+        rising: bool = cts and not self._cts
+        self._cts = cts
+
+        return burst_budget(cts, rising)
+
+    def write(
+        self: Self, commands: Sequence[Command] | CommandBuffer
+    ) -> "asyncio.Future[None]":
+        """
+        Queue commands to be written. Returns a future which resolves once
+        they've been transmitted.
+        """
+
+        self._raise_error()
+
+        if self.segment:
+            commands = segment_buffer(commands, self._segment_limit)
+
+        size: int = self._command_buffer.nbytes
+        self._command_buffer.extend(commands)
+        self._pending += self._command_buffer.nbytes - size
+
+        acknowledged: "asyncio.Future[None]" = (
+            asyncio.get_running_loop().create_future()
+        )
+        self._acknowledgements.append((self._transmitted + self._pending, acknowledged))
+        self._acknowledge()
+
+        self._work.set()
+        self._idle.clear()
+        self.start()
+
+        return acknowledged
+
+    def _acknowledge(self: Self) -> None:
+        while (
+            self._acknowledgements and self._acknowledgements[0][0] <= self._transmitted
+        ):
+            _, acknowledged = self._acknowledgements.popleft()
+
+            if not acknowledged.done():
+                acknowledged.set_result(None)
+
+    async def wait_for_cts(self: Self) -> None:
+        """
+        Wait until the printer is ready to accept more data.
+        """
+
+        interval: float = MIN_POLL_INTERVAL
+
+        while not self.clear_to_send:
+            # CTS has to rise again before a full burst may be sent
+            self._cts = False
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+    async def _send(self: Self, data: bytes) -> None:
+        """
+        Write data to the port as the loop reports it writable.
+        """
+
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        fd: int = self.port.fileno()
+        view: memoryview = memoryview(data)
+        sent: "asyncio.Future[None]" = loop.create_future()
+
+        def writable() -> None:
+            nonlocal view
+
+            try:
+                # With a write timeout of 0, this writes as much as the port
+                # will take without blocking
+                n: Optional[int] = self.port.write(view)
+            except Exception as exc:
+                loop.remove_writer(fd)
+                if not sent.done():
+                    sent.set_exception(exc)
+                return
+
+            view = view[n or 0 :]
+
+            if not view:
+                loop.remove_writer(fd)
+                if not sent.done():
+                    sent.set_result(None)
+
+        loop.add_writer(fd, writable)
+
+        try:
+            await sent
+        finally:
+            loop.remove_writer(fd)
+
+    async def wait_for_output(self: Self) -> None:
+        """
+        Wait until the port's output queue is empty, so that the next CTS
+        reading reflects the printer's view of its buffer.
+        """
+
+        while True:
+            waiting: int = self.port.out_waiting
+
+            if not waiting:
+                return
+
+            await asyncio.sleep(
+                max(waiting * BITS_PER_BYTE / self.port.baudrate, MIN_POLL_INTERVAL)
+            )
+
+    def _next_burst(self: Self, budget: int) -> Optional[bytes]:
+        n: int = self._command_buffer.count(budget)
+
+        if not n:
+            return None
+
+        with self._command_buffer[:n] as span:
+            burst: bytes = bytes(span)
+
+        self._command_buffer.consume(n)
+
+        return burst
+
+    async def _loop(self: Self) -> None:
+        try:
+            while True:
+                if not self._command_buffer or self.paused:
+                    self._work.clear()
+                    if not self._command_buffer:
+                        self._idle.set()
+                    await self._work.wait()
+                    continue
+
+                await self.wait_for_cts()
+
+                async with self._lock:
+                    if self.paused:
+                        continue
+
+                    budget: int = self._budget()
+
+                    if not budget:
+                        continue
+
+                    burst: Optional[bytes] = self._next_burst(budget)
+
+                    if burst is None:
+                        continue
+
+                    await self._send(burst)
+                    await self.wait_for_output()
+
+                    self._pending -= len(burst)
+                    self._transmitted += len(burst)
+                    self._acknowledge()
+        except BaseException as exc:
+            self._error = exc
+            self._command_buffer.clear()
+            self._pending = 0
+
+            for _, acknowledged in self._acknowledgements:
+                if not acknowledged.done():
+                    if isinstance(exc, asyncio.CancelledError):
+                        acknowledged.cancel()
+                    else:
+                        acknowledged.set_exception(exc)
+
+            self._acknowledgements.clear()
+            self._idle.set()
+            raise
+
+    def start(self: Self) -> None:
+        """
+        Start writing on the running event loop.
+        """
+
+        if self.running:
+            return
+
+        if self._write_timeout is None:
+            self._write_timeout = (self.port.write_timeout,)
+            self.port.write_timeout = 0
+
+        self._writer = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self: Self) -> None:
+        """
+        Stop writing. Commands which have not yet been written are dropped.
+        """
+
+        if self._writer is None:
+            return
+
+        writer: "asyncio.Task[None]" = self._writer
+        writer.cancel()
+
+        try:
+            await writer
+        except asyncio.CancelledError:
+            pass
+        except Exception:
+            # A write error has already been passed on to the writes it
+            # failed, and to drain
+            pass
+
+        self._writer = None
+        self._error = None
+
+        if self._write_timeout is not None:
+            self.port.write_timeout = self._write_timeout[0]
+            self._write_timeout = None
+
+    async def drain(self: Self) -> None:
+        """
+        Wait until all queued commands have been transmitted.
+        """
+
+        await self._idle.wait()
+        self._raise_error()
+
+    @asynccontextmanager
+    async def paused_writes(self: Self) -> AsyncGenerator[None, None]:
+        """
+        Create a context where writes are paused.
+        """
+
+        self.paused = True
+
+        try:
+            # Wait until the current burst has finished writing
+            async with self._lock:
+                yield
+        finally:
+            self.paused = False
+            self._work.set()
+
+    async def interrupt(self: Self, commands: Sequence[Command]) -> None:
+        """
+        Interrupt queued commands with new commands, sent without waiting for
+        CTS.
+        """
+
+        async with self.paused_writes():
+            self.port.rtscts = False
+            self.port.xonxoff = False
+
+            try:
+                await self._send(b"".join(bytes(command) for command in commands))
+                await self.wait_for_output()
+            finally:
+                protocol: SerialProtocol = self.port.protocol
+                self.port.rtscts = protocol == SerialProtocol.HARDWARE_HANDSHAKE
+                self.port.xonxoff = protocol == SerialProtocol.XONXOFF
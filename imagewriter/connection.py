@@ -1,33 +1,537 @@
+from collections import deque
 from contextlib import contextmanager
-from typing import Generator, List, Optional, Self, Sequence
+from dataclasses import dataclass
+import threading
+import time
+from typing import Deque, Generator, Optional, Self, Sequence
 
-from imagewriter.encoding import Command
-from imagewriter.serial import Serial, SerialProtocol
+from imagewriter.encoding import Command, CommandBuffer
+from imagewriter.encoding.segment import segment_buffer
+from imagewriter.occupancy import BufferModel
+from imagewriter.serial import (
+    AVAILABLE_WHEN_CTS_HIGH,
+    AVAILABLE_WHEN_CTS_LOW,
+    BITS_PER_BYTE,
+    burst_budget,
+    Serial,
+    SerialProtocol,
+)
+
+# How long to wait between checks of the CTS line while the printer's buffer
+# is full. The printer has to print at least 70 characters before it raises
+# CTS again, which takes hundreds of milliseconds even in draft quality.
+CTS_POLL_INTERVAL = 0.01
+
+
+@dataclass
+class ConnectionStats:
+    """
+    Statistics for urgent commands. Latency is measured from when urgent
+    commands are written to the connection to when they've left the host.
+    """
+
+    urgent_writes: int = 0
+    urgent_bytes: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+
+    @property
+    def mean_latency(self: Self) -> float:
+        if not self.urgent_writes:
+            return 0.0
+        return self.total_latency / self.urgent_writes
 
 
 class Connection:
-    def __init__(self: Self, port: Serial) -> None:
+    """
+    A buffered connection to an ImageWriter II.
+
+    Commands passed to `write` are queued and transmitted by a background
+    writer. The writer sends commands in bursts sized according to the
+    printer's CTS signal, and never splits a single command across bursts.
+
+    Commands too long to fit in a burst are split into smaller commands
+    which print identically, unless segmenting is disabled. Under the
+    hardware handshake, only 27 bytes are guaranteed while CTS stays high,
+    so without a model commands are split to fit in 27 bytes.
+
+    With a model of the printer's buffer, bursts are sized by how much room
+    the model estimates is free, rather than by CTS alone.
+
+    Urgent commands - cancelling the current line, deselecting the printer
+    or requesting its status - are queued separately, and are written ahead
+    of everything else, without waiting for CTS. They go out after the
+    burst being written. With a latency, bursts are written in pieces which
+    take no longer than that to transmit, and urgent commands go out after
+    the current piece. Under the hardware handshake, when CTS allows, the
+    next piece of the burst goes out in the same write as the urgent
+    commands.
+    """
+
+    def __init__(
+        self: Self,
+        port: Serial,
+        segment: bool = True,
+        model: Optional[BufferModel] = None,
+        latency: Optional[float] = None,
+    ) -> None:
         self._port: Serial = port
+        self.segment: bool = segment
+        self.model: Optional[BufferModel] = model
+        self.latency: Optional[float] = latency
 
-        self._command_buffer: List[Command] = list()
+        # Encoded commands which have not yet been written
+        self._command_buffer: CommandBuffer = CommandBuffer()
+        # Urgent commands which have not yet been written, and when each
+        # write of them was made
+        self._urgent_buffer: CommandBuffer = CommandBuffer()
+        self._urgent_times: Deque[float] = deque()
+        # The burst currently being written, if any
         self._bytes_buffer: Optional[bytes] = None
+        # The last CTS reading
+        self._cts: bool = False
+        # The number of bytes in all buffers
+        self._pending: int = 0
+        # The number of bytes which have been transmitted
+        self._transmitted: int = 0
+        # The total number of urgent bytes queued, and transmitted
+        self._urgent_queued: int = 0
+        self._urgent_transmitted: int = 0
+
+        self.stats: ConnectionStats = ConnectionStats()
+
+        self._condition: threading.Condition = threading.Condition()
+        self._writer: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
 
         self.paused: bool = False
+        self.running: bool = False
 
     @property
     def port(self: Self) -> Serial:
         return self._port
 
-    def write(self: Self, commands: Sequence[Command]) -> None:
+    @property
+    def pending(self: Self) -> int:
+        """
+        The number of bytes which have been written but not yet transmitted.
+        """
+
+        return self._pending
+
+    @property
+    def transmitted(self: Self) -> int:
+        """
+        The total number of bytes which have been transmitted.
+        """
+
+        return self._transmitted
+
+    @property
+    def queued(self: Self) -> int:
+        """
+        The total number of bytes which have been written, whether or not
+        they've been transmitted yet. The writer moves bytes from pending to
+        transmitted, so the two are read together under the lock.
+        """
+
+        with self._condition:
+            return self._transmitted + self._pending
+
+    @property
+    def clear_to_send(self: Self) -> bool:
+        """
+        Whether or not the printer is currently accepting data.
+
+        Under XON/XOFF, flow control is handled by the operating system, and
+        the printer is always assumed to be accepting data.
+        """
+
+        if self.port.protocol == SerialProtocol.HARDWARE_HANDSHAKE:
+            return self.port.cts
+        return True
+
+    def _raise_error(self: Self) -> None:
+        if self._error:
+            error = self._error
+            self._error = None
+            raise error
+
+    def write(
+        self: Self, commands: Sequence[Command] | CommandBuffer, urgent: bool = False
+    ) -> None:
         """
         Write to the serial port.
 
         Commands are buffered, respecting the ImageWriter II's CTS signal.
+        Urgent commands are written ahead of any buffered commands, ignoring
+        CTS.
+        """
+
+        self._raise_error()
+
+        if urgent:
+            self._queue_urgent(commands)
+            self.start()
+            return
+
+        if self.segment:
+            commands = segment_buffer(commands, self._segment_limit)
+
+        with self._condition:
+            size: int = self._command_buffer.nbytes
+            self._command_buffer.extend(commands)
+            self._pending += self._command_buffer.nbytes - size
+            self._condition.notify_all()
+
+        self.start()
+
+    def _queue_urgent(self: Self, commands: Sequence[Command] | CommandBuffer) -> int:
+        """
+        Queue urgent commands. Returns the total number of urgent bytes which
+        will have been transmitted once they're written.
+        """
+
+        with self._condition:
+            size: int = self._urgent_buffer.nbytes
+            self._urgent_buffer.extend(commands)
+            self._urgent_times.append(time.monotonic())
+            self._pending += self._urgent_buffer.nbytes - size
+            self._urgent_queued += self._urgent_buffer.nbytes - size
+            self._condition.notify_all()
+
+            return self._urgent_queued
+
+    @property
+    def _segment_limit(self: Self) -> int:
+        """
+        The longest command which always fits in a burst. See `_budget`.
+        """
+
+        if (
+            self.model is None
+            and self.port.protocol == SerialProtocol.HARDWARE_HANDSHAKE
+        ):
+            return AVAILABLE_WHEN_CTS_LOW
+
+        return AVAILABLE_WHEN_CTS_HIGH
+
+    def _budget(self: Self) -> int:
+        """
+        The number of bytes which may be sent in the next burst.
+
+        When CTS goes high, the printer guarantees room for at least 100
+        bytes. CTS stays high until fewer than 30 bytes are free, so while
+        it stays high, only the 27 bytes of grace are guaranteed. Under
+        XON/XOFF, the operating system stops sending when asked to, and
+        bursts may always be 100 bytes.
+
+        With a buffer model, the budget is the model's estimate of the free
+        space, up to 100 bytes. No burst is sent until the next command fits,
+        so that the writer checks CTS again before sending it. Commands
+        longer than 100 bytes are sent once there's room for 100.
+        """
+
+        if self.model is None:
+            if self.port.protocol != SerialProtocol.HARDWARE_HANDSHAKE:
+                return AVAILABLE_WHEN_CTS_HIGH
+
+            cts: bool = self.port.cts
+            rising: bool = cts and not self._cts
+            self._cts = cts
+
+            return burst_budget(cts, rising)
+
+        budget: int = self.model.budget(self.clear_to_send)
+        needed: int = 0
+
+        with self._condition:
+            if self._command_buffer:
+                with self._command_buffer[0] as command:
+                    needed = min(len(command), AVAILABLE_WHEN_CTS_HIGH)
+
+        if budget < needed:
+            return 0
+
+        return min(budget, AVAILABLE_WHEN_CTS_HIGH)
+
+    @property
+    def _piece_size(self: Self) -> int:
+        """
+        The number of bytes which may be written at once, so that urgent
+        commands wait no longer than the latency.
+        """
+
+        if self.latency is None:
+            return AVAILABLE_WHEN_CTS_HIGH
+
+        return max(int(self.latency * self.port.baudrate / BITS_PER_BYTE), 1)
+
+    def _take(self: Self, commands: CommandBuffer, n: int) -> bytes:
+        """
+        Move commands off of the front of a buffer into a burst.
+        """
+
+        with commands[:n] as span:
+            burst: bytes = bytes(span)
+
+        commands.consume(n)
+
+        return burst
+
+    def _next_burst(self: Self, budget: int) -> Optional[bytes]:
+        """
+        Take as many whole commands off of the buffer as will fit in the
+        budget. A command larger than the budget is sent in a burst of its
+        own, as commands may not be split.
         """
 
-        # TODO: Manage a buffer, respect pause
-        for command in commands:
-            self.port.write(bytes(command))
+        n: int = self._command_buffer.count(budget)
+
+        if not n:
+            return None
+
+        return self._take(self._command_buffer, n)
+
+    def _wait_for_work(self: Self) -> bool:
+        """
+        Wait until there are urgent commands to write, or commands to write
+        and writes are not paused. Returns False if the writer has been
+        stopped.
+        """
+
+        with self._condition:
+            while (
+                self.running
+                and not self._urgent_buffer
+                and (self.paused or not self._command_buffer)
+            ):
+                self._condition.wait()
+
+            return self.running
+
+    def _send(self: Self, data: bytes) -> None:
+        """
+        Write to the port, and wait for the data to leave the host, so that
+        the next CTS reading reflects the printer's view of its buffer.
+        """
+
+        self.port.write(data)
+        self.port.flush()
+
+        if self.model is not None:
+            self.model.sent(data)
+
+    def _sent(self: Self, data: bytes) -> None:
+        with self._condition:
+            self._pending -= len(data)
+            self._transmitted += len(data)
+            self._bytes_buffer = None
+            self._condition.notify_all()
+
+    def _send_urgent(self: Self) -> bool:
+        """
+        Write any urgent commands, with flow control disabled. Returns True
+        if there were any.
+        """
+
+        with self._condition:
+            if not self._urgent_buffer:
+                return False
+
+            urgent: bytes = self._take(self._urgent_buffer, len(self._urgent_buffer))
+            times: Deque[float] = self._urgent_times
+            self._urgent_times = deque()
+            self._bytes_buffer = urgent
+
+        piece: bytes = self._next_piece()
+        data: bytes = urgent + piece if piece else urgent
+
+        with self._condition:
+            self._bytes_buffer = data
+
+        with self.disabled_flow_control():
+            self.port.write(data)
+            self.port.flush()
+            now: float = time.monotonic()
+
+        if self.model is not None:
+            self.model.sent(data)
+
+        for submitted in times:
+            latency: float = now - submitted
+            self.stats.urgent_writes += 1
+            self.stats.total_latency += latency
+            self.stats.max_latency = max(self.stats.max_latency, latency)
+
+        self.stats.urgent_bytes += len(urgent)
+
+        with self._condition:
+            self._urgent_transmitted += len(urgent)
+
+        self._sent(data)
+
+        return True
+
+    def _next_piece(self: Self) -> bytes:
+        """
+        Take the next piece of the burst to write along with urgent commands,
+        if CTS allows it. Urgent commands are written with flow control
+        disabled, so this is only done under the hardware handshake, where
+        CTS has just been read. Under XON/XOFF, the host can't tell whether
+        the printer has asked it to stop.
+        """
+
+        if self.port.protocol != SerialProtocol.HARDWARE_HANDSHAKE:
+            return b""
+
+        with self._condition:
+            if self.paused or not self._command_buffer:
+                return b""
+
+        budget: int = self._budget()
+
+        with self._condition:
+            if not budget or self.paused:
+                return b""
+
+            # A command which doesn't fit waits for the next burst
+            with self._command_buffer[0] as command:
+                if len(command) > budget:
+                    return b""
+
+            return self._next_burst(min(self._piece_size, budget)) or b""
+
+    def _write_burst(self: Self, budget: int) -> None:
+        """
+        Write a burst of whole commands, in pieces no larger than the piece
+        size. Stops early if urgent commands are written or writes are
+        paused.
+        """
+
+        size: int = self._piece_size
+        first: bool = True
+
+        while budget > 0:
+            with self._condition:
+                if self.paused or self._urgent_buffer or not self._command_buffer:
+                    return
+
+                # Only the first piece may go over budget, as it may hold a
+                # command which couldn't be segmented to fit
+                if not first:
+                    with self._command_buffer[0] as command:
+                        if len(command) > budget:
+                            return
+
+                self._bytes_buffer = self._next_burst(min(size, budget))
+                first = False
+
+            if self._bytes_buffer is None:
+                return
+
+            piece: bytes = self._bytes_buffer
+            self._send(piece)
+            self._sent(piece)
+            budget -= len(piece)
+
+    def _loop(self: Self) -> None:
+        try:
+            while self._wait_for_work():
+                if self._send_urgent():
+                    continue
+
+                with self._condition:
+                    if self.paused:
+                        continue
+
+                budget: int = self._budget()
+
+                if not budget:
+                    # Wake up early for urgent commands
+                    with self._condition:
+                        self._condition.wait_for(
+                            lambda: bool(self._urgent_buffer) or not self.running,
+                            CTS_POLL_INTERVAL,
+                        )
+                    continue
+
+                self._write_burst(budget)
+        except BaseException as exc:
+            with self._condition:
+                self._error = exc
+                self._command_buffer.clear()
+                self._urgent_buffer.clear()
+                self._urgent_times.clear()
+                self._bytes_buffer = None
+                self._pending = 0
+                self.running = False
+                self._condition.notify_all()
+
+    def start(self: Self) -> None:
+        """
+        Start the background writer. The writer is a daemon thread, so that
+        programs which never shut the connection down can still exit.
+        """
+
+        with self._condition:
+            if self.running:
+                return
+
+            previous: Optional[threading.Thread] = self._writer
+
+        # Let a stopped writer finish its burst before starting another
+        if previous is not None and previous is not threading.current_thread():
+            previous.join()
+
+        with self._condition:
+            if self.running:
+                return
+
+            self.running = True
+            self._writer = threading.Thread(
+                target=self._loop, name="imagewriter-connection", daemon=True
+            )
+            self._writer.start()
+
+    def stop(self: Self) -> None:
+        """
+        Stop the background writer. Commands which have not yet been written
+        remain buffered.
+        """
+
+        with self._condition:
+            self.running = False
+            self._condition.notify_all()
+
+    def shutdown(self: Self) -> None:
+        self.stop()
+
+        writer: Optional[threading.Thread] = self._writer
+
+        if writer is not None and writer is not threading.current_thread():
+            writer.join()
+
+    @property
+    def _drained(self: Self) -> bool:
+        return (
+            not self._command_buffer
+            and not self._urgent_buffer
+            and self._bytes_buffer is None
+        )
+
+    def drain(self: Self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until all buffered commands have been written. Returns False if
+        the timeout expired first.
+        """
+
+        with self._condition:
+            self._condition.wait_for(lambda: not self.running or self._drained, timeout)
+            drained = self._drained
+
+        self._raise_error()
+        return drained
 
     @contextmanager
     def paused_writes(self: Self) -> Generator[None, None, None]:
@@ -35,13 +539,18 @@ class Connection:
         Create a context where writes are paused.
         """
 
-        self.paused = True
-
-        # TODO: Wait until current command has finished writing.
+        with self._condition:
+            self.paused = True
 
-        yield
+            # Wait until the current burst has finished writing
+            self._condition.wait_for(lambda: self._bytes_buffer is None)
 
-        self.paused = False
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.paused = False
+                self._condition.notify_all()
 
     @contextmanager
     def disabled_flow_control(self: Self) -> Generator[None, None, None]:
@@ -52,17 +561,31 @@ class Connection:
         self.port.rtscts = False
         self.port.xonxoff = False
 
-        yield
+        try:
+            yield
+        finally:
+            self.port.rtscts = self.port.protocol == SerialProtocol.HARDWARE_HANDSHAKE
+            self.port.xonxoff = self.port.protocol == SerialProtocol.XONXOFF
 
-        self.port.rtscts = self.port.protocol == SerialProtocol.HARDWARE_HANDSHAKE
-        self.port.xonxoff = self.port.protocol == SerialProtocol.XONXOFF
-
-    def interrupt(self: Self, commands: Sequence[Command]) -> None:
+    def interrupt(
+        self: Self, commands: Sequence[Command], timeout: Optional[float] = None
+    ) -> bool:
         """
-        Interrupt buffered commands with new commands.
+        Interrupt buffered commands with new commands, and wait until they've
+        been written. Returns False if the timeout expired first.
         """
 
-        with self.paused_writes():
-            with self.disabled_flow_control():
-                for command in commands:
-                    self.port.write(bytes(command))
+        self._raise_error()
+
+        mark: int = self._queue_urgent(commands)
+        self.start()
+
+        with self._condition:
+            self._condition.wait_for(
+                lambda: not self.running or self._urgent_transmitted >= mark,
+                timeout,
+            )
+            interrupted = self._urgent_transmitted >= mark
+
+        self._raise_error()
+        return interrupted
@@ -0,0 +1,423 @@
+"""
+Estimate how long a job will take to print.
+
+A job's time is made up of sending its bytes over the serial port, and of
+the printer working through them - printing characters, making graphics
+passes, feeding paper and shifting the ribbon. The printer buffers input,
+so sending and printing overlap, and a job takes roughly as long as the
+slower of the two.
+
+The model parses the encoded job once, counting what it does (`Usage`), then
+prices the counts (`Estimate`). Counting is the expensive part, and is
+independent of the model's rates, so a model can be calibrated against
+timings of real jobs by fitting a scale factor for each component.
+
+Rates for graphics, paper feeds and ribbon shifts are estimates, and are
+the first thing calibration should correct.
+"""
+
+from dataclasses import dataclass, field, replace
+from typing import Dict, Iterable, List, Self, Sequence, Tuple, Type
+
+import numpy as np
+
+from imagewriter.encoding.base import Command
+from imagewriter.encoding.parser import Parser
+from imagewriter.pitch import Pitch
+from imagewriter.quality import Quality
+from imagewriter.serial import BaudRate, BITS_PER_BYTE
+from imagewriter.switch import DIPSwitches
+from imagewriter.units import VERTICAL_RESOLUTION
+
+# Graphics are assumed to print at the head speed of Correspondence text in
+# Pica pitch - 180 characters per second at 10 characters per inch
+GRAPHICS_INCHES_PER_SECOND = 18.0
+
+# Time to reverse the print head at the end of a graphics pass
+PASS_SECONDS = 0.05
+
+# Time to start a paper feed, and the rate at which paper moves
+FEED_SECONDS = 0.02
+FEED_INCHES_PER_SECOND = 3.0
+
+# Time to shift the color ribbon to another band
+RIBBON_SHIFT_SECONDS = 0.5
+
+# The default distance between lines, at 6 lines per inch
+DEFAULT_LINE_DISTANCE = VERTICAL_RESOLUTION // 6
+
+PITCHES: Dict[bytes, Pitch] = {
+    b"n": Pitch.EXTENDED,
+    b"N": Pitch.PICA,
+    b"E": Pitch.ELITE,
+    b"e": Pitch.SEMICONDENSED,
+    b"q": Pitch.CONDENSED,
+    b"Q": Pitch.ULTRACONDENSED,
+    b"p": Pitch.PICA_PROPORTIONAL,
+    b"P": Pitch.ELITE_PROPORTIONAL,
+}
+
+# Escape codes for attributes which force Correspondence quality, and
+# whether they switch the attribute on
+ATTRIBUTES: Dict[bytes, Tuple[str, bool]] = {
+    b"!": ("boldface", True),
+    b'"': ("boldface", False),
+    b"w": ("half_height", True),
+    b"W": ("half_height", False),
+    b"x": ("script", True),
+    b"y": ("script", True),
+    b"z": ("script", False),
+}
+
+ESC = 0x1B
+CR = 0x0D
+LF = 0x0A
+FF = 0x0C
+SO = 0x0E
+SI = 0x0F
+US = 0x1F
+
+
+@dataclass
+class Usage:
+    """
+    What a job does, as counted by scanning it.
+    """
+
+    bytes: int = 0
+    # Characters printed, weighted by the time each takes at 1 character per
+    # second
+    character_seconds: float = 0.0
+    characters: int = 0
+    # Inches travelled by the print head in graphics mode
+    graphics_inches: float = 0.0
+    passes: int = 0
+    feeds: int = 0
+    feed_inches: float = 0.0
+    ribbon_shifts: int = 0
+
+    def __add__(self: Self, other: "Usage") -> "Usage":
+        return Usage(
+            bytes=self.bytes + other.bytes,
+            character_seconds=self.character_seconds + other.character_seconds,
+            characters=self.characters + other.characters,
+            graphics_inches=self.graphics_inches + other.graphics_inches,
+            passes=self.passes + other.passes,
+            feeds=self.feeds + other.feeds,
+            feed_inches=self.feed_inches + other.feed_inches,
+            ribbon_shifts=self.ribbon_shifts + other.ribbon_shifts,
+        )
+
+
+@dataclass
+class Estimate:
+    """
+    An estimated print time, broken down by component, in seconds.
+    """
+
+    serial: float = 0.0
+    text: float = 0.0
+    graphics: float = 0.0
+    feeds: float = 0.0
+    ribbon: float = 0.0
+
+    @property
+    def printing(self: Self) -> float:
+        """
+        Time spent by the printer itself.
+        """
+
+        return self.text + self.graphics + self.feeds + self.ribbon
+
+    @property
+    def total(self: Self) -> float:
+        """
+        Time to print the job. The printer buffers input, so sending and
+        printing overlap.
+        """
+
+        return max(self.serial, self.printing)
+
+
+@dataclass
+class _State:
+    """
+    Printer state tracked while scanning a job.
+    """
+
+    quality: Quality
+    pitch: Pitch
+    form_length: float
+    attributes: Dict[str, bool] = field(default_factory=dict)
+    double_width: bool = False
+    color: bytes = b"0"
+    line_distance: int = DEFAULT_LINE_DISTANCE
+    # Distance down the page, in inches
+    position: float = 0.0
+    graphics: bool = False
+
+    @property
+    def correspondence(self: Self) -> bool:
+        """
+        Whether characters are forced to print at Correspondence quality.
+        """
+
+        return (
+            self.pitch.is_proportional
+            or self.double_width
+            or any(self.attributes.values())
+        )
+
+    @property
+    def print_speed(self: Self) -> int:
+        if self.correspondence:
+            return min(self.quality.print_speed, Quality.CORRESPONDENCE.print_speed)
+        return self.quality.print_speed
+
+
+def _number(data: bytes, start: int, width: int) -> int:
+    try:
+        return int(data[start : start + width])
+    except ValueError:
+        return 0
+
+
+@dataclass
+class CostModel:
+    """
+    A model of how long jobs take to print. The scale factors multiply each
+    component of an estimate, and are set by calibration.
+    """
+
+    baud_rate: BaudRate = 9600
+    quality: Quality = Quality.DRAFT
+    pitch: Pitch = Pitch.ELITE
+    form_length: float = 11
+    serial_scale: float = 1.0
+    text_scale: float = 1.0
+    graphics_scale: float = 1.0
+    feed_scale: float = 1.0
+    ribbon_scale: float = 1.0
+
+    @classmethod
+    def from_dip_switches(
+        cls: Type[Self], dip_switches: DIPSwitches, quality: Quality = Quality.DRAFT
+    ) -> Self:
+        return cls(
+            baud_rate=dip_switches.baud_rate,
+            quality=quality,
+            pitch=dip_switches.pitch,
+            form_length=dip_switches.form_length,
+        )
+
+    def _feed(self: Self, state: _State, usage: Usage, lines: int) -> None:
+        self._advance(state, usage, lines * state.line_distance / VERTICAL_RESOLUTION)
+
+    def _advance(self: Self, state: _State, usage: Usage, inches: float) -> None:
+        usage.feeds += 1
+        usage.feed_inches += inches
+        state.position = (state.position + inches) % state.form_length
+        state.graphics = False
+
+    def _graphics(self: Self, state: _State, usage: Usage, columns: int) -> None:
+        if not state.graphics:
+            usage.passes += 1
+            state.graphics = True
+
+        usage.graphics_inches += columns / state.pitch.horizontal_resolution
+
+    def _text(self: Self, state: _State, usage: Usage, characters: int) -> None:
+        usage.characters += characters
+        usage.character_seconds += characters / state.print_speed
+
+    def _control(self: Self, command: bytes, state: _State, usage: Usage) -> None:
+        byte: int = command[0]
+
+        if byte == LF:
+            self._feed(state, usage, 1)
+        elif byte == US:
+            self._feed(state, usage, max(command[1] - ord("0"), 1))
+        elif byte == FF:
+            # Feed to the top of the next form. This is measured in inches,
+            # as the line distance may be 0.
+            self._advance(state, usage, state.form_length - state.position)
+            state.position = 0.0
+        elif byte == CR:
+            state.graphics = False
+        elif byte == SO:
+            state.double_width = True
+        elif byte == SI:
+            state.double_width = False
+        elif byte == ESC and len(command) > 1:
+            self._escape(command[1:2], command[2:], state, usage)
+
+    def _escape(
+        self: Self, code: bytes, arguments: bytes, state: _State, usage: Usage
+    ) -> None:
+        if code == b"G":
+            self._graphics(state, usage, len(arguments) - 4)
+        elif code == b"g":
+            self._graphics(state, usage, len(arguments) - 3)
+        elif code == b"V":
+            self._graphics(state, usage, _number(arguments, 0, 4))
+        elif code == b"R":
+            self._text(state, usage, _number(arguments, 0, 3))
+        elif code == b"m" and not arguments:
+            # Scribe mode Correspondence, rather than set spacing
+            state.quality = Quality.CORRESPONDENCE
+        elif code == b"M":
+            state.quality = Quality.NEAR_LETTER_QUALITY
+        elif code == b"a":
+            try:
+                state.quality = Quality(arguments.decode("ascii"))
+            except ValueError:
+                pass
+        elif code == b"K":
+            if arguments != state.color:
+                usage.ribbon_shifts += 1
+                state.color = arguments
+        elif code == b"T":
+            state.line_distance = _number(arguments, 0, 2)
+        elif code == b"A":
+            state.line_distance = VERTICAL_RESOLUTION // 6
+        elif code == b"B":
+            state.line_distance = VERTICAL_RESOLUTION // 8
+        elif code in PITCHES:
+            state.pitch = PITCHES[code]
+        elif code in ATTRIBUTES:
+            name, enabled = ATTRIBUTES[code]
+            state.attributes[name] = enabled
+        elif code == b"c":
+            state.attributes.clear()
+            state.double_width = False
+
+    def _scan(
+        self: Self, parser: Parser, data: bytes, state: _State, usage: Usage
+    ) -> None:
+        buffer, spans = parser.split(data)
+
+        for start, end in spans:
+            byte: int = buffer[start]
+
+            if byte >= 0x20 and byte != 0x7F:
+                self._text(state, usage, end - start)
+            else:
+                self._control(buffer[start:end], state, usage)
+
+    def measure(self: Self, commands: Iterable[Command | bytes]) -> Usage:
+        """
+        Count what a job does.
+        """
+
+        return Meter(self).measure(commands)
+
+    def price(self: Self, usage: Usage) -> Estimate:
+        """
+        Price a job's usage.
+        """
+
+        return Estimate(
+            serial=self.serial_scale * usage.bytes * BITS_PER_BYTE / self.baud_rate,
+            text=self.text_scale * usage.character_seconds,
+            graphics=self.graphics_scale
+            * (
+                usage.graphics_inches / GRAPHICS_INCHES_PER_SECOND
+                + usage.passes * PASS_SECONDS
+            ),
+            feeds=self.feed_scale
+            * (usage.feeds * FEED_SECONDS + usage.feed_inches / FEED_INCHES_PER_SECOND),
+            ribbon=self.ribbon_scale * usage.ribbon_shifts * RIBBON_SHIFT_SECONDS,
+        )
+
+    def estimate(self: Self, commands: Iterable[Command | bytes]) -> Estimate:
+        """
+        Estimate how long a job will take to print.
+        """
+
+        return self.price(self.measure(commands))
+
+    def calibrate(self: Self, samples: Sequence[Tuple[Usage, float]]) -> Self:
+        """
+        Fit the scale factors for printing to measured times of real jobs,
+        with least squares. Jobs whose time was dominated by sending them
+        over the serial port say nothing about printing, and are skipped.
+        Components which none of the jobs exercised keep their current
+        scale.
+        """
+
+        unscaled: Self = replace(
+            self,
+            text_scale=1.0,
+            graphics_scale=1.0,
+            feed_scale=1.0,
+            ribbon_scale=1.0,
+        )
+
+        rows: List[List[float]] = list()
+        times: List[float] = list()
+
+        for usage, seconds in samples:
+            estimate: Estimate = unscaled.price(usage)
+
+            if estimate.serial * self.serial_scale >= seconds:
+                continue
+
+            rows.append(
+                [estimate.text, estimate.graphics, estimate.feeds, estimate.ribbon]
+            )
+            times.append(seconds)
+
+        scales: List[float] = [
+            self.text_scale,
+            self.graphics_scale,
+            self.feed_scale,
+            self.ribbon_scale,
+        ]
+
+        if rows:
+            matrix = np.array(rows)
+            used = matrix.any(axis=0)
+            fitted, _, _, _ = np.linalg.lstsq(
+                matrix[:, used], np.array(times), rcond=None
+            )
+
+            for i, scale in zip(np.flatnonzero(used), fitted):
+                scales[i] = max(float(scale), 0.0)
+
+        return replace(
+            self,
+            text_scale=scales[0],
+            graphics_scale=scales[1],
+            feed_scale=scales[2],
+            ribbon_scale=scales[3],
+        )
+
+
+class Meter:
+    """
+    Measures a job as it's sent, one piece at a time. Printer state - the
+    quality, pitch, position on the page and so on - carries over from one
+    piece to the next.
+    """
+
+    def __init__(self: Self, model: CostModel) -> None:
+        self.model: CostModel = model
+        self._state: _State = _State(
+            quality=model.quality, pitch=model.pitch, form_length=model.form_length
+        )
+        # Holds back commands which are split between pieces
+        self._parser: Parser = Parser()
+
+    def measure(self: Self, commands: Iterable[Command | bytes]) -> Usage:
+        """
+        Count what the next piece of a job does. A command split between
+        pieces is counted with the piece it ends in.
+        """
+
+        usage: Usage = Usage()
+        data: bytes = b"".join(bytes(command) for command in commands)
+
+        usage.bytes = len(data)
+        self.model._scan(self._parser, data, self._state, usage)
+
+        return usage
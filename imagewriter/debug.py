@@ -1,16 +1,24 @@
-from concurrent.futures import ThreadPoolExecutor
 import datetime
-import time
+import threading
 from typing import Optional, Self
 
 from serial import Serial
 
+from imagewriter.modem import ModemLines, ModemLineWatcher
+
 
 class SerialStateObserver:
+    """
+    Print the state of the serial port's modem lines whenever they change.
+
+    The observer runs on a daemon thread, as the underlying watcher may block
+    in an ioctl until the next line transition.
+    """
+
     def __init__(self: Self, serial: Serial) -> None:
         self.serial: Serial = serial
-        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1)
-        self._tick: float = 0.25 / serial.baudrate
+        self._watcher: Optional[ModemLineWatcher] = None
+        self._thread: Optional[threading.Thread] = None
         self.running: bool = False
 
     def _timestamp(self: Self) -> str:
@@ -32,40 +40,40 @@ class SerialStateObserver:
         print(self._fmt_row("CTS", self.serial.cts))
         print("|-------------------")
 
-    def _loop(self: Self) -> None:
-        dtr: Optional[bool] = None
-        dsr: Optional[bool] = None
-        rts: Optional[bool] = None
-        cts: Optional[bool] = None
+    def _loop(self: Self, watcher: ModemLineWatcher) -> None:
+        lines: Optional[ModemLines] = None
 
         while self.running:
-            if any(
-                [
-                    dtr != self.serial.dtr,
-                    dsr != self.serial.dsr,
-                    rts != self.serial.rts,
-                    cts != self.serial.cts,
-                ]
-            ):
-                self.on_change()
-
-                dtr = self.serial.dtr
-                dsr = self.serial.dsr
-                rts = self.serial.rts
-                cts = self.serial.cts
-
-            time.sleep(self._tick)
+            lines = watcher.wait(lines)
+
+            if lines is None or not self.running:
+                break
+
+            self.on_change()
 
     def start(self: Self) -> None:
         if self.running:
             return
 
         self.running = True
-        self._executor.submit(self._loop)
+        self._watcher = ModemLineWatcher(self.serial)
+        self._thread = threading.Thread(
+            target=self._loop, args=(self._watcher,), daemon=True
+        )
+        self._thread.start()
 
     def stop(self: Self) -> None:
         self.running = False
 
+        if self._watcher:
+            self._watcher.close()
+            self._watcher = None
+
     def shutdown(self: Self) -> None:
+        """
+        Stop the observer. A thread blocked on TIOCMIWAIT exits at the next
+        line transition or when the port is closed.
+        """
+
         self.stop()
-        self._executor.shutdown()
+        self._thread = None
@@ -0,0 +1,371 @@
+"""
+A virtual ImageWriter II, running on a pseudo-terminal.
+
+The virtual printer reads bytes off of the pty at the configured baud rate,
+models the printer's buffer as it fills and drains, and drives flow control
+the way a real printer would - either through a simulated CTS line, or by
+sending XON/XOFF. This allows measuring throughput and buffer overruns
+without hardware.
+
+A time scale allows simulating long jobs quickly. With a time scale of 60,
+a job which would take ten minutes on a real printer takes ten seconds.
+
+The printer plugs into a Container through its serial and connection
+factories:
+
+    printer = VirtualPrinter(time_scale=60)
+    printer.start()
+
+    container = Container(
+        printer.path,
+        serial=printer.serial_factory,
+        connection=printer.connection_factory,
+    )
+"""
+
+from dataclasses import dataclass
+import os
+import select
+import threading
+import time
+import tty
+from typing import Optional, Self
+
+from imagewriter.connection import Connection
+from imagewriter.memory import print_buffer_size
+from imagewriter.quality import Quality
+from imagewriter.serial import (
+    AVAILABLE_WHEN_CTS_HIGH,
+    AVAILABLE_WHEN_CTS_LOW,
+    BaudRate,
+    BITS_PER_BYTE,
+    Serial,
+    SerialProtocol,
+)
+from imagewriter.switch import DIPSwitches
+
+XON = b"\x11"
+XOFF = b"\x13"
+
+# The printer de-asserts CTS when this many bytes remain in its buffer. See
+# the notes on AVAILABLE_WHEN_CTS_LOW in imagewriter.serial.
+CTS_LOW_THRESHOLD = AVAILABLE_WHEN_CTS_LOW + 3
+
+# How often the virtual printer wakes up, in real seconds
+TICK = 0.001
+
+
+@dataclass
+class VirtualPrinterStats:
+    """
+    Statistics collected by a virtual printer. Times are in simulated
+    seconds.
+    """
+
+    elapsed: float = 0.0
+    received: int = 0
+    printed: float = 0.0
+    overruns: int = 0
+    max_level: float = 0.0
+    flow_control_stops: int = 0
+
+    @property
+    def throughput(self: Self) -> float:
+        """
+        Bytes received per simulated second.
+        """
+
+        if not self.elapsed:
+            return 0.0
+        return self.received / self.elapsed
+
+
+class VirtualPrinter:
+    """
+    A virtual ImageWriter II.
+    """
+
+    def __init__(
+        self: Self,
+        dip_switches: Optional[DIPSwitches] = None,
+        quality: Quality = Quality.DRAFT,
+        expansion: bool = False,
+        time_scale: float = 1.0,
+        capture: bool = True,
+    ) -> None:
+        self.dip_switches: DIPSwitches = (
+            DIPSwitches.defaults() if dip_switches is None else dip_switches
+        )
+        self.quality: Quality = quality
+        self.capacity: int = print_buffer_size(expansion)
+        self.time_scale: float = time_scale
+
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.path: str = os.ttyname(self._slave)
+
+        self.level: float = 0.0
+        self.cts: bool = True
+        self.stats: VirtualPrinterStats = VirtualPrinterStats()
+        self.output: Optional[bytearray] = bytearray() if capture else None
+
+        self._serial: Optional["VirtualSerial"] = None
+        self._condition: threading.Condition = threading.Condition()
+        self._reader: Optional[threading.Thread] = None
+        self.running: bool = False
+
+    @property
+    def baud_rate(self: Self) -> BaudRate:
+        return self.dip_switches.baud_rate
+
+    @property
+    def protocol(self: Self) -> SerialProtocol:
+        return self.dip_switches.protocol
+
+    @property
+    def free(self: Self) -> float:
+        """
+        The number of bytes free in the print buffer.
+        """
+
+        return self.capacity - self.level
+
+    def serial_factory(self: Self, port: str, dip_switches: DIPSwitches) -> "Serial":
+        """
+        Open a serial port attached to the virtual printer. Suitable for use
+        as a Container's SerialFactory.
+        """
+
+        self._serial = VirtualSerial(
+            self, port=port, baudrate=dip_switches.baud_rate, protocol=self.protocol
+        )
+        return self._serial
+
+    def connection_factory(self: Self, port: Serial) -> Connection:
+        """
+        Create a connection to the virtual printer. Suitable for use as a
+        Container's ConnectionFactory.
+        """
+
+        return Connection(port)
+
+    def _flow_controlled(self: Self) -> bool:
+        """
+        Whether the host currently has flow control enabled.
+        """
+
+        if not self._serial:
+            return False
+
+        if self.protocol == SerialProtocol.HARDWARE_HANDSHAKE:
+            return self._serial.rtscts
+
+        return self._serial.xonxoff
+
+    def _halted(self: Self) -> bool:
+        """
+        Whether the host's UART is holding data back, as it does when the
+        printer has asked it to stop and it has flow control enabled.
+
+        Bytes which the host has already written to the pty are treated as
+        still being in the host's buffers, rather than on the wire.
+        """
+
+        return not self.cts and self._flow_controlled()
+
+    def _receive(self: Self, data: bytes) -> None:
+        accepted: int = min(len(data), int(self.free))
+
+        self.level += accepted
+        self.stats.received += len(data)
+        self.stats.overruns += len(data) - accepted
+        self.stats.max_level = max(self.stats.max_level, self.level)
+
+        if self.output is not None:
+            self.output += data
+
+    def _read(self: Self, wanted: int) -> int:
+        """
+        Read up to a number of bytes off of the wire, returning how much of
+        the line's time was used. That's the number of bytes read, unless
+        the line went idle - an idle line doesn't bank time for later, so
+        then all of it is used.
+        """
+
+        received: int = 0
+
+        while received < wanted and not self._halted():
+            chunk: int = wanted - received
+
+            # The host's UART stops sending within a few bytes of the printer
+            # asking it to
+            if self.cts and self._flow_controlled():
+                chunk = min(chunk, max(int(self.free) - CTS_LOW_THRESHOLD + 3, 1))
+
+            ready, _, _ = select.select([self._master], [], [], 0)
+
+            if not ready:
+                return wanted
+
+            data: bytes = os.read(self._master, chunk)
+            received += len(data)
+            self._receive(data)
+            self._update_flow_control()
+
+        return received
+
+    def _update_flow_control(self: Self) -> None:
+        if self.cts and self.free < CTS_LOW_THRESHOLD:
+            self.cts = False
+            self.stats.flow_control_stops += 1
+
+            if self.protocol == SerialProtocol.XONXOFF:
+                os.write(self._master, XOFF)
+        elif not self.cts and self.free >= AVAILABLE_WHEN_CTS_HIGH:
+            self.cts = True
+
+            if self.protocol == SerialProtocol.XONXOFF:
+                os.write(self._master, XON)
+
+    def _loop(self: Self) -> None:
+        rate: float = self.baud_rate / BITS_PER_BYTE
+        credit: float = 0.0
+        last: float = time.monotonic()
+
+        while self.running:
+            now: float = time.monotonic()
+            elapsed: float = (now - last) * self.time_scale
+            last = now
+
+            with self._condition:
+                self.stats.elapsed += elapsed
+
+                # Print out of the buffer
+                printed: float = min(self.level, elapsed * self.quality.print_speed)
+                self.level -= printed
+                self.stats.printed += printed
+
+                # Receive as many bytes as the wire could have carried
+                if self._halted():
+                    credit = 0.0
+                else:
+                    credit += elapsed * rate
+                    credit -= self._read(int(credit))
+
+                self._update_flow_control()
+                self._condition.notify_all()
+
+            time.sleep(TICK)
+
+    def start(self: Self) -> None:
+        """
+        Start the printer. It runs on a daemon thread, so that programs which
+        never shut it down can still exit.
+        """
+
+        if self.running:
+            return
+
+        # Let a stopped printer finish its tick before starting another
+        if self._reader is not None:
+            self._reader.join()
+
+        self.running = True
+        self._reader = threading.Thread(
+            target=self._loop, name="imagewriter-virtual-printer", daemon=True
+        )
+        self._reader.start()
+
+    def stop(self: Self) -> None:
+        self.running = False
+
+    def shutdown(self: Self) -> None:
+        self.stop()
+
+        if self._reader is not None:
+            self._reader.join()
+
+        if self._serial and self._serial.is_open:
+            self._serial.close()
+
+        os.close(self._master)
+        os.close(self._slave)
+
+    def wait_for_received(
+        self: Self, total: int, timeout: Optional[float] = None
+    ) -> bool:
+        """
+        Wait until the printer has received a total number of bytes.
+        """
+
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self.running or self.stats.received >= total, timeout
+            )
+
+
+class VirtualSerial(Serial):
+    """
+    A serial port attached to a virtual printer.
+
+    A pseudo-terminal has no modem lines, so the printer's simulated CTS line
+    is reported directly. Flushing waits until the printer has read every
+    byte off of the wire, like tcdrain would on a real serial port.
+    """
+
+    def __init__(
+        self: Self,
+        printer: VirtualPrinter,
+        port: Optional[str] = None,
+        baudrate: BaudRate = 9600,
+        timeout: Optional[float] = None,
+        protocol: SerialProtocol = SerialProtocol.HARDWARE_HANDSHAKE,
+        write_timeout: Optional[float] = None,
+    ) -> None:
+        self._printer: VirtualPrinter = printer
+        self._written: int = 0
+
+        super().__init__(
+            port=port or printer.path,
+            baudrate=baudrate,
+            timeout=timeout,
+            protocol=protocol,
+            write_timeout=write_timeout,
+        )
+
+    def write(self: Self, data: bytes | bytearray | memoryview) -> Optional[int]:
+        written: Optional[int] = super().write(data)
+        self._written += written or 0
+        return written
+
+    def flush(self: Self) -> None:
+        printer: VirtualPrinter = self._printer
+        printer.wait_for_received(self._written)
+
+    @property
+    def out_waiting(self: Self) -> int:
+        return max(self._written - self._printer.stats.received, 0)
+
+    @property
+    def cts(self: Self) -> bool:
+        return self._printer.cts
+
+    @property
+    def dsr(self: Self) -> bool:
+        return self._printer.running
+
+    @property
+    def ri(self: Self) -> bool:
+        return False
+
+    @property
+    def cd(self: Self) -> bool:
+        return self._printer.running
+
+    def _update_rts_state(self: Self) -> None:
+        # Pseudo-terminals do not have an RTS line
+        pass
+
+    def _update_dtr_state(self: Self) -> None:
+        # Pseudo-terminals do not have a DTR line
+        pass
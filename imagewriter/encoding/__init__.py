@@ -16,14 +16,17 @@ from imagewriter.encoding.attributes import (
 )
 from imagewriter.encoding.base import Bytes, Command, ctrl, Ctrl, esc, Esc, NULL
 from imagewriter.encoding.boundaries import SetLeftMargin, SetPageLength
+from imagewriter.encoding.buffer import CommandBuffer
 from imagewriter.encoding.cancel import CANCEL_CURRENT_LINE
 from imagewriter.encoding.character import CharacterEncoder, Text
+from imagewriter.encoding.character.cache import EncoderCache
 from imagewriter.encoding.character.custom import (
     BOTTOM_WIRES,
     character_data,
     CustomCharacter,
     TOP_WIRES,
 )
+from imagewriter.encoding.character.glyphs import GlyphCache
 from imagewriter.encoding.color import Color
 from imagewriter.encoding.graphics import (
     PrintGraphicsData,
@@ -44,11 +47,14 @@ from imagewriter.encoding.motion import (
     TAB,
     TabStops,
 )
+from imagewriter.encoding.optimize import optimize
 from imagewriter.encoding.paper import DISABLE_PAPER_OUT_SENSOR, ENABLE_PAPER_OUT_SENSOR
+from imagewriter.encoding.parser import parse, Parser
 from imagewriter.encoding.pitch import insert_spaces, set_pitch, set_spacing
 from imagewriter.encoding.quality import select_quality
 from imagewriter.encoding.repeat import repeat
 from imagewriter.encoding.reset import RESET
+from imagewriter.encoding.segment import segment
 from imagewriter.encoding.select import DESELECT, SELECT
 from imagewriter.encoding.switch import (
     CloseSoftwareSwitches,
@@ -76,15 +82,18 @@ __all__: List[str] = [
     "Esc",
     "NULL",
     "Command",
+    "CommandBuffer",
     "SetLeftMargin",
     "SetPageLength",
     "CANCEL_CURRENT_LINE",
     "CharacterEncoder",
     "Text",
+    "EncoderCache",
     "BOTTOM_WIRES",
     "character_data",
     "CustomCharacter",
     "TOP_WIRES",
+    "GlyphCache",
     "Color",
     "PrintGraphicsData",
     "set_graphics_distance_between_lines",
@@ -99,6 +108,9 @@ __all__: List[str] = [
     "SetUnidirectionalPrinting",
     "TAB",
     "TabStops",
+    "optimize",
+    "parse",
+    "Parser",
     "DISABLE_PAPER_OUT_SENSOR",
     "ENABLE_PAPER_OUT_SENSOR",
     "insert_spaces",
@@ -107,6 +119,7 @@ __all__: List[str] = [
     "select_quality",
     "repeat",
     "RESET",
+    "segment",
     "DESELECT",
     "SELECT",
     "CloseSoftwareSwitches",
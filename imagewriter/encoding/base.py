@@ -40,6 +40,13 @@ class Command(ABC):
     def __bytes__(self: Self) -> bytes:
         pass
 
+    def encode_into(self: Self, buffer: bytearray) -> None:
+        """
+        Encode the command onto the end of a buffer.
+        """
+
+        buffer += self.__bytes__()
+
 
 class Null(Command):
     """
@@ -61,6 +68,9 @@ class Bytes(Command):
     def __init__(self: Self, data: bytes) -> None:
         self.bytes: bytes = data
 
+    def __len__(self: Self) -> int:
+        return len(self.bytes)
+
     def __bytes__(self: Self) -> bytes:
         return self.bytes
 
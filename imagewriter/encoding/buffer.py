@@ -0,0 +1,175 @@
+from array import array
+from bisect import bisect_right
+from typing import Iterable, Iterator, overload, Self
+
+from imagewriter.encoding.base import Command
+
+
+class CommandBuffer:
+    """
+    A compact sequence of encoded commands.
+
+    Commands are encoded into a single growable bytearray, and the offset at
+    which each command ends is stored in an array. This takes a fraction of
+    the memory of a list of Command objects, and spans of whole commands can
+    be sliced out as memoryviews without copying.
+
+    Note that a bytearray can not be resized while views of it exist, so
+    spans must be released before the buffer is modified.
+    """
+
+    def __init__(self: Self, commands: Iterable[Command] = ()) -> None:
+        self._data: bytearray = bytearray()
+        self._ends: array[int] = array("I")
+        # The index of the first command which has not been consumed
+        self._head: int = 0
+
+        self.extend(commands)
+
+    def __len__(self: Self) -> int:
+        """
+        The number of commands in the buffer.
+        """
+
+        return len(self._ends) - self._head
+
+    @property
+    def nbytes(self: Self) -> int:
+        """
+        The number of encoded bytes in the buffer.
+        """
+
+        return len(self._data) - self._offset(self._head)
+
+    def _offset(self: Self, index: int) -> int:
+        """
+        The offset at which the command at an absolute index starts.
+        """
+
+        return self._ends[index - 1] if index else 0
+
+    def append(self: Self, command: Command) -> None:
+        """
+        Encode a command onto the end of the buffer. Empty commands are
+        dropped.
+        """
+
+        size: int = len(self._data)
+        command.encode_into(self._data)
+
+        if len(self._data) > size:
+            self._ends.append(len(self._data))
+
+    def append_bytes(self: Self, data: bytes | bytearray | memoryview) -> None:
+        """
+        Append pre-encoded data as a single command.
+        """
+
+        if data:
+            self._data += data
+            self._ends.append(len(self._data))
+
+    def extend(self: Self, commands: "Iterable[Command] | CommandBuffer") -> None:
+        """
+        Encode commands onto the end of the buffer.
+        """
+
+        if isinstance(commands, CommandBuffer):
+            base: int = len(self._data) - commands._offset(commands._head)
+            self._data += commands.view()
+            self._ends.extend(end + base for end in commands._ends[commands._head :])
+            return
+
+        for command in commands:
+            self.append(command)
+
+    def view(self: Self) -> memoryview:
+        """
+        A view of all encoded bytes in the buffer.
+        """
+
+        return memoryview(self._data)[self._offset(self._head) :]
+
+    @overload
+    def __getitem__(self: Self, key: int) -> memoryview: ...
+
+    @overload
+    def __getitem__(self: Self, key: slice) -> memoryview: ...
+
+    def __getitem__(self: Self, key: int | slice) -> memoryview:
+        """
+        Get a view of a single command, or of a contiguous range of commands.
+        """
+
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+
+            if step != 1:
+                raise ValueError("Command spans must be contiguous")
+
+            stop = max(start, stop)
+        else:
+            start = key + len(self) if key < 0 else key
+
+            if not (0 <= start < len(self)):
+                raise IndexError("CommandBuffer index out of range")
+
+            stop = start + 1
+
+        return memoryview(self._data)[
+            self._offset(self._head + start) : self._offset(self._head + stop)
+        ]
+
+    def __iter__(self: Self) -> Iterator[memoryview]:
+        view: memoryview = memoryview(self._data)
+        start: int = self._offset(self._head)
+
+        for end in self._ends[self._head :]:
+            yield view[start:end]
+            start = end
+
+    def __bytes__(self: Self) -> bytes:
+        return bytes(self.view())
+
+    def count(self: Self, budget: int) -> int:
+        """
+        The number of whole commands, from the front of the buffer, which fit
+        in a budget of bytes. If the first command is larger than the budget,
+        it is counted anyway, as commands may not be split.
+        """
+
+        if not len(self):
+            return 0
+
+        limit: int = self._offset(self._head) + budget
+        stop: int = bisect_right(self._ends, limit, lo=self._head + 1)
+
+        return stop - self._head
+
+    def consume(self: Self, n: int) -> None:
+        """
+        Remove commands from the front of the buffer.
+        """
+
+        self._head = min(self._head + n, len(self._ends))
+
+        if self._head == len(self._ends):
+            self.clear()
+        elif self._head > 1024 and self._head * 2 > len(self._ends):
+            self._compact()
+
+    def _compact(self: Self) -> None:
+        """
+        Drop consumed commands from memory.
+        """
+
+        start: int = self._offset(self._head)
+
+        del self._data[:start]
+        self._ends = array("I", (end - start for end in self._ends[self._head :]))
+        self._head = 0
+
+    def clear(self: Self) -> None:
+        del self._data[:]
+        self._ends = array("I")
+        self._head = 0
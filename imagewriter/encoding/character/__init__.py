@@ -1,9 +1,23 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Generator, List, Self
+import re
+from typing import (
+    Any,
+    cast,
+    Dict,
+    FrozenSet,
+    Generator,
+    List,
+    Optional,
+    Self,
+    Sequence,
+    Tuple,
+)
 
 from imagewriter.encoding.base import Bytes, Command, Esc
+from imagewriter.encoding.buffer import CommandBuffer
 from imagewriter.encoding.character.custom import CustomCharacter, CustomCharacters
 from imagewriter.encoding.character.mousetext import MouseText, MouseTextCharacter
+from imagewriter.encoding.character.plan import plan
 from imagewriter.encoding.language import set_language
 from imagewriter.language import Language
 
@@ -56,13 +70,18 @@ class Mode(ABC):
     def __eq__(self: Self, other: Any) -> bool:
         pass
 
+    @abstractmethod
+    def __hash__(self: Self) -> int:
+        pass
+
 
 class LanguageMode(Mode):
     def __init__(self: Self, language: Language) -> None:
         self.language: Language = language
+        self._enable: List[Command] = set_language(language)
 
     def enable(self: Self) -> List[Command]:
-        return set_language(self.language)
+        return list(self._enable)
 
     def disable(self: Self) -> List[Command]:
         # Language modes can not be disabled
@@ -71,6 +90,9 @@ class LanguageMode(Mode):
     def __eq__(self: Self, other: Any) -> bool:
         return isinstance(other, LanguageMode) and self.language == other.language
 
+    def __hash__(self: Self) -> int:
+        return hash((LanguageMode, self.language))
+
 
 LANGUAGE_MODES: Dict[str, List[LanguageMode]] = {
     ch: [LanguageMode(lang) for lang in langs]
@@ -78,6 +100,53 @@ LANGUAGE_MODES: Dict[str, List[LanguageMode]] = {
 }
 
 
+# Translation tables for each language's alternate characters
+LANGUAGE_TABLES: Dict[Language, Dict[int, str]] = {
+    lang: str.maketrans(encodings) for lang, encodings in LANGUAGE_ENCODINGS.items()
+}
+
+
+# Characters displaced by each language's alternate characters, which can't
+# be printed in that language
+DISPLACED_CHARACTERS: Dict[Language, FrozenSet[str]] = {
+    lang: frozenset(encodings.values())
+    for lang, encodings in LANGUAGE_ENCODINGS.items()
+}
+
+ALL_LANGUAGES: FrozenSet[Language] = frozenset(Language)
+
+
+def printable_languages(character: str) -> FrozenSet[Language]:
+    """
+    The languages a character can be printed in.
+    """
+
+    if character in LANGUAGE_CHARACTERS:
+        return frozenset(LANGUAGE_CHARACTERS[character])
+
+    return frozenset(
+        lang for lang in Language if character not in DISPLACED_CHARACTERS[lang]
+    )
+
+
+def _restricted_characters() -> "re.Pattern[str]":
+    """
+    Compile a pattern matching characters which can't be printed in every
+    language - MouseText characters, alternate characters, and the characters
+    they displace. Longer MouseText sequences are matched first, so that
+    characters followed by a variation selector are matched whole.
+    """
+
+    restricted: List[str] = sorted(MOUSETEXT_CHARACTERS, key=len, reverse=True)
+    restricted += list(LANGUAGE_CHARACTERS)
+    restricted += sorted(set().union(*DISPLACED_CHARACTERS.values()))
+
+    return re.compile("|".join(re.escape(ch) for ch in restricted))
+
+
+RESTRICTED_CHARACTERS: "re.Pattern[str]" = _restricted_characters()
+
+
 class MouseTextMode(Mode):
     def __init__(self, map: bool = True) -> None:
         self.map: bool = map
@@ -91,6 +160,9 @@ class MouseTextMode(Mode):
     def __eq__(self: Self, other: Any) -> bool:
         return isinstance(other, MouseTextMode) and self.map == other.map
 
+    def __hash__(self: Self) -> int:
+        return hash((MouseTextMode, self.map))
+
 
 class CustomCharacterMode(Mode):
     def __init__(self: Self, map: bool = True) -> None:
@@ -103,7 +175,10 @@ class CustomCharacterMode(Mode):
         return [DISABLE_MODE]
 
     def __eq__(self: Self, other: Any) -> bool:
-        return isinstance(other, MouseTextMode) and self.map == other.map
+        return isinstance(other, CustomCharacterMode) and self.map == other.map
+
+    def __hash__(self: Self) -> int:
+        return hash((CustomCharacterMode, self.map))
 
 
 def map_to_low_ascii(point: int) -> int:
@@ -134,10 +209,117 @@ def extract_characters(*text: Text) -> Generator[Character, None, None]:
             yield tx
 
 
+# The mode the printer is in, and the language it prints text in
+ModeState = Tuple[Mode, LanguageMode]
+
+
+def transition(state: ModeState, mode: Mode) -> Tuple[List[Command], ModeState]:
+    """
+    The commands which switch from one mode to another, and the state they
+    leave the printer in.
+
+    Disabling MouseText or custom characters returns to the current
+    language, so switching back to that language only costs disabling the
+    mode.
+    """
+
+    current, language = state
+
+    if mode == current:
+        return [], state
+
+    encoded: List[Command] = (
+        list() if isinstance(current, LanguageMode) else current.disable()
+    )
+
+    if isinstance(mode, LanguageMode):
+        if mode != language:
+            encoded += mode.enable()
+        return encoded, (mode, mode)
+
+    return encoded + mode.enable(), (mode, language)
+
+
+def transition_cost(state: ModeState, mode: Mode) -> Tuple[int, ModeState]:
+    """
+    The number of bytes it takes to switch from one mode to another, and the
+    state it leaves the printer in.
+    """
+
+    encoded, after = transition(state, mode)
+    return sum(len(bytes(command)) for command in encoded), after
+
+
+# A piece of text printed in a single mode
+Segment = str | MouseTextCharacter | CustomCharacter
+
+
+class _Segments:
+    """
+    Segments of text, and the languages each can be printed in.
+
+    Neighbouring pieces of text are merged when that can't make a plan more
+    expensive - when one of them can be printed in any language, or when
+    both can be printed in the same languages. Every language switch costs
+    the same, so printing such a piece in its neighbour's language is always
+    at least as cheap. Text with no characters which need a switch, or in
+    which every such character needs the same languages, becomes a single
+    segment, and planning it is trivial.
+    """
+
+    def __init__(self: Self) -> None:
+        self.segments: List[Segment] = list()
+        self.languages: List[FrozenSet[Language]] = list()
+        # Pieces of the text segment being merged, and its languages
+        self._pieces: List[str] = list()
+        self._printable: FrozenSet[Language] = ALL_LANGUAGES
+
+    def _flush(self: Self) -> None:
+        if self._pieces:
+            self.segments.append("".join(self._pieces))
+            self.languages.append(self._printable)
+            self._pieces.clear()
+
+    def append(self: Self, segment: Segment, printable: FrozenSet[Language]) -> None:
+        if not isinstance(segment, str):
+            self._flush()
+            self.segments.append(segment)
+            self.languages.append(printable)
+            return
+
+        if self._pieces and not (
+            printable == ALL_LANGUAGES
+            or self._printable == ALL_LANGUAGES
+            or printable == self._printable
+        ):
+            self._flush()
+
+        if not self._pieces or self._printable == ALL_LANGUAGES:
+            self._printable = printable
+
+        self._pieces.append(segment)
+
+    def close(self: Self) -> Tuple[List[Segment], List[FrozenSet[Language]]]:
+        self._flush()
+        return self.segments, self.languages
+
+
 class CharacterEncoder:
     """
     An encoder for characters leveraging language fonts, MouseText and/or
     custom characters.
+
+    Text is split into runs which can be printed in every language, and
+    characters which can't - alternate language characters, the characters
+    they displace, MouseText and custom characters. Modes are then planned
+    for the whole call so that as few bytes as possible are spent switching
+    between them. With a lookahead, plans only look that many segments ahead,
+    which bounds the time spent planning long streams.
+
+    By default, the encoder returns to its default language at the end of
+    each call. Encoders which don't restore the language keep it between
+    calls, which saves switching back and forth when calls are made for each
+    fragment of a stream.
     """
 
     def __init__(
@@ -145,79 +327,192 @@ class CharacterEncoder:
         language: Language = Language.AMERICAN,
         map_mousetext: bool = True,
         map_custom: bool = True,
+        restore_language: bool = True,
+        lookahead: Optional[int] = None,
     ) -> None:
         default_mode: LanguageMode = LanguageMode(language)
 
         self.default_mode: LanguageMode = default_mode
         self.map_mousetext: bool = map_mousetext
         self.map_custom: bool = map_custom
+        self.restore_language: bool = restore_language
+        self.lookahead: Optional[int] = lookahead
 
         self.language_mode: LanguageMode = default_mode
         self.mode: Mode = default_mode
 
-    def _next_mode(self: Self, character: Character) -> Mode:
-        if isinstance(character, MouseTextCharacter):
-            return MouseTextMode(map=self.map_mousetext)
+        self._mousetext_mode: MouseTextMode = MouseTextMode(map=map_mousetext)
+        self._custom_mode: CustomCharacterMode = CustomCharacterMode(map=map_custom)
 
-        if isinstance(character, CustomCharacter):
-            return CustomCharacterMode(map=self.map_custom)
-
-        supported: List[LanguageMode] = LANGUAGE_MODES.get(
-            character, [self.language_mode]
+    def _set_mode(self: Self, mode: Mode) -> List[Command]:
+        encoded, (self.mode, self.language_mode) = transition(
+            (self.mode, self.language_mode), mode
         )
 
-        if self.language_mode.language in supported:
-            return self.language_mode
-        else:
-            return supported[0]
+        return encoded
+
+    def _switch(
+        self: Self, mode: Mode, encoded: List[Command], buffer: bytearray
+    ) -> None:
+        """
+        Switch modes, flushing any buffered text encoded in the prior mode.
+        """
 
-    def _set_mode(self: Self, mode: Mode) -> List[Command]:
         if mode == self.mode:
-            return []
+            return
 
-        # Disable the current mode and enable the new mode
-        encoded: List[Command] = self.mode.disable() + mode.enable()
+        if buffer:
+            encoded.append(Bytes(bytes(buffer)))
+            buffer.clear()
 
-        # Save the newest language mode
-        if isinstance(mode, LanguageMode):
-            self.language_mode = mode
+        encoded += self._set_mode(mode)
 
-        self.mode = mode
+    def _split_str(self: Self, text: str, segments: "_Segments") -> None:
+        pos: int = 0
 
-        return encoded
+        for match in RESTRICTED_CHARACTERS.finditer(text):
+            if match.start() > pos:
+                segments.append(text[pos : match.start()], ALL_LANGUAGES)
+
+            restricted: str = match.group()
+
+            if restricted in MOUSETEXT_CHARACTERS:
+                segments.append(MOUSETEXT_CHARACTERS[restricted], ALL_LANGUAGES)
+            else:
+                segments.append(restricted, printable_languages(restricted))
+
+            pos = match.end()
+
+        if pos < len(text):
+            segments.append(text[pos:], ALL_LANGUAGES)
+
+    def _split(
+        self: Self, text: Sequence[Text]
+    ) -> Tuple[List[Segment], List[FrozenSet[Language]]]:
+        """
+        Split text into segments, along with the languages each segment can be
+        printed in.
+        """
+
+        segments: _Segments = _Segments()
+
+        for tx in text:
+            characters: Sequence[Character] = tx if isinstance(tx, list) else [tx]
+
+            for ch in characters:
+                if isinstance(ch, str):
+                    self._split_str(ch, segments)
+                else:
+                    segments.append(ch, ALL_LANGUAGES)
+
+        return segments.close()
+
+    def _plan(
+        self: Self, segments: List[Segment], languages: List[FrozenSet[Language]]
+    ) -> List[Mode]:
+        # Only the current language, the default language and languages some
+        # character needs are worth switching to. Candidates are tried in
+        # order, so staying in the current language is preferred.
+        needed: FrozenSet[Language] = frozenset().union(
+            *(printable for printable in languages if printable != ALL_LANGUAGES)
+        )
+        candidates: List[LanguageMode] = list(
+            dict.fromkeys(
+                [self.language_mode, self.default_mode]
+                + [LanguageMode(lang) for lang in Language if lang in needed]
+            )
+        )
+
+        # Modes are planned by their index, which is much cheaper to hash
+        modes: List[Mode] = list(
+            dict.fromkeys(
+                [self.mode] + candidates + [self._mousetext_mode, self._custom_mode]
+            )
+        )
+        index: Dict[Mode, int] = {mode: i for i, mode in enumerate(modes)}
+        costs: Dict[Tuple[Tuple[int, int], int], Tuple[int, Tuple[int, int]]] = dict()
+
+        def cost(state: Tuple[int, int], choice: int) -> Tuple[int, Tuple[int, int]]:
+            if (state, choice) not in costs:
+                price, (mode, language) = transition_cost(
+                    (modes[state[0]], cast(LanguageMode, modes[state[1]])),
+                    modes[choice],
+                )
+                costs[(state, choice)] = (price, (index[mode], index[language]))
+
+            return costs[(state, choice)]
+
+        def finish(state: Tuple[int, int]) -> int:
+            language: int = (
+                index[self.default_mode] if self.restore_language else state[1]
+            )
+            return cost(state, language)[0]
+
+        # Segments printable in the same languages share the same choices
+        choices: Dict[FrozenSet[Language], Tuple[int, ...]] = {
+            printable: tuple(
+                index[mode] for mode in candidates if mode.language in printable
+            )
+            for printable in set(languages)
+        }
+        mousetext: Tuple[int, ...] = (index[self._mousetext_mode],)
+        custom: Tuple[int, ...] = (index[self._custom_mode],)
+
+        planned: List[int] = plan(
+            (index[self.mode], index[self.language_mode]),
+            [
+                (
+                    mousetext
+                    if isinstance(segment, MouseTextCharacter)
+                    else (
+                        custom
+                        if isinstance(segment, CustomCharacter)
+                        else choices[printable]
+                    )
+                )
+                for segment, printable in zip(segments, languages)
+            ],
+            cost,
+            finish,
+            self.lookahead,
+        )
+
+        return [modes[i] for i in planned]
 
     def encode(self: Self, *text: Text) -> List[Command]:
         encoded: List[Command] = list()
-        mode: Mode = self.language_mode
-        buffer: bytes = b""
-
-        for ch in extract_characters(*text):
-            # Get the new mode
-            mode = self._next_mode(ch)
-
-            # If the mode is changing, add the buffer to the encoded output
-            if mode != self.mode:
-                encoded.append(Bytes(buffer))
-                buffer = b""
-
-            # Set the new mode
-            encoded += self._set_mode(mode)
-
-            # Add the new text to the buffer
-            if isinstance(ch, str):
-                # Recall that we already extracted MouseText characters
-                buffer += bytes(ch, encoding="ascii")
-            elif isinstance(ch, MouseTextCharacter):
-                buffer += bytes([ch.value])
+        buffer: bytearray = bytearray()
+
+        segments, languages = self._split(text)
+        modes: List[Mode] = self._plan(segments, languages)
+
+        for segment, mode in zip(segments, modes):
+            self._switch(mode, encoded, buffer)
+
+            if isinstance(segment, str):
+                table: Dict[int, str] = LANGUAGE_TABLES[self.language_mode.language]
+                buffer += segment.translate(table).encode(encoding="ascii")
+            elif isinstance(segment, MouseTextCharacter):
+                buffer.append(segment.value)
             else:
-                buffer += bytes([ch.point])
+                buffer.append(segment.point)
 
         # Attach the final buffer
-        encoded.append(Bytes(buffer))
-        encoded += self.mode.disable()
+        if buffer:
+            encoded.append(Bytes(bytes(buffer)))
 
-        # Enable the default language if need be
-        if self.language_mode != self.default_mode:
-            encoded += self.default_mode.enable()
+        # Leave any special mode, and return to the default language if need
+        # be
+        encoded += self._set_mode(
+            self.default_mode if self.restore_language else self.language_mode
+        )
 
         return encoded
+
+    def encode_into(self: Self, buffer: CommandBuffer, *text: Text) -> CommandBuffer:
+        """
+        Encode text onto the end of a command buffer.
+        """
+
+        buffer.extend(self.encode(*text))
+        return buffer
@@ -0,0 +1,135 @@
+"""
+Cache encoded text.
+
+Forms print the same headers, footers and field labels over and over. An
+`EncoderCache` sits in front of a `CharacterEncoder` and remembers what each
+piece of text encoded to, along with the mode the encoder was left in, so
+that repeated text is encoded once and the encoder's state stays correct.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, List, Optional, Self, Tuple
+
+from imagewriter.encoding.base import Command
+from imagewriter.encoding.buffer import CommandBuffer
+from imagewriter.encoding.character import (
+    CharacterEncoder,
+    LanguageMode,
+    Mode,
+    Text,
+)
+from imagewriter.encoding.character.custom import CustomCharacter
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    """
+    Text as encoded, along with the modes the encoder was left in.
+    """
+
+    commands: Tuple[Command, ...]
+    language_mode: LanguageMode
+    mode: Mode
+
+    @property
+    def bytes(self: Self) -> bytes:
+        return b"".join(bytes(command) for command in self.commands)
+
+
+def _text_key(text: Text) -> Hashable:
+    if isinstance(text, str):
+        return text
+
+    if isinstance(text, CustomCharacter):
+        return ("custom", text.point)
+
+    if isinstance(text, list):
+        return tuple(_text_key(ch) for ch in text)
+
+    return text
+
+
+class EncoderCache:
+    """
+    A least recently used cache of encoded text, in front of a character
+    encoder.
+
+    Entries are keyed by the text, the encoder's settings and the modes it's
+    in - so an entry is only reused when encoding would have produced the
+    same commands.
+    """
+
+    def __init__(self: Self, encoder: CharacterEncoder, capacity: int = 1024) -> None:
+        if capacity < 1:
+            raise ValueError("Cache capacity must be at least 1")
+
+        self.encoder: CharacterEncoder = encoder
+        self.capacity: int = capacity
+        self.hits: int = 0
+        self.misses: int = 0
+        self._entries: OrderedDict[Hashable, CacheEntry] = OrderedDict()
+
+    def __len__(self: Self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self: Self) -> float:
+        lookups: int = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _key(self: Self, text: Tuple[Text, ...]) -> Hashable:
+        encoder: CharacterEncoder = self.encoder
+
+        return (
+            tuple(_text_key(tx) for tx in text),
+            encoder.default_mode,
+            encoder.map_mousetext,
+            encoder.map_custom,
+            encoder.restore_language,
+            encoder.lookahead,
+            encoder.language_mode,
+            encoder.mode,
+        )
+
+    def encode(self: Self, *text: Text) -> List[Command]:
+        """
+        Encode text, reusing a cached encoding where there is one.
+        """
+
+        key: Hashable = self._key(text)
+        entry: Optional[CacheEntry] = self._entries.get(key)
+
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        else:
+            self.misses += 1
+            commands: List[Command] = self.encoder.encode(*text)
+            entry = CacheEntry(
+                commands=tuple(commands),
+                language_mode=self.encoder.language_mode,
+                mode=self.encoder.mode,
+            )
+            self._entries[key] = entry
+
+            if len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+        self.encoder.language_mode = entry.language_mode
+        self.encoder.mode = entry.mode
+
+        return list(entry.commands)
+
+    def encode_into(self: Self, buffer: CommandBuffer, *text: Text) -> CommandBuffer:
+        """
+        Encode text onto the end of a command buffer.
+        """
+
+        buffer.extend(self.encode(*text))
+        return buffer
+
+    def clear(self: Self) -> None:
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,209 @@
+"""
+Keep track of which custom characters are loaded into the printer.
+
+Loading custom characters is slow at 9600 baud, and takes up printer memory.
+A `GlyphCache` shadows the printer's custom character slots, keyed by each
+glyph's content, so that jobs which print the same logos and symbols again
+only load the glyphs which aren't already there. When the slots are full,
+the least recently used glyphs are replaced.
+
+Custom characters are cleared when the printer is reset or the maximum
+character width is changed, so the cache has to see those commands - either
+by sending them through the cache, or by passing the job to `observe`.
+"""
+
+from collections import OrderedDict
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Literal,
+    Optional,
+    Self,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from imagewriter.encoding.base import Command
+from imagewriter.encoding.character.custom import CharacterData, CustomCharacter
+from imagewriter.encoding.parser import Parser
+from imagewriter.encoding.reset import RESET
+
+# The number of custom characters the printer holds at each width. These are
+# assumed from the size of its custom character memory, and may be disproven
+# with experimentation.
+MAX_CHARACTERS: Dict[int, int] = {8: 95, 16: 47}
+
+# Code points handed out to glyphs, in order. High ASCII is used first, so
+# that custom characters don't shadow printable text.
+POINTS: List[int] = list(range(160, 240)) + list(range(33, 127))
+
+Width = Literal[8] | Literal[16]
+
+# Commands which set the maximum character width, clearing custom characters
+WIDTHS: Dict[bytes, Width] = {
+    CustomCharacter.set_max_width(8): 8,
+    CustomCharacter.set_max_width(16): 16,
+}
+
+# A glyph's content - its column data, and whether it's printed on the top
+# wires
+Glyph = Tuple[bytes, bool]
+
+
+class GlyphCache:
+    """
+    A host-side shadow of the printer's custom characters.
+
+    Glyphs are requested with `glyph`, which returns the custom character
+    they print as. `load` then returns the command which loads any glyphs
+    which aren't resident. Glyphs requested since the last load are never
+    evicted to make room for each other, so every glyph a job uses is
+    resident once its load is sent.
+    """
+
+    def __init__(
+        self: Self,
+        width: Width = 8,
+        points: Optional[Sequence[int]] = None,
+    ) -> None:
+        self.points: List[int] = list(POINTS if points is None else points)
+        self.width: Width = width
+        self.hits: int = 0
+        self.misses: int = 0
+
+        # Resident glyphs and their code points, least recently used first
+        self._resident: OrderedDict[Glyph, int] = OrderedDict()
+        # Glyphs requested since the last load, which aren't resident yet
+        self._pending: Dict[Glyph, int] = dict()
+        # Glyphs requested since the last load, which can't be evicted
+        self._pinned: Set[Glyph] = set()
+        # Parses observed commands, holding back any which are split between
+        # calls to observe
+        self._parser: Parser = Parser()
+
+    @property
+    def capacity(self: Self) -> int:
+        return min(len(self.points), MAX_CHARACTERS[self.width])
+
+    def __len__(self: Self) -> int:
+        return len(self._resident) + len(self._pending)
+
+    def __contains__(self: Self, glyph: Glyph) -> bool:
+        return glyph in self._resident
+
+    def invalidate(self: Self) -> None:
+        """
+        Forget every resident glyph.
+        """
+
+        self._resident.clear()
+        self._pending.clear()
+        self._pinned.clear()
+
+    def reset(self: Self) -> None:
+        """
+        Track a printer reset, which clears custom characters and returns the
+        maximum width to 8 dots.
+        """
+
+        self.invalidate()
+        self.width = 8
+
+    def set_max_width(self: Self, width: Width) -> bytes:
+        """
+        Set the maximum width for custom characters, as per page 85 of the
+        ImageWriter II Technical Reference Manual. This clears the printer's
+        custom characters.
+        """
+
+        encoded: bytes = CustomCharacter.set_max_width(width)
+        self.invalidate()
+        self.width = width
+
+        return encoded
+
+    def observe(self: Self, commands: Iterable[Command | bytes]) -> None:
+        """
+        Watch commands sent to the printer for resets and width changes.
+        Commands may be split across calls.
+        """
+
+        for command in commands:
+            buffer, spans = self._parser.split(bytes(command))
+
+            for start, end in spans:
+                code: bytes = buffer[start:end]
+
+                if code == bytes(RESET):
+                    self.reset()
+                elif code in WIDTHS:
+                    self.set_max_width(WIDTHS[code])
+
+    def _free_point(self: Self) -> int:
+        if len(self) < self.capacity:
+            used: Set[int] = set(self._resident.values())
+            used.update(self._pending.values())
+
+            for point in self.points:
+                if point not in used:
+                    return point
+
+        # Evict the least recently used glyph which isn't needed by this load
+        for glyph, point in self._resident.items():
+            if glyph not in self._pinned:
+                del self._resident[glyph]
+                return point
+
+        raise ValueError(
+            f"More than {self.capacity} custom characters are needed at once"
+        )
+
+    def glyph(self: Self, data: bytes, top_wires: bool = True) -> CustomCharacter:
+        """
+        Get the custom character a glyph prints as, assigning it a code point
+        if it isn't resident.
+        """
+
+        if not 1 <= len(data) <= self.width:
+            raise ValueError(
+                f"Glyphs must be from 1 to {self.width} columns wide, "
+                f"got {len(data)}"
+            )
+
+        glyph: Glyph = (bytes(data), top_wires)
+
+        if glyph in self._resident:
+            self.hits += 1
+            self._resident.move_to_end(glyph)
+            point: int = self._resident[glyph]
+        elif glyph in self._pending:
+            self.hits += 1
+            point = self._pending[glyph]
+        else:
+            self.misses += 1
+            point = self._free_point()
+            self._pending[glyph] = point
+
+        self._pinned.add(glyph)
+
+        return CustomCharacter(point)
+
+    def load(self: Self) -> bytes:
+        """
+        Load the glyphs requested since the last load which aren't resident,
+        as per page 96 of the ImageWriter II Technical Reference Manual.
+        Returns no bytes if there's nothing to load.
+        """
+
+        characters: List[CharacterData] = [
+            (CustomCharacter(point), data, top_wires)
+            for (data, top_wires), point in self._pending.items()
+        ]
+
+        self._resident.update(self._pending)
+        self._pending.clear()
+        self._pinned.clear()
+
+        return CustomCharacter.load(characters) if characters else b""
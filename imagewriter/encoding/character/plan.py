@@ -0,0 +1,127 @@
+"""
+Plan mode changes for a run of text.
+
+Switching languages takes two software switch commands, and MouseText and
+custom characters are printed in their own modes. Choosing the mode for each
+piece of text greedily, one character at a time, can flip switches back and
+forth; a plan looks at the whole run and picks the modes which send the
+fewest bytes.
+
+Plans are found with dynamic programming. Text is split into segments, each
+of which may be printed in any of a few modes. Moving from one state to the
+next costs some number of bytes, and the cheapest path through the segments
+is kept for each state the printer could be left in.
+
+For streams, planning can be limited to a window of segments. Half of each
+window's plan is kept before planning the next window, so decisions are
+never made without some lookahead.
+"""
+
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple, TypeVar
+
+State = TypeVar("State", bound=Hashable)
+Choice = TypeVar("Choice")
+
+# The cost, in bytes, of making a choice from a state, and the state it leaves
+# the printer in
+Transition = Callable[[State, Choice], Tuple[int, State]]
+
+# The cost of finishing in a state
+Final = Callable[[State], int]
+
+# The cost of a choice, the state it leads to and the choice itself
+Option = Tuple[int, State, Choice]
+
+
+def _free(state: Hashable) -> int:
+    return 0
+
+
+def _plan_window(
+    start: State,
+    segments: Sequence[Tuple[Choice, ...]],
+    transition: Transition[State, Choice],
+    final: Final[State],
+) -> List[Choice]:
+    # Choices from each state, cheapest first
+    options: Dict[Tuple[State, Tuple[Choice, ...]], List[Option]] = dict()
+    # The cheapest cost of reaching each state
+    costs: Dict[State, int] = {start: 0}
+    # For each segment, the state and choice which reached each state
+    steps: List[Dict[State, Tuple[State, Choice]]] = list()
+
+    for choices in segments:
+        reached: Dict[State, int] = dict()
+        step: Dict[State, Tuple[State, Choice]] = dict()
+
+        for state, cost in costs.items():
+            # Cheaper choices are tried first, and ties go to whichever state
+            # was reached first, so that plans put off switching modes
+            key: Tuple[State, Tuple[Choice, ...]] = (state, choices)
+
+            if key not in options:
+                options[key] = sorted(
+                    (transition(state, choice) + (choice,) for choice in choices),
+                    key=lambda option: option[0],
+                )
+
+            for price, after, choice in options[key]:
+                total: int = cost + price
+
+                if after not in reached or total < reached[after]:
+                    reached[after] = total
+                    step[after] = (state, choice)
+
+        costs = reached
+        steps.append(step)
+
+    end: State = min(costs, key=lambda state: costs[state] + final(state))
+    plan: List[Choice] = list()
+
+    for step in reversed(steps):
+        end, choice = step[end]
+        plan.append(choice)
+
+    plan.reverse()
+
+    return plan
+
+
+def plan(
+    start: State,
+    segments: Sequence[Tuple[Choice, ...]],
+    transition: Transition[State, Choice],
+    final: Final[State],
+    lookahead: Optional[int] = None,
+) -> List[Choice]:
+    """
+    Choose one of the choices for each segment, such that the total cost of
+    the transitions - and of finishing in the final state - is the lowest.
+
+    With a lookahead, each choice is made looking no more than that many
+    segments ahead.
+    """
+
+    if lookahead is None or len(segments) <= lookahead:
+        return _plan_window(start, segments, transition, final)
+
+    if lookahead < 1:
+        raise ValueError("Lookahead must be at least 1 segment")
+
+    commit: int = max(lookahead // 2, 1)
+    planned: List[Choice] = list()
+    state: State = start
+    pos: int = 0
+
+    while pos + lookahead < len(segments):
+        window: List[Choice] = _plan_window(
+            state, segments[pos : pos + lookahead], transition, _free
+        )
+
+        for choice in window[:commit]:
+            _, state = transition(state, choice)
+            planned.append(choice)
+
+        pos += commit
+
+    return planned + _plan_window(state, segments[pos:], transition, final)
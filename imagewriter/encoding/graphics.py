@@ -1,40 +1,166 @@
-from typing import Self
+import re
+from typing import Generator, List, Self, Tuple
 
 from imagewriter.encoding.base import Command, esc, number
 from imagewriter.encoding.motion import LineFeed
 from imagewriter.units import Point
 
+# The longest run a single repeat command can print
+MAX_RUN = 9999
+
+# The size of a repeat command - ESC V nnnn c
+REPEAT_LENGTH = 7
+
+# A run in the middle of literal data costs a repeat command, plus another
+# header for the data following it. Shorter runs are cheaper to send
+# literally.
+MIN_RUN = REPEAT_LENGTH + 7
+
+RUN = re.compile(rb"(.)\1{%d,}" % (MIN_RUN - 1), re.DOTALL)
+
+# A span of graphics data, as a start offset, an end offset and whether the
+# span is a run of a single repeated byte
+Segment = Tuple[int, int, bool]
+
+
+def graphics_header(length: int) -> bytes:
+    """
+    The header for a number of bytes of literal graphics data, as per page 105
+    of the ImageWriter II Technical Reference Manual.
+    """
+
+    if length % 8 == 0:
+        return esc("g") + number(length // 8, 3)
+    else:
+        return esc("G") + number(length, 4)
+
+
+def repeat_graphics_byte(byte: int, n: int) -> bytes:
+    """
+    Repeat a graphics byte n times, with ESC V. See the ImageWriter II
+    Technical Reference Manual for more details.
+    """
+
+    return esc("V") + number(n, 4) + bytes([byte])
+
+
+def runs(data: bytes) -> Generator[Tuple[int, int], None, None]:
+    """
+    Find runs of a repeated byte long enough to be worth compressing, as
+    start and end offsets.
+    """
+
+    for match in RUN.finditer(data):
+        start, end = match.span()
+
+        while end - start > MAX_RUN:
+            yield (start, start + MAX_RUN)
+            start += MAX_RUN
+
+        if end - start >= MIN_RUN:
+            yield (start, end)
+
+
+def segments(data: bytes) -> Generator[Segment, None, None]:
+    """
+    Split graphics data into literal spans and runs of a repeated byte.
+    """
+
+    pos: int = 0
+
+    for start, end in runs(data):
+        if start > pos:
+            yield (pos, start, False)
+        yield (start, end, True)
+        pos = end
+
+    if pos < len(data):
+        yield (pos, len(data), False)
+
 
 class PrintGraphicsData(Command):
     """
     Print graphics data, as per page 105 of the ImageWriter II Technical
     Reference Manual.
+
+    When compressed, runs of a repeated byte are sent with the repeat graphics
+    byte command, and only the remaining spans are sent literally. This
+    saves a lot of bytes on solid and blank areas.
     """
 
-    def __init__(self: Self, data: bytes) -> None:
+    def __init__(self: Self, data: bytes, compress: bool = False) -> None:
         self._data: bytes = data
+        self._segments: List[Segment] = (
+            list(segments(data)) if compress else [(0, len(data), False)]
+        )
 
-    def __bytes__(self: Self) -> bytes:
-        length: int = len(self._data)
-        encoded: bytes = b""
+    @property
+    def data(self: Self) -> bytes:
+        return self._data
+
+    @property
+    def segments(self: Self) -> List[Segment]:
+        """
+        The spans the data is sent in - literally, or as runs of a repeated
+        byte.
+        """
+
+        return self._segments
+
+    @property
+    def compression_ratio(self: Self) -> float:
+        """
+        The ratio of the size of the data when sent literally to its encoded
+        size.
+        """
+
+        encoded: int = len(self)
 
-        if length % 8 == 0:
-            encoded = esc("g") + number(length // 8, 3)
-        else:
-            encoded = esc("G") + number(length, 4)
+        if not encoded:
+            return 1.0
 
-        encoded += self._data
+        return (len(graphics_header(len(self._data))) + len(self._data)) / encoded
+
+    def header(self: Self) -> bytes:
+        return graphics_header(len(self._data))
+
+    def _encode(self: Self) -> Generator[bytes, None, None]:
+        for start, end, repeated in self._segments:
+            if repeated:
+                yield repeat_graphics_byte(self._data[start], end - start)
+            elif start == 0 and end == len(self._data):
+                yield graphics_header(end - start)
+                yield self._data
+            else:
+                yield graphics_header(end - start)
+                yield self._data[start:end]
+
+    def __len__(self: Self) -> int:
+        return sum(
+            (
+                REPEAT_LENGTH
+                if repeated
+                else len(graphics_header(end - start)) + end - start
+            )
+            for start, end, repeated in self._segments
+        )
+
+    def __bytes__(self: Self) -> bytes:
+        return b"".join(self._encode())
 
-        return encoded
+    def encode_into(self: Self, buffer: bytearray) -> None:
+        for encoded in self._encode():
+            buffer += encoded
 
 
 def set_graphics_distance_between_lines() -> Command:
     """
     Set the distance between lines such that two adjacent graphics lines are
-    flush with each other, given the pitch.
+    flush with each other. Graphics lines are 8 dots tall at 72 dpi,
+    regardless of pitch.
 
     See page 112 of the ImageWriter II Technical Reference Manual for more
     details.
     """
 
-    return LineFeed.set_distance_between_lines(Point(1))
+    return LineFeed.set_distance_between_lines(Point(8))
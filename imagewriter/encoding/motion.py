@@ -72,7 +72,7 @@ class TabStops:
         encoded: bytes = b""
 
         for stop in tab_stops:
-            encoded += bytes(f"{number(stop, 3)},", encoding="ascii")
+            encoded += number(stop, 3) + b","
 
         encoded = encoded[:-1] + b"."
 
@@ -160,7 +160,7 @@ class PlaceExactPrintHeadPosition(Command):
 
     @property
     def position(self: Self) -> int:
-        pos: int = length_to_int(self.position, lambda p: p.horizontal_dpi(self.pitch))
+        pos: int = length_to_int(self._position, lambda p: p.horizontal_dpi(self.pitch))
 
         return min(pos, self.pitch.width)
 
@@ -0,0 +1,265 @@
+"""
+A peephole optimizer for command streams.
+
+Generated documents tend to be full of commands which cancel each other out -
+attributes switched on and straight back off, MouseText disabled at the end
+of one `CharacterEncoder.encode` call and re-enabled at the start of the
+next, and software switches set and reset. At 9600 baud, every byte avoided
+saves time, so `optimize` rewrites a command stream into fewer bytes with
+the same printed output.
+
+The optimizer is conservative. It only understands the commands this package
+generates; raw `Bytes` containing control codes are assumed to change
+attributes and modes in unknown ways.
+"""
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from imagewriter.encoding.attributes import (
+    START_BOLDFACE,
+    START_DOUBLE_WIDTH,
+    START_HALF_HEIGHT,
+    START_SUBSCRIPT,
+    START_SUPERSCRIPT,
+    START_UNDERLINE,
+    STOP_BOLDFACE,
+    STOP_DOUBLE_WIDTH,
+    STOP_HALF_HEIGHT,
+    STOP_SUBSCRIPT,
+    STOP_SUPERSCRIPT,
+    STOP_UNDERLINE,
+)
+from imagewriter.encoding.base import Bytes, Command, Ctrl, ESC, Esc
+from imagewriter.encoding.character import DISABLE_MODE
+from imagewriter.encoding.reset import RESET
+from imagewriter.encoding.switch import (
+    CloseSoftwareSwitches,
+    OpenSoftwareSwitches,
+    SetSoftwareSwitches,
+)
+from imagewriter.switch import SoftwareSwitch
+
+# Codes which switch an attribute on, and the codes which switch it back off.
+# Superscript and subscript share a stop code.
+TOGGLES: Dict[bytes, bytes] = {
+    bytes(START_DOUBLE_WIDTH): bytes(STOP_DOUBLE_WIDTH),
+    bytes(START_UNDERLINE): bytes(STOP_UNDERLINE),
+    bytes(START_BOLDFACE): bytes(STOP_BOLDFACE),
+    bytes(START_HALF_HEIGHT): bytes(STOP_HALF_HEIGHT),
+    bytes(START_SUPERSCRIPT): bytes(STOP_SUPERSCRIPT),
+    bytes(START_SUBSCRIPT): bytes(STOP_SUBSCRIPT),
+}
+
+TOGGLE_CODES: Set[bytes] = set(TOGGLES) | set(TOGGLES.values())
+
+# Codes which enable MouseText and custom character modes. See
+# imagewriter.encoding.character.
+MODE_CODES: Set[bytes] = {bytes(Esc("&")), bytes(Esc("*")), bytes(Esc("'"))}
+
+# Bytes which may change attributes or modes when sent raw
+CONTROL_BYTES: bytes = ESC + bytes(Ctrl("N")) + bytes(Ctrl("O"))
+
+
+def _code(command: Command) -> Optional[bytes]:
+    """
+    The code sent by a single escape code or control character command.
+    """
+
+    if isinstance(command, (Esc, Ctrl)):
+        return bytes(command)
+    return None
+
+
+def _opaque(command: Command) -> bool:
+    """
+    Whether a command is raw data which may contain control codes.
+    """
+
+    return isinstance(command, Bytes) and any(
+        byte in CONTROL_BYTES for byte in command.bytes
+    )
+
+
+def merge_bytes(commands: Iterable[Command]) -> List[Command]:
+    """
+    Drop empty commands, such as NULL, and merge adjacent Bytes.
+    """
+
+    optimized: List[Command] = list()
+    run: List[bytes] = list()
+
+    def flush() -> None:
+        if len(run) == 1:
+            optimized.append(Bytes(run[0]))
+        elif run:
+            optimized.append(Bytes(b"".join(run)))
+        run.clear()
+
+    for command in commands:
+        if isinstance(command, Bytes):
+            if command.bytes:
+                run.append(command.bytes)
+        elif len(command):
+            flush()
+            optimized.append(command)
+
+    flush()
+
+    return optimized
+
+
+def cancel_toggles(commands: Iterable[Command]) -> List[Command]:
+    """
+    Cancel attributes which are switched on and back off without anything
+    being printed in between, and drop stop codes for attributes which are
+    already off.
+
+    A cancelled pair is replaced with its stop code, as the attribute may
+    have been on beforehand.
+    """
+
+    optimized: List[Command] = list()
+    # Stop codes for attributes known to be off
+    off: Set[bytes] = set()
+    # Whether each attribute was known to be off before it was last started
+    was_off: Dict[bytes, bool] = dict()
+
+    for command in commands:
+        code: Optional[bytes] = _code(command)
+
+        if code in TOGGLES:
+            stop: bytes = TOGGLES[code]
+            was_off[stop] = stop in off
+            off.discard(stop)
+        elif code in TOGGLE_CODES:
+            # Look back past other attributes for this attribute's start
+            for i in range(len(optimized) - 1, -1, -1):
+                prior: Optional[bytes] = _code(optimized[i])
+
+                if prior not in TOGGLE_CODES:
+                    break
+
+                if prior == code or TOGGLES.get(prior) == code:
+                    if prior != code:
+                        del optimized[i]
+                        if was_off.get(code):
+                            off.add(code)
+                    break
+
+            if code in off:
+                continue
+
+            off.add(code)
+        elif _opaque(command):
+            off.clear()
+
+        optimized.append(command)
+
+    return optimized
+
+
+def cancel_mode_flips(commands: Iterable[Command]) -> List[Command]:
+    """
+    Remove MouseText or custom character modes which are disabled and
+    immediately re-enabled, such as between calls to
+    `CharacterEncoder.encode`.
+    """
+
+    optimized: List[Command] = list()
+    # The code which enabled the current mode, if any
+    mode: Optional[bytes] = None
+    # The index of the last disable command, and the mode it disabled
+    disabled: Optional[Tuple[int, bytes]] = None
+
+    for command in commands:
+        code: Optional[bytes] = _code(command)
+
+        if code == bytes(DISABLE_MODE):
+            disabled = (len(optimized), mode) if mode else None
+            mode = None
+        elif code in MODE_CODES:
+            if disabled and disabled[1] == code:
+                del optimized[disabled[0]]
+                mode = code
+                disabled = None
+                continue
+
+            mode = code
+            disabled = None
+        elif code in TOGGLE_CODES or isinstance(command, SetSoftwareSwitches):
+            # Attributes and switches, such as the language the encoder
+            # restores after each call, don't affect character modes
+            pass
+        else:
+            disabled = None
+
+            if code == bytes(RESET) or _opaque(command):
+                mode = None
+
+        optimized.append(command)
+
+    return optimized
+
+
+def fold_switches(commands: Iterable[Command]) -> List[Command]:
+    """
+    Fold consecutive software switch commands into at most one command which
+    opens switches and one which closes them.
+    """
+
+    optimized: List[Command] = list()
+    run: List[SetSoftwareSwitches] = list()
+
+    def flush() -> None:
+        if len(run) == 1 and run[0].switches:
+            optimized.append(run[0])
+        elif run:
+            # The last command to set a switch wins
+            closed: Dict[SoftwareSwitch, bool] = dict()
+
+            for cmd in run:
+                for switch in cmd.switches:
+                    closed[switch] = cmd.closed
+
+            to_open = {switch for switch, c in closed.items() if not c}
+            to_close = {switch for switch, c in closed.items() if c}
+
+            if to_open:
+                optimized.append(OpenSoftwareSwitches(to_open))
+            if to_close:
+                optimized.append(CloseSoftwareSwitches(to_close))
+
+        run.clear()
+
+    for command in commands:
+        if isinstance(command, SetSoftwareSwitches):
+            run.append(command)
+        else:
+            flush()
+            optimized.append(command)
+
+    flush()
+
+    return optimized
+
+
+PASSES = [cancel_toggles, cancel_mode_flips, fold_switches, merge_bytes]
+
+
+def optimize(commands: Iterable[Command]) -> List[Command]:
+    """
+    Rewrite commands into fewer bytes, with the same printed output. Passes
+    are repeated until they stop finding anything to remove, as one pass can
+    expose opportunities for another.
+    """
+
+    optimized: List[Command] = merge_bytes(commands)
+
+    while True:
+        count: int = len(optimized)
+
+        for rewrite in PASSES:
+            optimized = rewrite(optimized)
+
+        if len(optimized) == count:
+            return optimized
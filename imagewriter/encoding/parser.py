@@ -0,0 +1,325 @@
+"""
+Parse raw ImageWriter II byte streams back into commands.
+
+Jobs which arrive pre-rendered - from CUPS, or from old Apple II software -
+are split into whole commands, so that they can be optimized, accounted for
+and checkpointed like jobs encoded by this package.
+
+Escape codes are described by a table of their arguments. Most take a fixed
+number of bytes, some are followed by a count and that much data, and a few
+run up to a terminator. Runs of text between control characters are found
+with a regular expression, so text-heavy streams are split in large chunks.
+
+Parsing is incremental. Data may be fed in chunks split at any point, and
+an incomplete command at the end of a chunk is held back until the rest of
+it arrives.
+"""
+
+from dataclasses import dataclass
+import re
+from typing import Dict, List, Optional, Self, Tuple
+
+from imagewriter.encoding.base import Bytes, Command, Ctrl, ESC, Esc
+from imagewriter.encoding.buffer import CommandBuffer
+from imagewriter.encoding.graphics import PrintGraphicsData
+
+
+@dataclass(frozen=True)
+class Fixed:
+    """
+    A fixed number of argument bytes.
+    """
+
+    size: int
+
+
+@dataclass(frozen=True)
+class Counted:
+    """
+    A decimal count of some number of digits, followed by count * scale
+    bytes of data and then a fixed number of extra bytes.
+    """
+
+    digits: int
+    scale: int = 1
+    extra: int = 0
+
+
+@dataclass(frozen=True)
+class Terminated:
+    """
+    Arguments running up to and including a terminator.
+    """
+
+    terminator: bytes
+
+
+@dataclass(frozen=True)
+class OptionalDigit:
+    """
+    An optional single digit argument.
+    """
+
+
+@dataclass(frozen=True)
+class CustomCharacters:
+    """
+    Custom character data - each character a code point and a width from A
+    to P (or a to p), followed by that many bytes of data - up to a ^D. See
+    page 96 of the ImageWriter II Technical Reference Manual.
+    """
+
+
+Arguments = Fixed | Counted | Terminated | OptionalDigit | CustomCharacters
+
+# Arguments taken by escape codes. Codes not in the table take none.
+ESCAPE_ARGUMENTS: Dict[int, Arguments] = {
+    ord("a"): Fixed(1),
+    ord("D"): Fixed(2),
+    ord("Z"): Fixed(2),
+    ord("F"): Fixed(4),
+    ord("H"): Fixed(4),
+    ord("K"): Fixed(1),
+    ord("L"): Fixed(3),
+    ord("T"): Fixed(2),
+    ord("U"): Fixed(3),
+    ord("l"): Fixed(1),
+    ord("R"): Fixed(4),
+    ord("G"): Counted(4),
+    ord("g"): Counted(3, scale=8),
+    ord("V"): Counted(4, scale=0, extra=1),
+    ord("("): Terminated(b"."),
+    ord(")"): Terminated(b"."),
+    # Set spacing takes a digit, while Scribe mode Correspondence doesn't
+    ord("m"): OptionalDigit(),
+    ord("I"): CustomCharacters(),
+}
+
+# Arguments taken by control characters. Control characters not in the table
+# take none.
+CONTROL_ARGUMENTS: Dict[int, Arguments] = {
+    # Feed n lines
+    0x1F: Fixed(1),
+}
+
+ESCAPE = ESC[0]
+EOT = 0x04
+
+# Bytes which interrupt a run of printable text
+CONTROL = re.compile(rb"[\x00-\x1f\x7f]")
+
+# Control characters which are kept as part of runs of text
+TEXT_CONTROLS = b"\r\n\t"
+
+Span = Tuple[int, int]
+
+
+def _digits(data: bytes, start: int, width: int) -> Optional[int]:
+    digits = data[start : start + width]
+    return int(digits) if digits.isdigit() else None
+
+
+def argument_length(arguments: Arguments, data: bytes, pos: int) -> Optional[int]:
+    """
+    The length of the arguments starting at a position, or None if the data
+    ends before they do.
+    """
+
+    size: int = len(data)
+
+    if isinstance(arguments, Fixed):
+        return arguments.size if pos + arguments.size <= size else None
+
+    if isinstance(arguments, Counted):
+        if pos + arguments.digits > size:
+            return None
+
+        count: Optional[int] = _digits(data, pos, arguments.digits)
+
+        if count is None:
+            # Not a valid count; take the digits and let the printer sort it
+            # out
+            return arguments.digits
+
+        length: int = arguments.digits + count * arguments.scale + arguments.extra
+        return length if pos + length <= size else None
+
+    if isinstance(arguments, Terminated):
+        end: int = data.find(arguments.terminator, pos)
+        return None if end < 0 else end + len(arguments.terminator) - pos
+
+    if isinstance(arguments, OptionalDigit):
+        if pos >= size:
+            return None
+        return 1 if data[pos : pos + 1].isdigit() else 0
+
+    start: int = pos
+
+    while pos < size and data[pos] != EOT:
+        if pos + 1 >= size:
+            return None
+        pos += 2 + (data[pos + 1] - 1) % 32 + 1
+
+    return pos + 1 - start if pos < size else None
+
+
+def command_end(data: bytes, pos: int) -> Optional[int]:
+    """
+    Find the end of the command starting with a control character at a
+    position, or None if the data ends before it does.
+    """
+
+    if data[pos] == ESCAPE:
+        if pos + 1 >= len(data):
+            return None
+
+        arguments: Optional[Arguments] = ESCAPE_ARGUMENTS.get(data[pos + 1])
+        pos += 2
+    else:
+        arguments = CONTROL_ARGUMENTS.get(data[pos])
+        pos += 1
+
+    if arguments is None:
+        return pos
+
+    length: Optional[int] = argument_length(arguments, data, pos)
+
+    return None if length is None else pos + length
+
+
+def to_command(data: bytes) -> Command:
+    """
+    Convert a single command's bytes into a Command, which encodes back to
+    exactly the same bytes.
+    """
+
+    first: int = data[0]
+
+    if first == ESCAPE and len(data) == 2 and data[1] < 0x80:
+        return Esc(chr(data[1]))
+
+    if first < 0x20 and len(data) == 1 and first not in TEXT_CONTROLS:
+        return Ctrl(chr(first + 64))
+
+    if first == ESCAPE and data[1:2] in (b"G", b"g"):
+        payload: bytes = data[6:] if data[1:2] == b"G" else data[5:]
+        graphics = PrintGraphicsData(payload)
+
+        if graphics.header() == data[: len(data) - len(payload)]:
+            return graphics
+
+    return Bytes(data)
+
+
+class Parser:
+    """
+    An incremental parser for ImageWriter II byte streams.
+    """
+
+    def __init__(self: Self) -> None:
+        # An incomplete command held back from the last chunk
+        self._tail: bytes = b""
+
+    @property
+    def pending(self: Self) -> int:
+        """
+        The number of bytes held back, waiting for the rest of a command.
+        """
+
+        return len(self._tail)
+
+    def split(self: Self, data: bytes) -> Tuple[bytes, List[Span]]:
+        """
+        Split a chunk of data into runs of text and whole commands. Returns
+        the data the spans index into - which includes any bytes held back
+        from the last chunk - along with the spans.
+        """
+
+        buffer: bytes = self._tail + data if self._tail else bytes(data)
+        size: int = len(buffer)
+        spans: List[Span] = list()
+        pos: int = 0
+
+        while pos < size:
+            byte: int = buffer[pos]
+
+            if byte >= 0x20 and byte != 0x7F:
+                match: Optional[re.Match[bytes]] = CONTROL.search(buffer, pos)
+                end: Optional[int] = match.start() if match else size
+            else:
+                end = command_end(buffer, pos)
+
+                if end is None:
+                    break
+
+            spans.append((pos, end))
+            pos = end
+
+        self._tail = buffer[pos:]
+
+        return buffer, spans
+
+    def feed(self: Self, data: bytes) -> List[Command]:
+        """
+        Parse a chunk of data into commands. Runs of text, including carriage
+        returns, line feeds and tabs, are merged into single Bytes commands.
+        """
+
+        buffer, spans = self.split(data)
+        commands: List[Command] = list()
+        # The start of the current run of text, if any
+        text: Optional[int] = None
+
+        for start, end in spans:
+            byte: int = buffer[start]
+
+            if (byte >= 0x20 and byte != 0x7F) or byte in TEXT_CONTROLS:
+                if text is None:
+                    text = start
+                continue
+
+            if text is not None:
+                commands.append(Bytes(buffer[text:start]))
+                text = None
+
+            commands.append(to_command(buffer[start:end]))
+
+        if text is not None:
+            commands.append(Bytes(buffer[text : spans[-1][1]]))
+
+        return commands
+
+    def feed_into(self: Self, buffer: CommandBuffer, data: bytes) -> CommandBuffer:
+        """
+        Parse a chunk of data onto the end of a command buffer, one command
+        per span, without converting it into Command objects.
+        """
+
+        parsed, spans = self.split(data)
+        view: memoryview = memoryview(parsed)
+
+        for start, end in spans:
+            buffer.append_bytes(view[start:end])
+
+        view.release()
+
+        return buffer
+
+    def close(self: Self) -> List[Command]:
+        """
+        Finish parsing. Any incomplete command is returned as raw bytes.
+        """
+
+        tail: bytes = self._tail
+        self._tail = b""
+
+        return [Bytes(tail)] if tail else list()
+
+
+def parse(data: bytes) -> List[Command]:
+    """
+    Parse a complete byte stream into commands.
+    """
+
+    parser: Parser = Parser()
+    return parser.feed(data) + parser.close()
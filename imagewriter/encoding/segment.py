@@ -0,0 +1,193 @@
+"""
+Split oversized commands into pieces which fit the flow control window.
+
+Commands are written whole, even if CTS drops part way through. When CTS
+goes high, the printer guarantees room for 100 bytes, but it keeps CTS high
+until fewer than 30 bytes are free, so while CTS stays high only 27 bytes
+are guaranteed. Commands longer than a burst - graphics bands, custom
+character loads, long tab lists and long runs of text - either stall the
+writer or overrun the printer's buffer.
+
+Most of those commands can be split into several smaller commands which
+print identically:
+
+* Graphics data continues from wherever the previous graphics command left
+  the print head, so a band can be sent as several shorter commands. Runs
+  sent with the repeat graphics byte command are kept whole.
+* Custom characters can be loaded in several batches.
+* Tab stops can be set or cleared in several lists.
+* Text can be split anywhere.
+
+The default limit is `AVAILABLE_WHEN_CTS_LOW`, the most a burst may hold
+while CTS stays high, so that every command fits in any burst. With a model
+of the printer's buffer, or under XON/XOFF, bursts of up to 100 bytes are
+safe, and a limit of `AVAILABLE_WHEN_CTS_HIGH` may be used instead.
+"""
+
+from typing import Generator, Iterable, List, Sequence
+
+from imagewriter.encoding.base import Bytes, Command, ESC
+from imagewriter.encoding.buffer import CommandBuffer
+from imagewriter.encoding.character.custom import CustomCharacter
+from imagewriter.encoding.graphics import (
+    graphics_header,
+    PrintGraphicsData,
+    repeat_graphics_byte,
+    Segment,
+)
+from imagewriter.encoding.parser import EOT, Parser
+from imagewriter.serial import AVAILABLE_WHEN_CTS_LOW
+
+# The longest graphics header - ESC G nnnn
+GRAPHICS_HEADER_LENGTH = 6
+
+# Custom character loads start with ESC I and end with ^D
+LOAD_LENGTH = 3
+
+# Tab lists start with ESC ( or ESC ), and each stop is 3 digits followed by
+# a comma or a period
+TAB_STOP_LENGTH = 4
+
+
+def _graphics(
+    data: bytes, spans: List[Segment], limit: int
+) -> Generator[Command, None, None]:
+    size: int = max(limit - GRAPHICS_HEADER_LENGTH, 1)
+
+    for start, end, repeated in spans:
+        if repeated:
+            yield Bytes(repeat_graphics_byte(data[start], end - start))
+            continue
+
+        for pos in range(start, end, size):
+            yield PrintGraphicsData(data[pos : min(pos + size, end)])
+
+
+def _custom_characters(load: bytes, limit: int) -> Generator[Command, None, None]:
+    characters: List[bytes] = list()
+    pos: int = len(CustomCharacter.start_load())
+
+    while pos < len(load) and load[pos] != EOT:
+        # A code point, a width from A to P (or a to p) and that many columns
+        end: int = pos + 2 + (load[pos + 1] - 1) % 32 + 1
+        characters.append(load[pos:end])
+        pos = end
+
+    batch: bytes = b""
+
+    for character in characters:
+        if batch and LOAD_LENGTH + len(batch) + len(character) > limit:
+            yield Bytes(
+                CustomCharacter.start_load() + batch + CustomCharacter.stop_load()
+            )
+            batch = b""
+
+        batch += character
+
+    yield Bytes(CustomCharacter.start_load() + batch + CustomCharacter.stop_load())
+
+
+def _tab_stops(command: bytes, limit: int) -> Generator[Command, None, None]:
+    code: bytes = command[:2]
+    stops: List[bytes] = command[2:-1].split(b",")
+    per_list: int = max((limit - len(code)) // TAB_STOP_LENGTH, 1)
+
+    for i in range(0, len(stops), per_list):
+        yield Bytes(code + b",".join(stops[i : i + per_list]) + b".")
+
+
+def _split(command: bytes, limit: int) -> Generator[Command, None, None]:
+    """
+    Split a single oversized command.
+    """
+
+    if command[:1] != ESC:
+        # Text
+        for pos in range(0, len(command), limit):
+            yield Bytes(command[pos : pos + limit])
+        return
+
+    code: bytes = command[1:2]
+
+    if code in (b"G", b"g"):
+        header: int = 6 if code == b"G" else 5
+        data: bytes = command[header:]
+
+        if graphics_header(len(data)) == command[:header]:
+            yield from _graphics(data, [(0, len(data), False)], limit)
+            return
+    elif code == b"I" and command[-1] == EOT:
+        yield from _custom_characters(command, limit)
+        return
+    elif code in (b"(", b")"):
+        yield from _tab_stops(command, limit)
+        return
+
+    # Anything else can't be split
+    yield Bytes(command)
+
+
+def _split_bytes(data: bytes, limit: int) -> Generator[Command, None, None]:
+    """
+    Split raw data into commands, packing small commands together and
+    splitting oversized ones.
+    """
+
+    parser: Parser = Parser()
+    buffer, spans = parser.split(data)
+    # The start of the small commands waiting to be packed together
+    pos: int = 0
+
+    for start, end in spans:
+        if end - start > limit:
+            if start > pos:
+                yield Bytes(buffer[pos:start])
+            yield from _split(buffer[start:end], limit)
+            pos = end
+        elif end - pos > limit:
+            yield Bytes(buffer[pos:start])
+            pos = start
+
+    if spans and spans[-1][1] > pos:
+        yield Bytes(buffer[pos : spans[-1][1]])
+
+    # An incomplete command at the end can't be split
+    yield from parser.close()
+
+
+def segment(
+    commands: Iterable[Command], limit: int = AVAILABLE_WHEN_CTS_LOW
+) -> Generator[Command, None, None]:
+    """
+    Split commands longer than a limit into several commands which print
+    identically. Commands which can't be split are passed through whole.
+
+    Raw bytes are parsed to find the commands in them, so they must hold
+    whole commands. Data read in arbitrary chunks should be fed through a
+    single `Parser` first.
+    """
+
+    for command in commands:
+        if len(command) <= limit:
+            yield command
+        elif isinstance(command, PrintGraphicsData):
+            yield from _graphics(command.data, command.segments, limit)
+        else:
+            yield from _split_bytes(bytes(command), limit)
+
+
+def segment_buffer(
+    commands: Sequence[Command] | CommandBuffer, limit: int = AVAILABLE_WHEN_CTS_LOW
+) -> Sequence[Command] | CommandBuffer:
+    """
+    Segment commands being written to a connection. A command buffer whose
+    commands all fit is passed through as-is.
+    """
+
+    if isinstance(commands, CommandBuffer):
+        if all(len(command) <= limit for command in commands):
+            return commands
+
+        commands = [Bytes(bytes(command)) for command in commands]
+
+    return list(segment(commands, limit))
@@ -0,0 +1,38 @@
+"""
+Convert images into graphics commands.
+"""
+
+from typing import List
+
+from imagewriter.image.color import rasterize_color, separate
+from imagewriter.image.dither import (
+    atkinson,
+    diffuse,
+    floyd_steinberg,
+    ordered,
+    resample,
+    threshold,
+)
+from imagewriter.image.font import CompiledFont, load_font, read_font
+from imagewriter.image.mapped import MappedImage
+from imagewriter.image.pnm import read_pnm
+from imagewriter.image.raster import pack_bands, rasterize, to_bitmap
+
+__all__: List[str] = [
+    "rasterize_color",
+    "separate",
+    "atkinson",
+    "diffuse",
+    "floyd_steinberg",
+    "ordered",
+    "resample",
+    "threshold",
+    "CompiledFont",
+    "load_font",
+    "read_font",
+    "MappedImage",
+    "read_pnm",
+    "pack_bands",
+    "rasterize",
+    "to_bitmap",
+]
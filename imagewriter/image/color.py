@@ -0,0 +1,129 @@
+"""
+Print color images with a color ribbon.
+
+The ImageWriter II prints in color by shifting the ribbon between its
+yellow, magenta, cyan and black bands, and overstriking passes of each
+color. An RGB image is separated into one plane per ribbon color, and each
+band is printed in one pass per plane with ink in it.
+
+Shifting the ribbon takes real time, so empty planes and bands are skipped
+entirely, and the order of the planes alternates from band to band. A band
+which ends on black is followed by a band which starts on black, without
+shifting the ribbon in between. A mostly black and white page with a colored
+logo only pays for color passes in the bands the logo covers.
+"""
+
+from typing import Callable, Dict, Generator, List, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+from imagewriter.encoding.base import Command
+from imagewriter.encoding.color import Color
+from imagewriter.encoding.graphics import set_graphics_distance_between_lines
+from imagewriter.encoding.pitch import set_pitch
+from imagewriter.image.dither import threshold, WHITE
+from imagewriter.image.raster import check_width, feed, pack_bands, print_band
+from imagewriter.pitch import Pitch
+
+# Ribbon colors, in the order they're printed on even bands. Lighter colors
+# are printed first.
+PLANES: List[Color] = [Color.YELLOW, Color.MAGENTA, Color.CYAN, Color.BLACK]
+
+# A dither takes a grayscale plane, where 0 is full ink, and returns a
+# bitmap
+Dither = Callable[[npt.NDArray], npt.NDArray]
+
+
+def separate(image: npt.NDArray) -> Dict[Color, npt.NDArray]:
+    """
+    Separate an RGB image into grayscale planes for each ribbon color, where
+    0 is full ink and 255 is none. Black is pulled out of the gray component
+    shared by cyan, magenta and yellow.
+    """
+
+    if image.ndim != 3 or image.shape[2] < 3:
+        raise ValueError(f"Expected an RGB image, got shape {image.shape}")
+
+    rgb = image[:, :, :3].astype(np.float32) / WHITE
+    cmy = 1.0 - rgb
+    k = cmy.min(axis=2)
+    cmy -= k[:, :, None]
+
+    def plane(ink: npt.NDArray) -> npt.NDArray:
+        return np.rint((1.0 - ink) * WHITE).astype(np.uint8)
+
+    return {
+        Color.CYAN: plane(cmy[:, :, 0]),
+        Color.MAGENTA: plane(cmy[:, :, 1]),
+        Color.YELLOW: plane(cmy[:, :, 2]),
+        Color.BLACK: plane(k),
+    }
+
+
+def _bitmap(dither: Dither, plane: npt.NDArray) -> npt.NDArray:
+    dithered = dither(plane)
+
+    # Error diffusion yields rows
+    if not isinstance(dithered, np.ndarray):
+        dithered = np.vstack(list(dithered))
+
+    return dithered
+
+
+def rasterize_color(
+    image: npt.NDArray,
+    pitch: Pitch = Pitch.ELITE_PROPORTIONAL,
+    dither: Dither = threshold,
+    compress: bool = False,
+    skip_blank: bool = True,
+    alternate: bool = True,
+) -> Generator[Command, None, None]:
+    """
+    Rasterize an RGB image into color graphics commands. Each plane is
+    dithered separately, with a simple threshold by default.
+
+    The ribbon is left on black afterwards. Note that, as with `rasterize`,
+    the pitch and the distance between lines are not restored.
+    """
+
+    check_width(image.shape[1], pitch)
+
+    bands: Dict[Color, npt.NDArray] = {
+        color: pack_bands(_bitmap(dither, plane))
+        for color, plane in separate(image).items()
+    }
+    inked: Dict[Color, npt.NDArray] = {
+        color: packed.any(axis=1) for color, packed in bands.items()
+    }
+
+    yield set_pitch(pitch)
+    yield set_graphics_distance_between_lines()
+
+    # The ribbon color is unknown until it's first set
+    current: Optional[Color] = None
+    # Lines waiting to be fed before the next band is printed
+    pending: int = 0
+
+    for i in range(len(bands[Color.BLACK])):
+        order: List[Color] = PLANES[::-1] if alternate and i % 2 else PLANES
+
+        for color in order:
+            if skip_blank and not inked[color][i]:
+                continue
+
+            yield from feed(pending)
+            pending = 0
+
+            if color != current:
+                yield color.set()
+                current = color
+
+            yield from print_band(bands[color][i], pitch, skip_blank, compress)
+
+        pending += 1
+
+    yield from feed(pending)
+
+    if current not in (None, Color.BLACK):
+        yield Color.BLACK.set()
@@ -0,0 +1,215 @@
+"""
+Halftone grayscale images for printing.
+
+Images are grayscale arrays, where 0 is black and 255 is white. Dithering
+produces a bitmap, where True is ink, which can be passed straight to
+`imagewriter.image.rasterize`.
+
+Thresholding and ordered dithers are fully vectorized. Error diffusion is
+inherently serial along a row, so it runs a row at a time - errors carried
+along the row are handled in a tight loop, and errors pushed down to the
+following rows are spread with NumPy. Error diffusion yields rows as they're
+finished, so its output can stream into the rasterizer.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Generator, List, Literal, Self, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+from imagewriter.image.raster import THRESHOLD, VerticalResolution
+from imagewriter.pitch import Pitch
+
+WHITE = 255
+
+BayerSize = Literal[2] | Literal[4] | Literal[8]
+
+
+def _grayscale(image: npt.NDArray) -> npt.NDArray:
+    if image.ndim != 2:
+        raise ValueError(f"Expected a 2D image, got {image.ndim} dimensions")
+    return image
+
+
+def resample(
+    image: npt.NDArray,
+    dpi: float | Tuple[float, float],
+    pitch: Pitch = Pitch.ELITE_PROPORTIONAL,
+    vertical_resolution: VerticalResolution = 72,
+) -> npt.NDArray:
+    """
+    Resample an image scanned or rendered at some resolution, so that it
+    prints at the same size. Horizontally, the target is the pitch's graphics
+    resolution; vertically, it's 72 dpi, or 144 dpi when interleaving passes.
+
+    Resampling picks the nearest pixel, which is fast and, once dithered,
+    indistinguishable from filtering at these resolutions.
+    """
+
+    image = _grayscale(image)
+    dpi_x, dpi_y = dpi if isinstance(dpi, tuple) else (dpi, dpi)
+    height, width = image.shape
+
+    out_width: int = max(round(width * pitch.horizontal_resolution / dpi_x), 1)
+    out_height: int = max(round(height * vertical_resolution / dpi_y), 1)
+
+    rows = (np.arange(out_height) * height // out_height).astype(np.intp)
+    cols = (np.arange(out_width) * width // out_width).astype(np.intp)
+
+    return image[rows[:, None], cols[None, :]]
+
+
+def threshold(image: npt.NDArray, level: int = THRESHOLD) -> npt.NDArray:
+    """
+    Print every pixel darker than a gray level.
+    """
+
+    return _grayscale(image) < level
+
+
+def bayer_matrix(size: BayerSize) -> npt.NDArray:
+    """
+    A Bayer index matrix, with values from 0 to size * size - 1.
+    """
+
+    if size not in (2, 4, 8):
+        raise ValueError("Bayer matrices must be 2x2, 4x4 or 8x8")
+
+    matrix = np.array([[0, 2], [3, 1]])
+
+    while matrix.shape[0] < size:
+        matrix = np.block(
+            [
+                [4 * matrix, 4 * matrix + 2],
+                [4 * matrix + 3, 4 * matrix + 1],
+            ]
+        )
+
+    return matrix
+
+
+def ordered(image: npt.NDArray, size: BayerSize = 4) -> npt.NDArray:
+    """
+    Dither an image with a Bayer matrix.
+    """
+
+    image = _grayscale(image)
+    height, width = image.shape
+
+    # Thresholds are spread evenly across the gray levels
+    thresholds = (bayer_matrix(size) + 0.5) * (WHITE + 1) / (size * size)
+    tiled = np.tile(thresholds, (-(-height // size), -(-width // size)))
+
+    return image < tiled[:height, :width]
+
+
+@dataclass(frozen=True)
+class Diffusion:
+    """
+    An error diffusion kernel.
+    """
+
+    # Weights for the pixels following in the same row
+    right: Tuple[float, ...]
+    # Weights for pixels in the following rows, as rows down, columns across
+    # and weight
+    below: Tuple[Tuple[int, int, float], ...]
+
+    @property
+    def depth(self: Self) -> int:
+        return max(dy for dy, _, _ in self.below)
+
+
+FLOYD_STEINBERG = Diffusion(
+    right=(7 / 16,),
+    below=((1, -1, 3 / 16), (1, 0, 5 / 16), (1, 1, 1 / 16)),
+)
+
+# Atkinson dithering only diffuses three quarters of the error, which keeps
+# highlights and shadows clean
+ATKINSON = Diffusion(
+    right=(1 / 8, 1 / 8),
+    below=((1, -1, 1 / 8), (1, 0, 1 / 8), (1, 1, 1 / 8), (2, 0, 1 / 8)),
+)
+
+DIFFUSIONS: Dict[str, Diffusion] = {
+    "floyd-steinberg": FLOYD_STEINBERG,
+    "atkinson": ATKINSON,
+}
+
+
+def _diffuse_row(
+    values: List[float], right: Tuple[float, ...]
+) -> Tuple[List[bool], List[float]]:
+    """
+    Quantize a row, carrying errors along it. Returns the printed pixels and
+    the error left at each pixel.
+    """
+
+    r1: float = right[0]
+    r2: float = right[1] if len(right) > 1 else 0.0
+    c1: float = 0.0
+    c2: float = 0.0
+
+    ink: List[bool] = [False] * len(values)
+    errors: List[float] = [0.0] * len(values)
+
+    for x, value in enumerate(values):
+        value += c1
+
+        if value < THRESHOLD:
+            ink[x] = True
+            error = value
+        else:
+            error = value - WHITE
+
+        errors[x] = error
+        c1 = c2 + error * r1
+        c2 = error * r2
+
+    return ink, errors
+
+
+def diffuse(
+    image: npt.NDArray, diffusion: Diffusion = FLOYD_STEINBERG
+) -> Generator[npt.NDArray, None, None]:
+    """
+    Dither an image with error diffusion, yielding rows of the bitmap as
+    they're finished.
+    """
+
+    image = _grayscale(image)
+    height, width = image.shape
+
+    # Errors pushed down to the following rows, padded on either side
+    pending = np.zeros((diffusion.depth + 1, width + 2))
+
+    for y in range(height):
+        values = image[y].astype(np.float64) + pending[0, 1:-1]
+        ink, errors = _diffuse_row(values.tolist(), diffusion.right)
+        error = np.asarray(errors)
+
+        pending[:-1] = pending[1:]
+        pending[-1] = 0.0
+
+        for dy, dx, weight in diffusion.below:
+            pending[dy - 1, 1 + dx : 1 + dx + width] += error * weight
+
+        yield np.asarray(ink, dtype=np.bool_)
+
+
+def floyd_steinberg(image: npt.NDArray) -> Generator[npt.NDArray, None, None]:
+    """
+    Dither an image with Floyd-Steinberg error diffusion.
+    """
+
+    return diffuse(image, FLOYD_STEINBERG)
+
+
+def atkinson(image: npt.NDArray) -> Generator[npt.NDArray, None, None]:
+    """
+    Dither an image with Atkinson error diffusion.
+    """
+
+    return diffuse(image, ATKINSON)
@@ -0,0 +1,431 @@
+"""
+Import bitmap fonts as custom characters.
+
+BDF and PSF fonts are read into bitmaps, and each glyph is compiled into the
+columns of a custom character - up to 16 columns, each printed by the top or
+bottom 8 of the print head's 9 wires. Glyphs with descenders are printed on
+the bottom wires, and everything else on the top wires.
+
+Fonts must fit the print head, at most 9 dots tall and 16 dots wide. Most
+console fonts are 16 dots tall, and have to be scaled down to 8 or 9 dots
+with a font editor before they can be imported.
+
+Parsing and packing a font takes far longer than printing a label, so
+compiled fonts are cached on disk, in a binary file which is memory-mapped
+when it's opened. Starting up with a cached font doesn't read the font, or
+even the whole cache file.
+
+The cache file starts with a header - a magic number and the number of
+glyphs - followed by an index of glyphs sorted by code point, and then each
+glyph's column data. See `HEADER` and `ENTRY` for the layouts.
+"""
+
+import binascii
+from dataclasses import dataclass
+import hashlib
+import mmap
+import os
+import os.path
+import struct
+from typing import Any, Dict, List, Optional, Self, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+from imagewriter.encoding.character.custom import (
+    CharacterData,
+    CustomCharacter,
+    TOP_WIRE_CHARACTER_WIDTHS,
+)
+from imagewriter.image.raster import BAND_HEIGHT, pack_bands
+
+# Custom characters are at most 16 columns wide
+MAX_WIDTH = max(TOP_WIRE_CHARACTER_WIDTHS)
+
+# Glyphs can be printed on the top or bottom 8 of the print head's 9 wires
+MAX_HEIGHT = BAND_HEIGHT + 1
+
+PSF1_MAGIC = b"\x36\x04"
+PSF2_MAGIC = b"\x72\xb5\x4a\x86"
+PSF1_MODE_512 = 0x01
+PSF1_MODE_HAS_TABLE = 0x02
+PSF2_HAS_UNICODE_TABLE = 0x01
+
+PSF1_HEADER = struct.Struct("<2sBB")
+PSF2_HEADER = struct.Struct("<4sIIIIIII")
+
+# Compiled fonts start with a magic number and the number of glyphs...
+MAGIC = b"IWF1"
+HEADER = struct.Struct("<4sI")
+
+# ...followed by an index entry for each glyph, sorted by code point: the
+# code point, the offset of its data, its width, and whether it's printed on
+# the top wires
+ENTRY = np.dtype(
+    [("point", "<u4"), ("offset", "<u4"), ("width", "u1"), ("top_wires", "u1")]
+)
+
+Bitmap = npt.NDArray[np.bool_]
+
+# A compiled glyph - its column data, and whether it's printed on the top
+# wires
+Glyph = Tuple[bytes, bool]
+
+
+@dataclass
+class BitmapFont:
+    """
+    A bitmap font. Each glyph is a bitmap of the full character cell, where
+    True is ink, keyed by code point.
+    """
+
+    height: int
+    glyphs: Dict[int, Bitmap]
+
+
+def _bits(row: bytes, width: int) -> npt.NDArray[np.bool_]:
+    return np.unpackbits(np.frombuffer(row, np.uint8))[:width].astype(np.bool_)
+
+
+def parse_bdf(data: bytes) -> BitmapFont:
+    """
+    Parse a BDF font. Glyphs are placed in a cell as tall as the font's
+    ascent and descent, and as wide as their advance.
+    """
+
+    lines: List[bytes] = data.splitlines()
+    properties: Dict[bytes, List[bytes]] = dict()
+    glyphs: Dict[int, Bitmap] = dict()
+    pos: int = 0
+
+    while pos < len(lines) and not lines[pos].startswith(b"STARTCHAR"):
+        fields: List[bytes] = lines[pos].split()
+        if fields:
+            properties[fields[0]] = fields[1:]
+        pos += 1
+
+    if b"FONTBOUNDINGBOX" not in properties:
+        raise ValueError("Not a BDF font")
+
+    _, bbox_height, _, bbox_y = (int(n) for n in properties[b"FONTBOUNDINGBOX"])
+    ascent: int = int(properties.get(b"FONT_ASCENT", [bbox_height + bbox_y])[0])
+    descent: int = int(properties.get(b"FONT_DESCENT", [-bbox_y])[0])
+    height: int = ascent + descent
+
+    # Fields of the glyph being read
+    glyph: Dict[bytes, List[bytes]] = dict()
+
+    while pos < len(lines):
+        fields = lines[pos].split()
+        pos += 1
+
+        if not fields:
+            continue
+
+        if fields[0] == b"STARTCHAR":
+            glyph = dict()
+            continue
+
+        if fields[0] != b"BITMAP":
+            glyph[fields[0]] = fields[1:]
+            continue
+
+        point: int = int(glyph[b"ENCODING"][0])
+        width, rows, x, y = (int(n) for n in glyph[b"BBX"])
+        x = max(x, 0)
+        advance: int = int(glyph[b"DWIDTH"][0]) if b"DWIDTH" in glyph else x + width
+
+        cell = np.zeros((height, max(advance, x + width, 1)), np.bool_)
+        top: int = ascent - (y + rows)
+
+        for row in range(rows):
+            if 0 <= top + row < height:
+                hexits: bytes = lines[pos + row].strip()
+                cell[top + row, x : x + width] = _bits(
+                    binascii.unhexlify(hexits), width
+                )
+
+        pos += rows
+
+        # Glyphs outside the font's encoding have an ENCODING of -1
+        if point >= 0:
+            glyphs[point] = cell
+
+    return BitmapFont(height=height, glyphs=glyphs)
+
+
+def _psf_table(data: bytes, count: int, psf2: bool) -> List[List[int]]:
+    """
+    Parse a PSF unicode table into the code points of each glyph.
+    """
+
+    points: List[List[int]] = [list() for _ in range(count)]
+
+    if psf2:
+        entries: List[bytes] = data.split(b"\xff")[:count]
+
+        for i, entry in enumerate(entries):
+            # Only single code points are mapped - sequences, which follow a
+            # 0xFE, are skipped
+            text: str = entry.split(b"\xfe")[0].decode("utf-8", errors="ignore")
+            points[i] = [ord(ch) for ch in text]
+    else:
+        table = np.frombuffer(data[: len(data) - len(data) % 2], "<u2")
+        glyph: int = 0
+        # Whether a sequence is being skipped
+        sequence: bool = False
+
+        for value in table.tolist():
+            if glyph >= count:
+                break
+            if value == 0xFFFF:
+                glyph += 1
+                sequence = False
+            elif value == 0xFFFE:
+                sequence = True
+            elif not sequence:
+                points[glyph].append(value)
+
+    return points
+
+
+def parse_psf(data: bytes) -> BitmapFont:
+    """
+    Parse a PSF (version 1 or 2) console font. Glyphs are keyed by the code
+    points in the font's unicode table, or by their index if it has none.
+    """
+
+    if data[:2] == PSF1_MAGIC:
+        _, mode, charsize = PSF1_HEADER.unpack_from(data)
+        count: int = 512 if mode & PSF1_MODE_512 else 256
+        width: int = 8
+        height: int = charsize
+        offset: int = PSF1_HEADER.size
+        has_table: bool = bool(mode & PSF1_MODE_HAS_TABLE)
+        psf2: bool = False
+    elif data[:4] == PSF2_MAGIC:
+        _, _, offset, flags, count, charsize, height, width = PSF2_HEADER.unpack_from(
+            data
+        )
+        has_table = bool(flags & PSF2_HAS_UNICODE_TABLE)
+        psf2 = True
+    else:
+        raise ValueError("Not a PSF font")
+
+    row_size: int = -(-width // 8)
+    charsize = row_size * height
+    end: int = offset + count * charsize
+
+    if len(data) < end:
+        raise ValueError("Truncated PSF font")
+
+    raw = np.frombuffer(data, np.uint8, count * charsize, offset)
+    bitmaps = np.unpackbits(raw.reshape(count, height, row_size), axis=2)
+    bitmaps = bitmaps[:, :, :width].astype(np.bool_)
+
+    points: List[List[int]] = (
+        _psf_table(data[end:], count, psf2)
+        if has_table
+        else [[i] for i in range(count)]
+    )
+
+    glyphs: Dict[int, Bitmap] = dict()
+
+    for i, glyph_points in enumerate(points):
+        for point in glyph_points:
+            glyphs.setdefault(point, bitmaps[i])
+
+    return BitmapFont(height=height, glyphs=glyphs)
+
+
+def read_font(path: str | os.PathLike[str]) -> BitmapFont:
+    """
+    Read a BDF or PSF font.
+    """
+
+    with open(path, "rb") as f:
+        data: bytes = f.read()
+
+    if data[:2] == PSF1_MAGIC or data[:4] == PSF2_MAGIC:
+        return parse_psf(data)
+
+    return parse_bdf(data)
+
+
+def compile_glyph(bitmap: Bitmap, top_wires: Optional[bool] = None) -> Glyph:
+    """
+    Compile a glyph's bitmap into custom character data. Glyphs up to 8 dots
+    tall are printed on the top wires. 9 dot tall glyphs are printed on the
+    bottom wires when they have ink in the bottom row and none in the top
+    row - descenders - and on the top wires otherwise, losing their bottom
+    row. Glyphs may be wider than 16 dots if the columns past 16 are blank,
+    and those columns are cropped.
+    """
+
+    height, width = bitmap.shape
+
+    if height > MAX_HEIGHT:
+        raise ValueError(f"Glyphs can be at most {MAX_HEIGHT} dots tall, got {height}")
+
+    if bitmap[:, MAX_WIDTH:].any():
+        raise ValueError(
+            f"Glyphs can have ink in at most {MAX_WIDTH} columns, got {width}"
+        )
+
+    if top_wires is None:
+        top_wires = not (
+            height == MAX_HEIGHT and bitmap[-1].any() and not bitmap[0].any()
+        )
+
+    rows: Bitmap = bitmap[:BAND_HEIGHT] if top_wires else bitmap[-BAND_HEIGHT:]
+    columns = pack_bands(rows[:, :MAX_WIDTH])[0]
+
+    # Custom characters are at least one column wide
+    if not len(columns):
+        columns = np.zeros(1, np.uint8)
+
+    return (columns.tobytes(), top_wires)
+
+
+def compile_font(font: BitmapFont, top_wires: Optional[bool] = None) -> bytes:
+    """
+    Compile a font into the binary form cached on disk.
+    """
+
+    points: List[int] = sorted(font.glyphs)
+    index = np.zeros(len(points), ENTRY)
+    data: bytearray = bytearray()
+    offset: int = HEADER.size + index.nbytes
+
+    for i, point in enumerate(points):
+        try:
+            columns, top = compile_glyph(font.glyphs[point], top_wires)
+        except ValueError as exc:
+            raise ValueError(f"Can't compile glyph {point:#x}: {exc}") from exc
+
+        index[i] = (point, offset + len(data), len(columns), top)
+        data += columns
+
+    return HEADER.pack(MAGIC, len(points)) + index.tobytes() + bytes(data)
+
+
+class CompiledFont:
+    """
+    A compiled font, mapped into memory.
+    """
+
+    def __init__(self: Self, path: str | os.PathLike[str]) -> None:
+        self.path: str | os.PathLike[str] = path
+
+        with open(path, "rb") as f:
+            self._map: mmap.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count = HEADER.unpack_from(self._map)
+
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"Not a compiled font: {path}")
+
+        self._index = np.frombuffer(self._map, ENTRY, count, HEADER.size)
+
+    def __len__(self: Self) -> int:
+        return len(self._index)
+
+    def _find(self: Self, point: int) -> Optional[int]:
+        i: int = int(np.searchsorted(self._index["point"], point))
+
+        if i < len(self._index) and self._index["point"][i] == point:
+            return i
+
+        return None
+
+    def __contains__(self: Self, point: int) -> bool:
+        return self._find(point) is not None
+
+    def glyph(self: Self, point: int) -> Glyph:
+        """
+        Get a glyph's column data, and whether it's printed on the top wires.
+        """
+
+        i: Optional[int] = self._find(point)
+
+        if i is None:
+            raise KeyError(point)
+
+        point, offset, width, top_wires = self._index[i].tolist()
+
+        return (self._map[offset : offset + width], bool(top_wires))
+
+    def character_data(
+        self: Self, point: int, character: Optional[CustomCharacter] = None
+    ) -> CharacterData:
+        """
+        Get the data for loading a glyph as a custom character. By default,
+        the glyph is loaded at its own code point.
+        """
+
+        data, top_wires = self.glyph(point)
+
+        return (character or CustomCharacter(point), data, top_wires)
+
+    def close(self: Self) -> None:
+        # The index is a view onto the map, and has to go first
+        del self._index
+        self._map.close()
+
+    def __enter__(self: Self) -> Self:
+        return self
+
+    def __exit__(self: Self, *args: Any) -> None:
+        self.close()
+
+
+def cache_dir() -> str:
+    """
+    The directory compiled fonts are cached in.
+    """
+
+    base: str = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "imagewriter", "fonts")
+
+
+def _cache_path(
+    path: str | os.PathLike[str], top_wires: Optional[bool], directory: str
+) -> str:
+    # Fonts are keyed by where they are and when they last changed, so that
+    # a cached font can be found without reading the font
+    stat: os.stat_result = os.stat(path)
+    key: str = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}:{top_wires}"
+    digest: str = hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    return os.path.join(directory, digest[:32] + ".iwf")
+
+
+def load_font(
+    path: str | os.PathLike[str],
+    top_wires: Optional[bool] = None,
+    directory: Optional[str] = None,
+) -> CompiledFont:
+    """
+    Load a BDF or PSF font, compiling it into the cache if it isn't there
+    already. Raises a ValueError if any glyph is taller than 9 dots, or has
+    ink past 16 columns - see `compile_glyph`.
+    """
+
+    directory = directory or cache_dir()
+    cached: str = _cache_path(path, top_wires, directory)
+
+    if not os.path.exists(cached):
+        compiled: bytes = compile_font(read_font(path), top_wires)
+        os.makedirs(directory, exist_ok=True)
+
+        # Write to a temporary file and move it into place, so that other
+        # processes never see a partial font
+        temporary: str = f"{cached}.{os.getpid()}.tmp"
+
+        with open(temporary, "wb") as f:
+            f.write(compiled)
+
+        os.replace(temporary, cached)
+
+    return CompiledFont(cached)
@@ -0,0 +1,145 @@
+"""
+Read large images through a memory map, a band at a time.
+
+Posters and banners can be far larger than the memory on a small print
+server. A mapped image decodes only the rows being printed, and tells the
+kernel it's done with the pages it has read, so memory use stays
+proportional to a single band rather than the whole image.
+"""
+
+import dataclasses
+import mmap
+import os
+from typing import Any, Generator, Literal, Optional, Self, Type
+
+import numpy as np
+import numpy.typing as npt
+
+from imagewriter.image.pnm import decode, PBM, PGM, PNMHeader
+
+
+class MappedImage:
+    """
+    A PBM, PGM or raw image file, mapped into memory.
+    """
+
+    def __init__(self: Self, path: str | os.PathLike[str], header: PNMHeader) -> None:
+        self.path: str | os.PathLike[str] = path
+
+        with open(path, "rb") as f:
+            self._map: mmap.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+
+        if header.height < 0:
+            # Raw images take their height from the size of the file
+            height: int = (len(self._map) - header.offset) // header.row_size
+            header = dataclasses.replace(header, height=height)
+
+        if len(self._map) < header.offset + header.size:
+            self._map.close()
+            raise ValueError("Truncated image raster")
+
+        self.header: PNMHeader = header
+
+    @classmethod
+    def open(cls: Type[Self], path: str | os.PathLike[str]) -> Self:
+        """
+        Map a binary PBM or PGM file.
+        """
+
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                header: PNMHeader = PNMHeader.parse(m)
+
+        return cls(path, header)
+
+    @classmethod
+    def raw(
+        cls: Type[Self],
+        path: str | os.PathLike[str],
+        width: int,
+        bits: Literal[1] | Literal[8] = 8,
+        offset: int = 0,
+        height: Optional[int] = None,
+    ) -> Self:
+        """
+        Map a headerless image file. One bit images are laid out like PBM
+        rasters, where set bits are ink; eight bit images are laid out like
+        PGM rasters, where 0 is black. The height defaults to as many rows as
+        the file holds.
+        """
+
+        header: PNMHeader = PNMHeader(
+            magic=PBM if bits == 1 else PGM,
+            width=width,
+            height=-1 if height is None else height,
+            maxval=1 if bits == 1 else 255,
+            offset=offset,
+        )
+
+        return cls(path, header)
+
+    @property
+    def width(self: Self) -> int:
+        return self.header.width
+
+    @property
+    def height(self: Self) -> int:
+        return self.header.height
+
+    def rows(self: Self, start: int, stop: int) -> npt.NDArray:
+        """
+        Decode a range of rows.
+        """
+
+        start = max(start, 0)
+        stop = min(stop, self.height)
+        row_size: int = self.header.row_size
+
+        raster = np.frombuffer(
+            self._map,
+            np.uint8,
+            (stop - start) * row_size,
+            self.header.offset + start * row_size,
+        )
+
+        # Decoding copies the rows out of the map
+        return decode(dataclasses.replace(self.header, height=stop - start), raster)
+
+    def _release(self: Self, start: int, stop: int) -> None:
+        """
+        Let the kernel drop pages which have been read.
+        """
+
+        if not hasattr(mmap, "MADV_DONTNEED"):
+            return
+
+        begin: int = self.header.offset + start * self.header.row_size
+        end: int = self.header.offset + stop * self.header.row_size
+
+        # madvise works on whole pages
+        begin -= begin % mmap.PAGESIZE
+        end -= end % mmap.PAGESIZE
+
+        if end > begin:
+            self._map.madvise(mmap.MADV_DONTNEED, begin, end - begin)
+
+    def bands(self: Self, height: int = 8) -> Generator[npt.NDArray, None, None]:
+        """
+        Decode the image a band of rows at a time.
+        """
+
+        for start in range(0, self.height, height):
+            yield self.rows(start, start + height)
+            self._release(start, start + height)
+
+    def close(self: Self) -> None:
+        self._map.close()
+
+    def __enter__(self: Self) -> Self:
+        return self
+
+    def __exit__(self: Self, *args: Any) -> None:
+        self.close()
@@ -0,0 +1,131 @@
+"""
+Read PBM and PGM images, in their binary (P4 and P5) formats. See the netpbm
+documentation for details on the formats.
+"""
+
+from dataclasses import dataclass
+import os
+import re
+from typing import List, Optional, Self, Type
+
+import numpy as np
+import numpy.typing as npt
+
+PBM = b"P4"
+PGM = b"P5"
+
+# A magic number, then whitespace separated fields, with comments running
+# from "#" to the end of a line. A single whitespace character separates the
+# header from the raster.
+TOKEN = re.compile(rb"(?:\s|#[^\r\n]*)*([^\s#]+)")
+
+
+@dataclass(frozen=True)
+class PNMHeader:
+    """
+    The header of a PBM or PGM image.
+    """
+
+    magic: bytes
+    width: int
+    height: int
+    maxval: int
+    # The offset at which the raster starts
+    offset: int
+
+    @classmethod
+    def parse(cls: Type[Self], data: bytes) -> Self:
+        tokens: List[bytes] = list()
+        pos: int = 0
+
+        while len(tokens) < (3 if data[:2] == PBM else 4):
+            match: Optional[re.Match[bytes]] = TOKEN.match(data, pos)
+
+            if not match:
+                raise ValueError("Truncated PNM header")
+
+            tokens.append(match.group(1))
+            pos = match.end()
+
+        magic: bytes = tokens[0]
+
+        if magic not in (PBM, PGM):
+            raise ValueError(f"Unsupported PNM format: {magic!r}")
+
+        return cls(
+            magic=magic,
+            width=int(tokens[1]),
+            height=int(tokens[2]),
+            maxval=int(tokens[3]) if magic == PGM else 1,
+            offset=pos + 1,
+        )
+
+    @property
+    def row_size(self: Self) -> int:
+        """
+        The number of bytes in each row of the raster.
+        """
+
+        if self.magic == PBM:
+            return (self.width + 7) // 8
+        return self.width * (2 if self.maxval > 255 else 1)
+
+    @property
+    def size(self: Self) -> int:
+        """
+        The number of bytes in the raster.
+        """
+
+        return self.row_size * self.height
+
+
+def decode_pbm(header: PNMHeader, raster: npt.NDArray[np.uint8]) -> npt.NDArray:
+    """
+    Decode PBM rows, where set bits are black, into a boolean array where
+    True is ink.
+    """
+
+    rows = raster.reshape(-1, header.row_size)
+    return np.unpackbits(rows, axis=1)[:, : header.width].astype(np.bool_)
+
+
+def decode_pgm(header: PNMHeader, raster: npt.NDArray[np.uint8]) -> npt.NDArray:
+    """
+    Decode PGM rows into a grayscale array, scaled to 0 (black) to 255
+    (white).
+    """
+
+    if header.maxval > 255:
+        pixels = raster.view(">u2").reshape(-1, header.width).astype(np.uint32)
+    else:
+        pixels = raster.reshape(-1, header.width).astype(np.uint32)
+
+    if header.maxval != 255:
+        pixels = pixels * 255 // header.maxval
+
+    return pixels.astype(np.uint8)
+
+
+def decode(header: PNMHeader, raster: npt.NDArray[np.uint8]) -> npt.NDArray:
+    if header.magic == PBM:
+        return decode_pbm(header, raster)
+    return decode_pgm(header, raster)
+
+
+def read_pnm(path: str | os.PathLike[str]) -> npt.NDArray:
+    """
+    Read a PBM image into a boolean array, or a PGM image into a grayscale
+    array.
+    """
+
+    with open(path, "rb") as f:
+        data: bytes = f.read()
+
+    header: PNMHeader = PNMHeader.parse(data)
+
+    if len(data) < header.offset + header.size:
+        raise ValueError("Truncated PNM raster")
+
+    raster = np.frombuffer(data, np.uint8, header.size, header.offset)
+
+    return decode(header, raster)
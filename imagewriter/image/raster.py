@@ -0,0 +1,247 @@
+"""
+Rasterize images into graphics commands.
+
+In graphics mode, the ImageWriter II prints bands 8 dots tall. Each byte of
+graphics data is a column of the band, with the least significant bit
+firing the top wire. Images are sliced into bands and packed into columns
+with NumPy, so that rasterizing a full page takes milliseconds.
+
+Blank regions are skipped rather than sent. Blank columns on the left of a
+band are jumped over by placing the print head, blank columns on the right
+are trimmed, and runs of blank bands are fed past in as few commands as
+possible.
+"""
+
+import os
+from typing import Generator, Iterable, List, Literal, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+from imagewriter.encoding.base import Command
+from imagewriter.encoding.graphics import (
+    PrintGraphicsData,
+    set_graphics_distance_between_lines,
+)
+from imagewriter.encoding.motion import (
+    CR,
+    LineFeed,
+    PlaceExactPrintHeadPosition,
+)
+from imagewriter.encoding.pitch import set_pitch
+from imagewriter.image.mapped import MappedImage
+from imagewriter.pitch import Pitch, VERTICAL_RESOLUTION
+
+# The height of a band, in dots
+BAND_HEIGHT = 8
+
+# Gray levels below this are printed
+THRESHOLD = 128
+
+# The most lines a single line feed command can feed
+MAX_FEED = 15
+
+# Placing the print head costs 6 bytes (ESC F nnnn), so shorter blank spans
+# are cheaper to send as graphics data
+MIN_SKIP = 6
+
+Image = npt.NDArray | str | os.PathLike[str] | MappedImage | Iterable[npt.NDArray]
+
+VerticalResolution = Literal[72] | Literal[144]
+
+
+def to_bitmap(image: npt.NDArray, threshold: int = THRESHOLD) -> npt.NDArray:
+    """
+    Convert an image to a boolean array, where True is ink. Boolean arrays
+    are passed through as-is; other arrays are treated as grayscale, where
+    0 is black.
+    """
+
+    if image.ndim != 2:
+        raise ValueError(f"Expected a 2D image, got {image.ndim} dimensions")
+
+    if image.dtype == np.bool_:
+        return image
+
+    return image < threshold
+
+
+def pack_strips(bitmap: npt.NDArray, interleave: int = 1) -> npt.NDArray[np.uint8]:
+    """
+    Pack a bitmap into strips of interleaved bands, padding the bottom strip
+    with blank rows. Each strip covers BAND_HEIGHT * interleave rows, and the
+    nth band in a strip holds every interleave-th row, starting from row n.
+    """
+
+    height, width = bitmap.shape
+    rows: int = BAND_HEIGHT * interleave
+    strips: int = -(-height // rows)
+    padding: int = strips * rows - height
+
+    if padding:
+        bitmap = np.pad(bitmap, ((0, padding), (0, 0)))
+
+    bands = bitmap.reshape(strips, BAND_HEIGHT, interleave, width).swapaxes(1, 2)
+    packed = np.packbits(bands, axis=2, bitorder="little")
+
+    return packed.reshape(strips, interleave, width)
+
+
+def pack_bands(bitmap: npt.NDArray) -> npt.NDArray[np.uint8]:
+    """
+    Pack a bitmap into an array of bands by columns, padding the bottom band
+    with blank rows.
+    """
+
+    return pack_strips(bitmap)[:, 0]
+
+
+def span(band: npt.NDArray[np.uint8]) -> Tuple[int, int]:
+    """
+    Find the span of a band between its first and last printed columns, as
+    start and end offsets. Blank bands have an empty span.
+    """
+
+    printed = np.flatnonzero(band)
+
+    if not len(printed):
+        return (0, 0)
+
+    return (int(printed[0]), int(printed[-1]) + 1)
+
+
+def feed(lines: int) -> Generator[Command, None, None]:
+    """
+    Feed a number of lines, with as few commands as possible.
+    """
+
+    while lines > 0:
+        n: int = min(lines, MAX_FEED)
+        yield LineFeed.feed(n)
+        lines -= n
+
+
+def print_band(
+    band: npt.NDArray[np.uint8],
+    pitch: Pitch,
+    skip_blank: bool = True,
+    compress: bool = False,
+) -> Generator[Command, None, None]:
+    """
+    Print a single pass of a band, and return the print head to the left
+    margin. Blank bands print nothing when skipping blank regions.
+    """
+
+    start, end = span(band) if skip_blank else (0, len(band))
+
+    if skip_blank and start == end:
+        return
+
+    if start < MIN_SKIP:
+        start = 0
+    else:
+        yield PlaceExactPrintHeadPosition(start, pitch)
+
+    yield PrintGraphicsData(band[start:end].tobytes(), compress=compress)
+    yield CR
+
+
+def check_width(width: int, pitch: Pitch) -> None:
+    if width > pitch.width:
+        raise ValueError(
+            f"Image is {width} dots wide, but {pitch.value} pitch only fits "
+            f"{pitch.width}"
+        )
+
+
+def strips(
+    image: Image, interleave: int = 1, threshold: int = THRESHOLD
+) -> Generator[npt.NDArray[np.uint8], None, None]:
+    """
+    Pack an image into strips of bands. Arrays are packed in one go, while
+    image files are read through a memory map and streams of rows are packed
+    a strip at a time.
+    """
+
+    if isinstance(image, np.ndarray):
+        yield from pack_strips(to_bitmap(image, threshold), interleave)
+        return
+
+    if isinstance(image, (str, os.PathLike)):
+        with MappedImage.open(image) as mapped:
+            yield from strips(mapped, interleave, threshold)
+        return
+
+    if isinstance(image, MappedImage):
+        for rows in image.bands(BAND_HEIGHT * interleave):
+            yield pack_strips(to_bitmap(rows, threshold), interleave)[0]
+        return
+
+    rows: List[npt.NDArray] = list()
+
+    for row in image:
+        rows.append(row)
+
+        if len(rows) == BAND_HEIGHT * interleave:
+            yield pack_strips(to_bitmap(np.stack(rows), threshold), interleave)[0]
+            rows.clear()
+
+    if rows:
+        yield pack_strips(to_bitmap(np.stack(rows), threshold), interleave)[0]
+
+
+def rasterize(
+    image: Image,
+    pitch: Pitch = Pitch.ELITE_PROPORTIONAL,
+    threshold: int = THRESHOLD,
+    compress: bool = False,
+    skip_blank: bool = True,
+    vertical_resolution: VerticalResolution = 72,
+) -> Generator[Command, None, None]:
+    """
+    Rasterize an image into graphics commands. The image is printed at the
+    pitch's horizontal resolution, and at either 72 or 144 dpi vertically.
+    The image may be an array, the path to a PBM or PGM file, a mapped image
+    file, or a stream of rows such as the output of error diffusion. Files
+    and streams are rasterized a strip at a time, in bounded memory.
+
+    At 72 dpi, the distance between lines is set to the height of a band, so
+    each line fed skips exactly one band. At 144 dpi, each strip of 16 rows
+    is printed in two passes - first the even rows, then the odd rows, half
+    a dot lower - and a line is 1/144 of an inch.
+
+    Note that this sets the pitch and the distance between lines, and does not
+    restore them afterwards.
+    """
+
+    if vertical_resolution not in (72, 144):
+        raise ValueError("Vertical resolution must be 72 or 144 dpi")
+
+    interleave: int = vertical_resolution // VERTICAL_RESOLUTION
+
+    yield set_pitch(pitch)
+
+    if interleave == 1:
+        yield set_graphics_distance_between_lines()
+        advance: List[int] = [1]
+    else:
+        yield LineFeed.set_distance_between_lines(1)
+        advance = [1, BAND_HEIGHT * interleave - 1]
+
+    # Lines waiting to be fed before the next band is printed
+    pending: int = 0
+
+    for strip in strips(image, interleave, threshold):
+        check_width(strip.shape[1], pitch)
+
+        for band, lines in zip(strip, advance):
+            printed: List[Command] = list(print_band(band, pitch, skip_blank, compress))
+
+            if printed:
+                yield from feed(pending)
+                yield from printed
+                pending = 0
+
+            pending += lines
+
+    yield from feed(pending)
@@ -0,0 +1,178 @@
+"""
+Watch the serial port's modem lines for changes.
+
+On Linux, the TIOCMIWAIT ioctl blocks until one of the input lines (CTS, DSR,
+CD or RI) changes state, which lets a watcher sleep until the printer
+actually does something. The TIOCGICOUNT ioctl counts transitions, so that
+one which lands between reading the lines and blocking isn't slept through.
+Where TIOCMIWAIT isn't available - for instance, on
+macOS, on pseudo-terminals and on some USB serial adapters - the watcher
+falls back to polling, backing off exponentially while the lines are idle.
+
+Note that RTS and DTR are driven by the host, and changes to them do not
+wake a blocking watcher. They are, however, included in every snapshot.
+"""
+
+from dataclasses import dataclass
+import errno
+import struct
+import sys
+import threading
+from typing import Optional, Self, Tuple, Type
+
+from serial import Serial
+
+try:
+    import fcntl
+    import termios
+except ImportError:  # pragma: no cover
+    fcntl = None
+    termios = None
+
+# TIOCMIWAIT and TIOCGICOUNT are Linux-specific, and their numbers vary by
+# architecture, so they're only used where the termios module provides them
+TIOCMIWAIT: Optional[int] = (
+    getattr(termios, "TIOCMIWAIT", None) if sys.platform.startswith("linux") else None
+)
+TIOCGICOUNT: Optional[int] = (
+    getattr(termios, "TIOCGICOUNT", None) if sys.platform.startswith("linux") else None
+)
+TIOCM_CD = getattr(termios, "TIOCM_CAR", 0x040)
+TIOCM_RI = getattr(termios, "TIOCM_RNG", 0x080)
+TIOCM_DSR = getattr(termios, "TIOCM_DSR", 0x100)
+TIOCM_CTS = getattr(termios, "TIOCM_CTS", 0x020)
+
+INPUT_LINES = TIOCM_CD | TIOCM_RI | TIOCM_DSR | TIOCM_CTS
+
+# struct serial_icounter_struct - transition counts for CTS, DSR, RI and CD,
+# followed by counts of bytes, errors and reserved fields
+ICOUNTER = struct.Struct("20i")
+
+# Polling intervals, in seconds. The watcher starts polling quickly after a
+# change and backs off while the lines are idle.
+MIN_POLL_INTERVAL = 0.001
+MAX_POLL_INTERVAL = 0.05
+
+
+@dataclass(frozen=True)
+class ModemLines:
+    """
+    A snapshot of the serial port's modem lines.
+    """
+
+    dtr: bool
+    dsr: bool
+    rts: bool
+    cts: bool
+
+    @classmethod
+    def read(cls: Type[Self], serial: Serial) -> Self:
+        return cls(dtr=serial.dtr, dsr=serial.dsr, rts=serial.rts, cts=serial.cts)
+
+
+class ModemLineWatcher:
+    """
+    Block until the modem lines of a serial port change.
+    """
+
+    def __init__(
+        self: Self,
+        serial: Serial,
+        min_interval: float = MIN_POLL_INTERVAL,
+        max_interval: float = MAX_POLL_INTERVAL,
+    ) -> None:
+        self.serial: Serial = serial
+        self.min_interval: float = min_interval
+        self.max_interval: float = max_interval
+        self.interval: float = min_interval
+        self.blocking: bool = fcntl is not None and TIOCMIWAIT is not None
+        self._closed: threading.Event = threading.Event()
+
+    @property
+    def closed(self: Self) -> bool:
+        return self._closed.is_set()
+
+    def _read(self: Self) -> Optional[ModemLines]:
+        try:
+            return ModemLines.read(self.serial)
+        except (OSError, ValueError, TypeError):
+            # The port has been closed out from under us
+            return None
+
+    def _block(self: Self) -> None:
+        """
+        Block on TIOCMIWAIT, falling back to polling if the ioctl isn't
+        supported.
+        """
+
+        try:
+            fcntl.ioctl(self.serial.fileno(), TIOCMIWAIT, INPUT_LINES)  # type: ignore
+        except OSError as exc:
+            if exc.errno in (errno.ENOTTY, errno.EINVAL, errno.ENOSYS):
+                self.blocking = False
+            else:
+                # The port has been closed out from under us
+                self.close()
+
+    def _counts(self: Self) -> Optional[Tuple[int, ...]]:
+        """
+        Read the number of transitions each input line has made, if the port
+        counts them.
+        """
+
+        if TIOCGICOUNT is None:
+            return None
+
+        try:
+            counts: bytes = fcntl.ioctl(  # type: ignore
+                self.serial.fileno(), TIOCGICOUNT, bytes(ICOUNTER.size)
+            )
+        except OSError:
+            return None
+
+        return ICOUNTER.unpack(counts)[:4]
+
+    def _poll(self: Self) -> None:
+        self._closed.wait(self.interval)
+        self.interval = min(self.interval * 2, self.max_interval)
+
+    def wait(self: Self, previous: Optional[ModemLines]) -> Optional[ModemLines]:
+        """
+        Wait until the modem lines differ from a previous snapshot, and
+        return the new snapshot. Returns None once the watcher or the port
+        has been closed.
+
+        When blocking on TIOCMIWAIT, closing the watcher takes effect at the
+        next line transition or when the port is closed. Transition counts
+        are compared from before the lines are read to just before blocking,
+        so that a transition in between is picked up right away. Ports
+        without transition counts fall back to polling, rather than risk
+        sleeping through one.
+        """
+
+        while not self.closed:
+            counts: Optional[Tuple[int, ...]] = (
+                self._counts() if self.blocking else None
+            )
+            current: Optional[ModemLines] = self._read()
+
+            if current is None:
+                return None
+
+            if current != previous:
+                self.interval = self.min_interval
+                return current
+
+            if self.blocking and counts is None:
+                self.blocking = False
+
+            if self.blocking:
+                if self._counts() == counts:
+                    self._block()
+            else:
+                self._poll()
+
+        return None
+
+    def close(self: Self) -> None:
+        self._closed.set()
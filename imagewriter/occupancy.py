@@ -0,0 +1,218 @@
+"""
+Model how full the printer's buffer is.
+
+CTS only says whether the printer's buffer is nearly full, and it says so
+late. When CTS goes high, the printer has room for at least 100 bytes; when
+it goes low, fewer than 30 bytes are free, and a few of those may already
+be on the wire. Writing 100 bytes every time CTS is seen high keeps the
+printer fed, but can overrun a buffer which only has 30 bytes free, and
+leaves the printer idle while the host waits for the next CTS reading.
+
+A `BufferModel` tracks every byte sent to the printer, and estimates how
+quickly the printer works through them with a `CostModel`. That tells the
+host how much it can safely send before CTS would change, so the buffer can
+be kept close to full. Each time CTS is read, the estimate is corrected to
+agree with it.
+"""
+
+from collections import deque
+import time
+from typing import Callable, Deque, List, Optional, Self, Type
+
+from imagewriter.cost import CostModel, Estimate, Meter
+from imagewriter.encoding.base import Command
+from imagewriter.memory import print_buffer_size
+from imagewriter.serial import AVAILABLE_WHEN_CTS_HIGH, AVAILABLE_WHEN_CTS_LOW
+
+# The number of free bytes at which the printer lowers CTS. See page 193 of
+# the ImageWriter II Technical Reference Manual.
+CTS_LOW_THRESHOLD = AVAILABLE_WHEN_CTS_LOW + 3
+
+Clock = Callable[[], float]
+
+
+class BufferModel:
+    """
+    An estimate of how many bytes are in the printer's buffer.
+
+    Bytes are added as they're sent, and drain at the rate the cost model
+    says they print. Bytes print in the order they were sent, so each burst
+    drains at its own rate.
+    """
+
+    def __init__(
+        self: Self,
+        capacity: int = print_buffer_size(),
+        cost: Optional[CostModel] = None,
+        clock: Clock = time.monotonic,
+    ) -> None:
+        self.capacity: int = capacity
+        self.cost: CostModel = cost or CostModel()
+        self._meter: Meter = Meter(self.cost)
+        self._clock: Clock = clock
+        self._updated: float = clock()
+
+        # Bursts in the buffer, oldest first - the number of bytes left to
+        # print in each, and the rate at which they print in bytes per second
+        self._bursts: Deque[List[float]] = deque()
+        self._level: float = 0.0
+        # The last CTS reading, if any
+        self._cts: Optional[bool] = None
+
+        self.corrections: int = 0
+
+    @classmethod
+    def for_printer(
+        cls: Type[Self],
+        expansion: bool = False,
+        cost: Optional[CostModel] = None,
+        clock: Clock = time.monotonic,
+    ) -> Self:
+        return cls(capacity=print_buffer_size(expansion), cost=cost, clock=clock)
+
+    def _drain(self: Self) -> None:
+        now: float = self._clock()
+        elapsed: float = now - self._updated
+        self._updated = now
+
+        while elapsed > 0 and self._bursts:
+            burst: List[float] = self._bursts[0]
+            remaining, rate = burst
+            seconds: float = remaining / rate
+
+            if seconds > elapsed:
+                burst[0] -= elapsed * rate
+                self._level -= elapsed * rate
+                return
+
+            elapsed -= seconds
+            self._level -= remaining
+            self._bursts.popleft()
+
+        if not self._bursts:
+            self._level = 0.0
+
+    @property
+    def level(self: Self) -> float:
+        """
+        The estimated number of bytes in the printer's buffer.
+        """
+
+        self._drain()
+        return self._level
+
+    @property
+    def free(self: Self) -> float:
+        """
+        The estimated number of bytes free in the printer's buffer.
+        """
+
+        return self.capacity - self.level
+
+    def sent(self: Self, commands: Command | bytes) -> None:
+        """
+        Track commands which have arrived at the printer.
+        """
+
+        data: bytes = bytes(commands)
+
+        if not data:
+            return
+
+        self._drain()
+
+        estimate: Estimate = self.cost.price(self._meter.measure([data]))
+
+        # Bursts which take no time to print, like those made up of escape
+        # codes, are assumed to be worked through as soon as they arrive
+        if estimate.printing > 0:
+            self._bursts.append([float(len(data)), len(data) / estimate.printing])
+            self._level += len(data)
+
+    def _set_level(self: Self, level: float) -> None:
+        """
+        Correct the estimated level. Bytes are added at, or removed from, the
+        front of the buffer.
+        """
+
+        self.corrections += 1
+        difference: float = level - self._level
+
+        if difference > 0:
+            if self._bursts:
+                self._bursts[0][0] += difference
+            else:
+                self._bursts.append([difference, float(self.cost.quality.print_speed)])
+        else:
+            while difference < 0 and self._bursts:
+                burst: List[float] = self._bursts[0]
+
+                if burst[0] > -difference:
+                    burst[0] += difference
+                    break
+
+                difference += burst[0]
+                self._bursts.popleft()
+
+        self._level = level
+
+    def observe(self: Self, cts: bool) -> None:
+        """
+        Correct the estimate with a reading of the CTS line.
+
+        When CTS has just gone low, about 30 bytes are free; when it has
+        just gone high, about 100 bytes are. Otherwise, CTS bounds the
+        estimate - while it's high, at least 27 bytes are free, and while
+        it's low, fewer than 100 are.
+        """
+
+        self._drain()
+
+        edge: bool = self._cts is not None and cts != self._cts
+        self._cts = cts
+
+        if cts:
+            # At most this many bytes are buffered
+            bound: float = self.capacity - (
+                AVAILABLE_WHEN_CTS_HIGH if edge else AVAILABLE_WHEN_CTS_LOW
+            )
+
+            if self._level > bound:
+                self._set_level(bound)
+        else:
+            # At least this many bytes are buffered
+            bound = self.capacity - (
+                CTS_LOW_THRESHOLD if edge else AVAILABLE_WHEN_CTS_HIGH
+            )
+
+            if self._level < bound:
+                self._set_level(bound)
+
+    def budget(self: Self, cts: bool) -> int:
+        """
+        The number of bytes which may be sent now, given a reading of the
+        CTS line.
+
+        While CTS is high, the estimated free space may be filled. While
+        it's low, the 27 bytes the printer has left after lowering CTS are
+        kept in reserve against a bad estimate.
+        """
+
+        self.observe(cts)
+        free: float = self.capacity - self._level
+
+        if not cts:
+            free -= AVAILABLE_WHEN_CTS_LOW
+
+        return max(int(free), 0)
+
+    def reset(self: Self) -> None:
+        """
+        Forget everything in the buffer, as when the printer is reset.
+        """
+
+        self._bursts.clear()
+        self._level = 0.0
+        self._cts = None
+        self._meter = Meter(self.cost)
+        self._updated = self._clock()
@@ -24,6 +24,26 @@ AVAILABLE_WHEN_CTS_LOW = 27
 # details.
 AVAILABLE_WHEN_CTS_HIGH = 100
 
+# Bits sent over the wire per byte, with 8 data bits, 1 start bit and 1 stop
+# bit
+BITS_PER_BYTE = 10
+
+
+def burst_budget(cts: bool, rising: bool) -> int:
+    """
+    The number of bytes which may be sent in a burst under the hardware
+    handshake, given a reading of CTS and whether it has just gone high.
+
+    When CTS goes high, the printer has room for at least 100 bytes. CTS
+    stays high until fewer than 30 bytes are free, so while it stays high,
+    only the 27 bytes of grace are guaranteed.
+    """
+
+    if not cts:
+        return 0
+
+    return AVAILABLE_WHEN_CTS_HIGH if rising else AVAILABLE_WHEN_CTS_LOW
+
 
 class SerialProtocol(Enum):
     """
@@ -1,10 +1,309 @@
+"""
+A raw print server, in the style of AppSocket/JetDirect.
+
+Clients connect (typically on port 9100) and send a job's bytes, which are
+passed through to the printer as-is. Jobs are written to an on-disk spool as
+they are received, and printed one at a time in the order they arrived.
+Jobs are spooled as fast as clients send them, so that they're safely on
+disk long before they've printed. Only printing waits on the printer.
+
+A job is only printed in full if its client finishes sending it. If the
+client goes away early, the rest of the job is discarded.
+
+As bytes are confirmed as sent to the printer, the job's checkpoint in the
+spool is updated. If the service restarts, it resumes printing from the
+last checkpoint. See `imagewriter.service.spool` for more details.
+"""
+
 import asyncio
+from collections import deque
+import functools
+import logging
+from typing import Deque, Optional, Self, Set, Tuple
+
+from imagewriter.connection import Connection
+from imagewriter.encoding import CommandBuffer
+from imagewriter.encoding.parser import Parser
+from imagewriter.service.spool import Job, Spool
+
+# The number of bytes read from a client at a time
+CHUNK_SIZE = 4096
+
+# The number of bytes queued on the connection at a time. This is enough to
+# keep the printer fed between polls, even at 9600 baud.
+HIGH_WATER_MARK = 1024
+
+# How often to check the connection while it's busy, in seconds
+POLL_INTERVAL = 0.01
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """
+    Spooled jobs waiting to be printed.
+    """
+
+    def __init__(self: Self, spool: Spool) -> None:
+        self.spool: Spool = spool
+        self._jobs: Deque[Job] = deque(spool.recover())
+        # The job being printed, if any
+        self._printing: Optional[Job] = None
+        # The IDs of jobs whose clients went away before sending all of them
+        self._discarded: Set[str] = set()
+        self._condition: asyncio.Condition = asyncio.Condition()
+
+    async def create(self: Self) -> Job:
+        """
+        Spool and enqueue a new job.
+        """
+
+        async with self._condition:
+            job: Job = self.spool.create()
+            self._jobs.append(job)
+            self._condition.notify_all()
+
+            return job
+
+    async def updated(self: Self) -> None:
+        """
+        Notify the transmitter that a job has been updated.
+        """
+
+        async with self._condition:
+            self._condition.notify_all()
+
+    async def next(self: Self) -> Job:
+        """
+        Wait for the next job to print.
+        """
+
+        async with self._condition:
+            await self._condition.wait_for(lambda: bool(self._jobs))
+            self._printing = self._jobs[0]
+            return self._printing
+
+    async def wait_for_data(self: Self, job: Job, offset: int) -> None:
+        """
+        Wait until a job has data past an offset, has been completely
+        received, or has been discarded.
+        """
+
+        async with self._condition:
+            await self._condition.wait_for(
+                lambda: job.size > offset or job.received or self.discarded(job)
+            )
+
+    def discarded(self: Self, job: Job) -> bool:
+        return job.id in self._discarded
+
+    async def discard(self: Self, job: Job) -> None:
+        """
+        Discard a job whose client went away before sending all of it. A job
+        which is being printed is removed once the transmitter stops
+        printing it.
+        """
+
+        async with self._condition:
+            if job is self._printing:
+                self._discarded.add(job.id)
+            else:
+                self._jobs.remove(job)
+                job.remove()
+
+            self._condition.notify_all()
+
+    def done(self: Self, job: Job) -> None:
+        """
+        Remove a printed or discarded job from the queue and the spool.
+        """
+
+        self._jobs.remove(job)
+        self._discarded.discard(job.id)
+        self._printing = None
+        job.remove()
+
+    def skip(self: Self, job: Job) -> None:
+        """
+        Remove a job which failed to print from the queue. Unless it was
+        discarded, it's left in the spool, and is retried when the service
+        restarts.
+        """
+
+        if self.discarded(job):
+            self.done(job)
+            return
+
+        self._jobs.remove(job)
+        self._printing = None
+        job.close()
+
+
+async def print_job(job: Job, queue: JobQueue, connection: Connection) -> None:
+    """
+    Send a job to the printer, starting from its last checkpoint, and
+    checkpointing as the connection confirms bytes have been transmitted.
+
+    The job is parsed as it's read, so that only whole commands are written
+    to the connection - a chunk may end part way through a command, which
+    would otherwise be split up as if it were complete. Checkpoints then
+    always fall between commands.
+    """
+
+    offset: int = job.offset
+    parser: Parser = Parser()
+    # Pairs of connection byte counts and the job offsets they confirm
+    confirmations: Deque[Tuple[int, int]] = deque()
+
+    def confirm() -> None:
+        confirmed: int = job.offset
+
+        while confirmations and connection.transmitted >= confirmations[0][0]:
+            _, confirmed = confirmations.popleft()
+
+        if confirmed != job.offset:
+            job.confirm(confirmed)
+
+    while True:
+        if queue.discarded(job):
+            return
+
+        confirm()
+
+        if offset >= job.size:
+            if job.received:
+                # Anything left is an incomplete command, written as-is
+                connection.write(parser.close())
+                confirmations.append((connection.queued, offset))
+                break
+
+            await queue.wait_for_data(job, offset)
+            continue
+
+        if connection.pending >= HIGH_WATER_MARK:
+            await asyncio.sleep(POLL_INTERVAL)
+            continue
+
+        view: memoryview = job.read(offset, HIGH_WATER_MARK - connection.pending)
+        n: int = len(view)
+
+        try:
+            commands: CommandBuffer = parser.feed_into(CommandBuffer(), bytes(view))
+        finally:
+            view.release()
+
+        connection.write(commands)
+
+        offset += n
+        confirmations.append((connection.queued, offset - parser.pending))
+
+    while confirmations and not queue.discarded(job):
+        await asyncio.sleep(POLL_INTERVAL)
+        confirm()
+
+        if confirmations and not connection.running:
+            # The writer failed, and the rest of the job will never be
+            # transmitted - raise its error, so that the job is skipped
+            connection.drain(timeout=0)
+
+
+async def transmit(queue: JobQueue, connection: Connection) -> None:
+    """
+    Print spooled jobs, one at a time. A job which fails to print is logged
+    and skipped.
+    """
+
+    while True:
+        job: Job = await queue.next()
+
+        try:
+            await print_job(job, queue, connection)
+        except Exception:
+            logger.exception("Failed to print job %s", job.id)
+            queue.skip(job)
+            continue
+
+        queue.done(job)
+
+
+async def handler(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    queue: JobQueue,
+) -> None:
+    """
+    Spool a client's job.
+    """
+
+    job: Job = await queue.create()
+    received: bool = False
+
+    try:
+        while True:
+            data: bytes = await reader.read(CHUNK_SIZE)
+
+            if not data:
+                received = True
+                break
+
+            job.append(data)
+            await queue.updated()
+    finally:
+        if received:
+            job.finish()
+            await queue.updated()
+        else:
+            # The client went away early, and will resubmit the job
+            await queue.discard(job)
+
+        writer.close()
+
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+class PrintServer:
+    """
+    A raw print server, together with the task printing its jobs.
+    """
+
+    def __init__(
+        self: Self,
+        server: asyncio.Server,
+        transmitter: "asyncio.Task[None]",
+    ) -> None:
+        self.server: asyncio.Server = server
+        self.transmitter: "asyncio.Task[None]" = transmitter
+
+    @property
+    def port(self: Self) -> int:
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self: Self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+        self.transmitter.cancel()
+
+        try:
+            await self.transmitter
+        except asyncio.CancelledError:
+            pass
 
 
-async def handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
-    # Read and write from an open client connection
-    pass
+async def server(
+    connection: Connection,
+    spool: Spool,
+    host: str = "localhost",
+    port: int = 9100,
+) -> PrintServer:
+    queue: JobQueue = JobQueue(spool)
+    transmitter = asyncio.create_task(transmit(queue, connection))
 
+    srv: asyncio.Server = await asyncio.start_server(
+        functools.partial(handler, queue=queue), host, port
+    )
 
-async def server(host: str = "localhost", port: int = 9100) -> asyncio.Server:
-    return await asyncio.start_server(handler, host, port)
+    return PrintServer(srv, transmitter)
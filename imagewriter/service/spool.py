@@ -0,0 +1,195 @@
+"""
+An on-disk spool for print jobs.
+
+Each job is stored as a pair of files in the spool directory:
+
+* `<id>.job` holds the job's data. It is only ever appended to, and is read
+  back through a memory map.
+* `<id>.ckpt` holds a checkpoint - the offset of the last byte confirmed as
+  sent to the printer, and whether the job has been completely received. It
+  is memory-mapped and updated in place.
+
+Job IDs sort in the order the jobs were created. When the print service
+restarts, jobs which were completely received are resumed from their
+checkpoints. Jobs which were still being received are discarded, as their
+clients will have seen the connection drop and will resubmit them.
+"""
+
+import mmap
+import os
+import os.path
+import struct
+import time
+from typing import List, Optional, Self
+
+CHECKPOINT = struct.Struct("<QQ")
+RECEIVED = 1
+
+JOB_SUFFIX = ".job"
+CHECKPOINT_SUFFIX = ".ckpt"
+
+
+class Job:
+    """
+    A spooled print job.
+    """
+
+    def __init__(self: Self, directory: str, id: str) -> None:
+        self.id: str = id
+        self.path: str = os.path.join(directory, id + JOB_SUFFIX)
+        self.checkpoint_path: str = os.path.join(directory, id + CHECKPOINT_SUFFIX)
+
+        self._fd: int = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT)
+        self._size: int = os.fstat(self._fd).st_size
+        self._map: Optional[mmap.mmap] = None
+
+        checkpoint_fd: int = os.open(self.checkpoint_path, os.O_RDWR | os.O_CREAT)
+        try:
+            if os.fstat(checkpoint_fd).st_size < CHECKPOINT.size:
+                os.ftruncate(checkpoint_fd, CHECKPOINT.size)
+            self._checkpoint: mmap.mmap = mmap.mmap(checkpoint_fd, CHECKPOINT.size)
+        finally:
+            os.close(checkpoint_fd)
+
+    @property
+    def size(self: Self) -> int:
+        """
+        The number of bytes spooled so far.
+        """
+
+        return self._size
+
+    @property
+    def offset(self: Self) -> int:
+        """
+        The offset of the last byte confirmed as sent to the printer.
+        """
+
+        return CHECKPOINT.unpack_from(self._checkpoint)[0]
+
+    @property
+    def received(self: Self) -> bool:
+        """
+        Whether the job has been completely received.
+        """
+
+        return bool(CHECKPOINT.unpack_from(self._checkpoint)[1] & RECEIVED)
+
+    def _update(self: Self, offset: int, flags: int) -> None:
+        CHECKPOINT.pack_into(self._checkpoint, 0, offset, flags)
+        self._checkpoint.flush()
+
+    def confirm(self: Self, offset: int) -> None:
+        """
+        Record that the job has been sent to the printer up to an offset.
+        """
+
+        flags: int = CHECKPOINT.unpack_from(self._checkpoint)[1]
+        self._update(offset, flags)
+
+    def append(self: Self, data: bytes | bytearray | memoryview) -> None:
+        """
+        Append data to the job.
+        """
+
+        view: memoryview = memoryview(data)
+
+        while view:
+            n: int = os.write(self._fd, view)
+            self._size += n
+            view = view[n:]
+
+    def finish(self: Self) -> None:
+        """
+        Mark the job as completely received, ensuring its data is on disk.
+        """
+
+        os.fsync(self._fd)
+        self._update(self.offset, RECEIVED)
+
+    def read(self: Self, offset: int, size: int) -> memoryview:
+        """
+        Get a slice of up to size bytes of the job's data, starting at an
+        offset. The slice must be released before the job is closed.
+        """
+
+        end: int = min(offset + size, self._size)
+
+        if end <= offset:
+            return memoryview(b"")
+
+        if self._map is None or len(self._map) < end:
+            self._remap()
+
+        assert self._map is not None
+        return memoryview(self._map)[offset:end]
+
+    def _remap(self: Self) -> None:
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # A slice of the old map is still in use; leave it to be
+                # collected along with the slice
+                pass
+
+        self._map = mmap.mmap(self._fd, self._size, access=mmap.ACCESS_READ)
+
+    def close(self: Self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+        self._checkpoint.close()
+        os.close(self._fd)
+
+    def remove(self: Self) -> None:
+        """
+        Close the job and remove it from the spool.
+        """
+
+        self.close()
+        os.unlink(self.path)
+        os.unlink(self.checkpoint_path)
+
+
+class Spool:
+    """
+    A directory of spooled print jobs.
+    """
+
+    def __init__(self: Self, directory: str) -> None:
+        self.directory: str = directory
+        self._counter: int = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    def create(self: Self) -> Job:
+        """
+        Create a new job.
+        """
+
+        self._counter += 1
+        return Job(self.directory, f"{time.time_ns():020d}-{self._counter:06d}")
+
+    def recover(self: Self) -> List[Job]:
+        """
+        Reopen jobs left over from a previous run, in the order they were
+        created. Jobs which were not completely received, or which were
+        completely sent, are removed.
+        """
+
+        jobs: List[Job] = list()
+
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(JOB_SUFFIX):
+                continue
+
+            job = Job(self.directory, name[: -len(JOB_SUFFIX)])
+
+            if job.received and job.offset < job.size:
+                jobs.append(job)
+            else:
+                job.remove()
+
+        return jobs
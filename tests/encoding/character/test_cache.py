@@ -0,0 +1,60 @@
+from typing import List, Tuple
+
+import pytest
+
+from imagewriter.encoding.base import Command
+from imagewriter.encoding.character import CharacterEncoder, Text
+from imagewriter.encoding.character.cache import EncoderCache
+from imagewriter.encoding.character.custom import CustomCharacter
+from imagewriter.language import Language
+
+
+def encode(commands: List[Command]) -> bytes:
+    return b"".join(bytes(cmd) for cmd in commands)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        ("Invoice #",),
+        ("Total: £5",),
+        ("a → b",),
+        ("x", CustomCharacter(200), "y"),
+    ],
+)
+def test_matches_encoder(text: Tuple[Text, ...]) -> None:
+    cache = EncoderCache(CharacterEncoder())
+
+    for _ in range(3):
+        assert encode(cache.encode(*text)) == encode(CharacterEncoder().encode(*text))
+
+    assert cache.misses == 1
+    assert cache.hits == 2
+
+
+def test_keyed_by_language() -> None:
+    british = EncoderCache(CharacterEncoder(Language.BRITISH))
+    american = EncoderCache(CharacterEncoder())
+
+    british.encode("£")
+    american.encode("£")
+
+    assert encode(british.encode("£")) == b"#"
+    assert encode(american.encode("£")) != b"#"
+
+
+def test_eviction() -> None:
+    cache = EncoderCache(CharacterEncoder(), capacity=2)
+
+    cache.encode("a")
+    cache.encode("b")
+    cache.encode("a")
+    cache.encode("c")
+
+    assert len(cache) == 2
+
+    cache.encode("a")
+    assert cache.hits == 2
+
+    cache.encode("b")
+    assert cache.misses == 4
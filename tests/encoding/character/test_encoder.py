@@ -0,0 +1,82 @@
+from typing import List
+
+from imagewriter.encoding.base import Command, esc
+from imagewriter.encoding.character import CharacterEncoder
+from imagewriter.encoding.language import set_language
+from imagewriter.language import Language
+
+
+def encode(commands: List[Command]) -> bytes:
+    return b"".join(bytes(cmd) for cmd in commands)
+
+
+def test_ascii() -> None:
+    encoder = CharacterEncoder()
+
+    assert encode(encoder.encode("Hello ", "world!")) == b"Hello world!"
+
+
+def test_mousetext() -> None:
+    encoder = CharacterEncoder()
+
+    assert encode(encoder.encode("a → b")) == (
+        b"a " + esc("&") + bytes([213]) + esc("$") + b" b"
+    )
+
+    # The encoder should be back in its default mode
+    assert encode(encoder.encode("→")) == esc("&") + bytes([213]) + esc("$")
+
+
+def test_language() -> None:
+    american = CharacterEncoder()
+
+    assert encode(american.encode("£5")) == (
+        encode(set_language(Language.BRITISH))
+        + b"#5"
+        + encode(set_language(Language.AMERICAN))
+    )
+
+    british = CharacterEncoder(language=Language.BRITISH)
+
+    assert encode(british.encode("£5")) == b"#5"
+
+
+def test_displaced() -> None:
+    # "#" can't be printed in British mode, where it's replaced by "£"
+    british = CharacterEncoder(language=Language.BRITISH)
+
+    assert encode(british.encode("£#")) == (
+        b"#"
+        + encode(set_language(Language.AMERICAN))
+        + b"#"
+        + encode(set_language(Language.BRITISH))
+    )
+
+
+def test_planned() -> None:
+    american = CharacterEncoder()
+
+    # Staying in British mode for the text between pound signs is cheaper
+    # than switching back and forth
+    assert encode(american.encode("£1 and £2")) == (
+        encode(set_language(Language.BRITISH))
+        + b"#1 and #2"
+        + encode(set_language(Language.AMERICAN))
+    )
+
+
+def test_lookahead() -> None:
+    text = "£1 # " * 20
+
+    assert encode(CharacterEncoder(lookahead=4).encode(text)) == encode(
+        CharacterEncoder().encode(text)
+    )
+
+
+def test_restore_language() -> None:
+    encoder = CharacterEncoder(restore_language=False)
+
+    assert encode(encoder.encode("£1")) == (
+        encode(set_language(Language.BRITISH)) + b"#1"
+    )
+    assert encode(encoder.encode("£2")) == b"#2"
@@ -0,0 +1,90 @@
+import pytest
+
+from imagewriter.encoding.character.custom import CustomCharacter
+from imagewriter.encoding.character.glyphs import GlyphCache
+from imagewriter.encoding.reset import RESET
+
+LOGO = b"\x3c\x42\x81\x81\x81\x81\x42\x3c"
+CHECK = b"\x10\x20\x40\x20\x10\x08\x04\x02"
+
+
+def test_load_once() -> None:
+    cache = GlyphCache()
+
+    logo = cache.glyph(LOGO)
+    check = cache.glyph(CHECK)
+
+    assert cache.load() == CustomCharacter.load(
+        [(logo, LOGO, True), (check, CHECK, True)]
+    )
+
+    # Both glyphs are resident, so the next job loads nothing
+    assert cache.glyph(CHECK).point == check.point
+    assert cache.glyph(LOGO).point == logo.point
+    assert cache.load() == b""
+    assert cache.hits == 2
+    assert cache.misses == 2
+
+
+def test_eviction() -> None:
+    cache = GlyphCache(points=[160, 161])
+
+    a = cache.glyph(b"\x01")
+    cache.glyph(b"\x02")
+    cache.load()
+
+    # a was used more recently, so the second glyph is replaced
+    cache.glyph(b"\x01")
+    cache.load()
+    c = cache.glyph(b"\x03")
+
+    assert c.point != a.point
+    assert cache.load() == CustomCharacter.load([(c, b"\x03", True)])
+    assert (b"\x02", True) not in cache
+
+
+def test_too_many() -> None:
+    cache = GlyphCache(points=[160])
+
+    cache.glyph(b"\x01")
+
+    with pytest.raises(ValueError):
+        cache.glyph(b"\x02")
+
+
+@pytest.mark.parametrize(
+    "command",
+    [bytes(RESET), CustomCharacter.set_max_width(8), b"text" + bytes(RESET)],
+)
+def test_invalidate(command: bytes) -> None:
+    cache = GlyphCache()
+
+    cache.glyph(LOGO)
+    cache.load()
+    cache.observe([command])
+
+    assert len(cache) == 0
+
+
+def test_graphics_are_not_resets() -> None:
+    cache = GlyphCache()
+
+    cache.glyph(LOGO)
+    cache.load()
+    cache.observe([b"\x1bG0002" + bytes(RESET)])
+
+    assert len(cache) == 1
+
+
+@pytest.mark.parametrize("split", [1, 2])
+def test_invalidate_across_calls(split: int) -> None:
+    cache = GlyphCache()
+    command = CustomCharacter.set_max_width(16)
+
+    cache.glyph(LOGO)
+    cache.load()
+    cache.observe([command[:split]])
+    cache.observe([command[split:]])
+
+    assert len(cache) == 0
+    assert cache.width == 16
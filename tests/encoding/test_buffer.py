@@ -0,0 +1,34 @@
+from imagewriter.encoding import Bytes, CommandBuffer, Esc, PrintGraphicsData
+
+
+def test_spans() -> None:
+    buffer = CommandBuffer(
+        [Esc("!"), Bytes(b""), Bytes(b"hello"), PrintGraphicsData(b"\x01\x02")]
+    )
+
+    assert len(buffer) == 3
+    assert buffer.nbytes == 2 + 5 + 8
+    assert bytes(buffer[1]) == b"hello"
+    assert bytes(buffer[-1]) == b"\x1bG0002\x01\x02"
+    assert bytes(buffer[:2]) == b"\x1b!hello"
+
+    # The first command is always counted, even if it's over budget
+    assert buffer.count(1) == 1
+    assert buffer.count(7) == 2
+    assert buffer.count(100) == 3
+
+
+def test_consume() -> None:
+    buffer = CommandBuffer([Bytes(b"a"), Bytes(b"bc"), Bytes(b"def")])
+    buffer.consume(1)
+
+    other = CommandBuffer([Bytes(b"g")])
+    other.extend(buffer)
+
+    assert [bytes(span) for span in other] == [b"g", b"bc", b"def"]
+    assert other.count(3) == 2
+
+    buffer.consume(2)
+
+    assert len(buffer) == 0
+    assert buffer.nbytes == 0
@@ -0,0 +1,19 @@
+from imagewriter.encoding import PrintGraphicsData
+
+
+def test_uncompressed() -> None:
+    graphics = PrintGraphicsData(b"\x00" * 16)
+
+    assert bytes(graphics) == b"\x1bg002" + b"\x00" * 16
+    assert graphics.compression_ratio == 1.0
+
+
+def test_compressed() -> None:
+    data = b"\x00" * 100 + b"abc" + b"\xff" * 20 + b"x" * 13
+    graphics = PrintGraphicsData(data, compress=True)
+
+    assert bytes(graphics) == (
+        b"\x1bV0100\x00" + b"\x1bG0003abc" + b"\x1bV0020\xff" + b"\x1bG0013" + b"x" * 13
+    )
+    assert len(graphics) == len(bytes(graphics))
+    assert graphics.compression_ratio == len(PrintGraphicsData(data)) / len(graphics)
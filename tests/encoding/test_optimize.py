@@ -0,0 +1,72 @@
+from typing import List
+
+from imagewriter.encoding import (
+    Bytes,
+    CharacterEncoder,
+    CloseSoftwareSwitches,
+    Command,
+    esc,
+    NULL,
+    OpenSoftwareSwitches,
+    optimize,
+    SoftwareSwitch,
+    START_BOLDFACE,
+    START_UNDERLINE,
+    STOP_BOLDFACE,
+    STOP_UNDERLINE,
+)
+
+
+def encode(commands: List[Command]) -> bytes:
+    return b"".join(bytes(cmd) for cmd in commands)
+
+
+def test_merge_bytes() -> None:
+    optimized = optimize([Bytes(b"a"), NULL, Bytes(b""), Bytes(b"b")])
+
+    assert encode(optimized) == b"ab"
+    assert len(optimized) == 1
+
+
+def test_cancel_toggles() -> None:
+    commands: List[Command] = [
+        STOP_BOLDFACE,
+        Bytes(b"a"),
+        START_BOLDFACE,
+        START_UNDERLINE,
+        Bytes(b""),
+        STOP_UNDERLINE,
+        STOP_BOLDFACE,
+        Bytes(b"b"),
+    ]
+
+    # Boldface was already off, so both of its toggles go away. Underline
+    # may have been on, so it's stopped either way.
+    assert encode(optimize(commands)) == (
+        bytes(STOP_BOLDFACE) + b"a" + bytes(STOP_UNDERLINE) + b"b"
+    )
+
+
+def test_mode_flips() -> None:
+    encoder = CharacterEncoder()
+    commands = encoder.encode("a →") + encoder.encode("→ b")
+
+    assert encode(optimize(commands)) == (
+        b"a " + esc("&") + bytes([213, 213]) + esc("$") + b" b"
+    )
+
+
+def test_fold_switches() -> None:
+    commands: List[Command] = [
+        OpenSoftwareSwitches({SoftwareSwitch.SLASHED_ZERO}),
+        CloseSoftwareSwitches(set()),
+        CloseSoftwareSwitches({SoftwareSwitch.SLASHED_ZERO}),
+        OpenSoftwareSwitches({SoftwareSwitch.LANGUAGE_1}),
+    ]
+
+    assert encode(optimize(commands)) == encode(
+        [
+            OpenSoftwareSwitches({SoftwareSwitch.LANGUAGE_1}),
+            CloseSoftwareSwitches({SoftwareSwitch.SLASHED_ZERO}),
+        ]
+    )
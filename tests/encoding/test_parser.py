@@ -0,0 +1,77 @@
+from typing import List
+
+import pytest
+
+from imagewriter.encoding.base import Bytes, Command, Ctrl, Esc
+from imagewriter.encoding.character.custom import CustomCharacter
+from imagewriter.encoding.graphics import PrintGraphicsData
+from imagewriter.encoding.motion import LineFeed, TabStops
+from imagewriter.encoding.parser import parse, Parser
+from imagewriter.pitch import Pitch
+
+CUSTOM_LOAD = CustomCharacter.load(
+    [(CustomCharacter(ord("$")), b"\x04\x1b\x0d\x0a\x04\x00\x00\x00", True)]
+)
+
+TAB_STOPS = bytes(TabStops(Pitch.ELITE).set_many([10, 20, 30]))
+
+STREAM: bytes = (
+    b"\x1bc"
+    + b"Hello, world!\r\n"
+    + TAB_STOPS
+    + b"\x1bmtext\x1bm3\t"
+    + CUSTOM_LOAD
+    + bytes(PrintGraphicsData(b"\x04\x1b\x00\xff" * 8))
+    + bytes(PrintGraphicsData(b"\x00" * 40, compress=True))
+    + bytes(LineFeed.feed(12))
+    + b"\x1bK3\x0c"
+)
+
+
+def encode(commands: List[Command]) -> bytes:
+    return b"".join(bytes(command) for command in commands)
+
+
+def test_round_trip() -> None:
+    assert encode(parse(STREAM)) == STREAM
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7])
+def test_chunked(size: int) -> None:
+    parser = Parser()
+    commands: List[Command] = list()
+
+    for i in range(0, len(STREAM), size):
+        commands += parser.feed(STREAM[i : i + size])
+
+    commands += parser.close()
+
+    assert encode(commands) == STREAM
+    assert [bytes(c) for c in commands if not isinstance(c, Bytes)] == [
+        bytes(c) for c in parse(STREAM) if not isinstance(c, Bytes)
+    ]
+
+
+def test_commands() -> None:
+    commands = parse(STREAM)
+
+    assert isinstance(commands[0], Esc)
+    assert bytes(commands[1]) == b"Hello, world!\r\n"
+    assert bytes(commands[2]) == TAB_STOPS
+    assert bytes(commands[2]) == b"\x1b(010,020,030."
+    assert isinstance(commands[3], Esc)
+    assert bytes(commands[5]) == b"\x1bm3"
+    assert bytes(commands[7]) == CUSTOM_LOAD
+    assert isinstance(commands[8], PrintGraphicsData)
+    assert commands[8].data == b"\x04\x1b\x00\xff" * 8
+    assert bytes(commands[10]) == b"\x1f<"
+    assert isinstance(commands[-1], Ctrl)
+
+
+def test_incomplete() -> None:
+    parser = Parser()
+
+    assert encode(parser.feed(b"abc\x1bG00")) == b"abc"
+    assert parser.pending == 4
+    assert encode(parser.close()) == b"\x1bG00"
+    assert parser.pending == 0
@@ -0,0 +1,89 @@
+from typing import List
+
+import pytest
+
+from imagewriter.encoding.base import Bytes, Command
+from imagewriter.encoding.character.custom import CustomCharacter
+from imagewriter.encoding.graphics import PrintGraphicsData
+from imagewriter.encoding.motion import TabStops
+from imagewriter.encoding.parser import parse
+from imagewriter.encoding.segment import segment
+from imagewriter.pitch import Pitch
+from imagewriter.serial import AVAILABLE_WHEN_CTS_LOW
+
+LIMIT = 100
+
+
+def encode(commands: List[Command]) -> bytes:
+    return b"".join(bytes(cmd) for cmd in commands)
+
+
+def graphics(commands: List[Command]) -> bytes:
+    """
+    The graphics data printed by a series of graphics commands, with repeats
+    expanded.
+    """
+
+    data = b""
+
+    for command in parse(encode(commands)):
+        encoded = bytes(command)
+
+        if isinstance(command, PrintGraphicsData):
+            data += command.data
+        elif encoded[:2] == b"\x1bV":
+            data += encoded[6:7] * int(encoded[2:6])
+        else:
+            raise AssertionError(f"Unexpected command {encoded!r}")
+
+    return data
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_graphics(compress: bool) -> None:
+    data = bytes(range(256)) * 4 + b"\x00" * 500 + bytes(range(200))
+    segmented = list(segment([PrintGraphicsData(data, compress)], LIMIT))
+
+    assert all(len(command) <= LIMIT for command in segmented)
+    assert graphics(segmented) == data
+
+
+def test_custom_characters() -> None:
+    characters = [(CustomCharacter(160 + n), bytes([n]) * 8, True) for n in range(20)]
+    segmented = list(segment([Bytes(CustomCharacter.load(characters))], LIMIT))
+
+    assert all(len(command) <= LIMIT for command in segmented)
+    assert encode(segmented) == b"".join(
+        CustomCharacter.load(characters[i : i + 9]) for i in range(0, 20, 9)
+    )
+
+
+def test_tab_stops() -> None:
+    stops = TabStops(Pitch.ULTRACONDENSED).set_many(list(range(1, 60)))
+    segmented = list(segment([stops], LIMIT))
+
+    assert all(len(command) <= LIMIT for command in segmented)
+    assert encode(segmented).count(b"\x1b(") == 3
+    assert encode(segmented).replace(b".\x1b(", b",") == bytes(stops)
+
+
+def test_text() -> None:
+    text = b"Hello, world!\r\n" * 20
+    segmented = list(segment([Bytes(text)], LIMIT))
+
+    assert all(len(command) <= LIMIT for command in segmented)
+    assert encode(segmented) == text
+
+
+def test_small_commands_untouched() -> None:
+    commands: List[Command] = [Bytes(b"a" * LIMIT), PrintGraphicsData(b"\x01")]
+
+    assert list(segment(commands, LIMIT)) == commands
+
+
+def test_default_limit() -> None:
+    data = bytes(range(256))
+    segmented = list(segment([PrintGraphicsData(data)]))
+
+    assert all(len(cmd) <= AVAILABLE_WHEN_CTS_LOW for cmd in segmented)
+    assert graphics(segmented) == data
@@ -0,0 +1,41 @@
+from typing import List
+
+import numpy as np
+
+from imagewriter.encoding import Color
+from imagewriter.image import rasterize_color, separate
+from imagewriter.pitch import Pitch
+
+
+def test_separate() -> None:
+    image = np.array([[[255, 255, 255], [0, 0, 0], [255, 0, 0], [0, 255, 255]]])
+    planes = separate(image.astype(np.uint8))
+
+    # Red is magenta and yellow; cyan is just cyan
+    assert planes[Color.BLACK].tolist() == [[255, 0, 255, 255]]
+    assert planes[Color.CYAN].tolist() == [[255, 255, 255, 0]]
+    assert planes[Color.MAGENTA].tolist() == [[255, 255, 0, 255]]
+    assert planes[Color.YELLOW].tolist() == [[255, 255, 0, 255]]
+
+
+def test_passes() -> None:
+    # Three bands - black and red, blank, then black
+    image = np.full((24, 8, 3), 255, dtype=np.uint8)
+    image[0, 0] = [0, 0, 0]
+    image[0, 1] = [255, 0, 0]
+    image[16, 0] = [0, 0, 0]
+
+    commands = list(rasterize_color(image, pitch=Pitch.PICA))
+    colors: List[bytes] = [
+        bytes(command)
+        for command in commands
+        if bytes(command) in {bytes(color.set()) for color in Color}
+    ]
+
+    # Yellow and magenta print on the first band only, and the second black
+    # pass follows the first without shifting the ribbon
+    assert colors == [
+        bytes(Color.YELLOW.set()),
+        bytes(Color.MAGENTA.set()),
+        bytes(Color.BLACK.set()),
+    ]
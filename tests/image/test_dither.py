@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from imagewriter.image import atkinson, floyd_steinberg, ordered, resample
+from imagewriter.image.dither import bayer_matrix
+from imagewriter.pitch import Pitch
+
+
+def test_bayer_matrix() -> None:
+    matrix = bayer_matrix(8)
+
+    assert sorted(matrix.flatten().tolist()) == list(range(64))
+
+
+@pytest.mark.parametrize("gray", [0, 64, 128, 192, 255])
+def test_ordered(gray: int) -> None:
+    image = np.full((16, 16), gray, dtype=np.uint8)
+
+    assert ordered(image, 4).mean() == pytest.approx(1 - gray / 256, abs=1 / 16)
+
+
+@pytest.mark.parametrize("dither", [floyd_steinberg, atkinson])
+def test_error_diffusion(dither) -> None:
+    image = np.full((64, 64), 128, dtype=np.uint8)
+    rows = list(dither(image))
+
+    assert len(rows) == 64
+    assert np.vstack(rows).mean() == pytest.approx(0.5, abs=0.05)
+
+
+def test_resample() -> None:
+    image = np.zeros((300, 300), dtype=np.uint8)
+
+    assert resample(image, 300, Pitch.PICA).shape == (72, 80)
+    assert resample(image, 300, Pitch.PICA, 144).shape == (144, 80)
@@ -0,0 +1,131 @@
+import os
+from pathlib import Path
+import struct
+
+import numpy as np
+import pytest
+
+from imagewriter.encoding.character.custom import CustomCharacter
+from imagewriter.image.font import (
+    BitmapFont,
+    compile_font,
+    compile_glyph,
+    load_font,
+    parse_bdf,
+    parse_psf,
+)
+
+BDF = b"""STARTFONT 2.1
+FONT test
+SIZE 9 75 75
+FONTBOUNDINGBOX 5 9 0 -2
+FONT_ASCENT 7
+FONT_DESCENT 2
+CHARS 2
+STARTCHAR A
+ENCODING 65
+DWIDTH 6 0
+BBX 5 7 0 0
+BITMAP
+20
+50
+88
+F8
+88
+88
+88
+ENDCHAR
+STARTCHAR g
+ENCODING 103
+DWIDTH 6 0
+BBX 5 7 0 -2
+BITMAP
+78
+88
+88
+78
+08
+08
+70
+ENDCHAR
+ENDFONT
+"""
+
+
+def test_bdf() -> None:
+    font = parse_bdf(BDF)
+
+    assert font.height == 9
+    assert font.glyphs[65].shape == (9, 6)
+
+    columns, top_wires = compile_glyph(font.glyphs[65])
+
+    # The left column of "A" has ink in rows 2 to 6
+    assert top_wires
+    assert columns[0] == 0b01111100
+    assert len(columns) == 6
+
+    # "g" descends into the bottom row, so it's printed on the bottom wires
+    columns, top_wires = compile_glyph(font.glyphs[103])
+
+    assert not top_wires
+    # Its right column has ink in rows 2 to 7, which are wires 1 to 6 of
+    # the bottom 8
+    assert columns[4] == 0b01111110
+
+
+def test_psf2() -> None:
+    glyph = bytes([0xFF, 0x81, 0x81, 0x81, 0x81, 0x81, 0x81, 0xFF])
+    header = struct.pack("<4sIIIIIII", b"\x72\xb5\x4a\x86", 0, 32, 1, 1, 8, 8, 8)
+    table = "€".encode("utf-8") + b"\xff"
+
+    font = parse_psf(header + glyph + table)
+
+    assert list(font.glyphs) == [ord("€")]
+    assert compile_glyph(font.glyphs[ord("€")])[0] == b"\xff" + b"\x81" * 6 + b"\xff"
+
+
+def test_cache(tmp_path: Path) -> None:
+    path = tmp_path / "test.bdf"
+    path.write_bytes(BDF)
+    cache = str(tmp_path / "cache")
+
+    with load_font(path, directory=cache) as font:
+        assert len(font) == 2
+        assert 65 in font
+        assert 66 not in font
+
+        expected = compile_glyph(parse_bdf(BDF).glyphs[65])
+        assert font.glyph(65) == expected
+
+        character, data, top_wires = font.character_data(65)
+        assert character.point == 65
+        assert (data, top_wires) == expected
+
+    assert len(os.listdir(cache)) == 1
+
+    # The second load comes from the cache
+    with load_font(path, directory=cache) as font:
+        assert font.glyph(103) == compile_glyph(parse_bdf(BDF).glyphs[103])
+        assert CustomCharacter.load([font.character_data(103)])
+
+
+def test_wide_glyphs() -> None:
+    bitmap = np.zeros((8, 20), dtype=np.bool_)
+    bitmap[0, 15] = True
+
+    # Blank columns past 16 are cropped
+    columns, _ = compile_glyph(bitmap)
+    assert len(columns) == 16
+
+    bitmap[0, 16] = True
+
+    with pytest.raises(ValueError):
+        compile_glyph(bitmap)
+
+
+def test_tall_font() -> None:
+    font = BitmapFont(height=16, glyphs={65: np.zeros((16, 8), dtype=np.bool_)})
+
+    with pytest.raises(ValueError, match="0x41"):
+        compile_font(font)
@@ -0,0 +1,37 @@
+from pathlib import Path
+
+import numpy as np
+
+from imagewriter.image import MappedImage, rasterize, read_pnm
+from imagewriter.pitch import Pitch
+
+
+def test_bands(tmp_path: Path) -> None:
+    path = tmp_path / "banner.pgm"
+    pixels = np.arange(20 * 3, dtype=np.uint8).reshape(20, 3)
+    path.write_bytes(b"P5\n3 20\n255\n" + pixels.tobytes())
+
+    with MappedImage.open(path) as image:
+        bands = list(image.bands())
+
+    assert [band.shape for band in bands] == [(8, 3), (8, 3), (4, 3)]
+    assert np.array_equal(np.vstack(bands), pixels)
+
+
+def test_raw(tmp_path: Path) -> None:
+    path = tmp_path / "banner.raw"
+    path.write_bytes(bytes([0x80, 0x01] * 9))
+
+    with MappedImage.raw(path, width=16, bits=1) as image:
+        assert image.height == 9
+        assert image.rows(0, 1).tolist() == [[True] + [False] * 14 + [True]]
+
+
+def test_rasterize(tmp_path: Path) -> None:
+    path = tmp_path / "banner.pbm"
+    path.write_bytes(b"P4 16 20 " + bytes(range(40)))
+
+    streamed = rasterize(path, pitch=Pitch.PICA)
+    whole = rasterize(read_pnm(path), pitch=Pitch.PICA)
+
+    assert [bytes(c) for c in streamed] == [bytes(c) for c in whole]
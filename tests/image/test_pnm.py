@@ -0,0 +1,21 @@
+from pathlib import Path
+
+from imagewriter.image import read_pnm
+
+
+def test_pbm(tmp_path: Path) -> None:
+    path = tmp_path / "image.pbm"
+    path.write_bytes(b"P4\n# A comment\n10 2\n" + bytes([0x80, 0x00, 0x00, 0xFF]))
+
+    image = read_pnm(path)
+
+    assert image.shape == (2, 10)
+    assert image[0].tolist() == [True] + [False] * 9
+    assert image[1].tolist() == [False] * 8 + [True, True]
+
+
+def test_pgm(tmp_path: Path) -> None:
+    path = tmp_path / "image.pgm"
+    path.write_bytes(b"P5 3 1 15\n" + bytes([0, 5, 15]))
+
+    assert read_pnm(path).tolist() == [[0, 85, 255]]
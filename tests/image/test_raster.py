@@ -0,0 +1,82 @@
+import numpy as np
+
+from imagewriter.encoding import CR, LF, PrintGraphicsData
+from imagewriter.image import pack_bands, rasterize
+from imagewriter.pitch import Pitch
+
+
+def test_pack_bands() -> None:
+    bitmap = np.zeros((10, 3), dtype=np.bool_)
+    bitmap[0, 0] = True
+    bitmap[7, 1] = True
+    bitmap[9, 2] = True
+
+    # The top row is the least significant bit, and the last band is padded
+    assert pack_bands(bitmap).tolist() == [[0x01, 0x80, 0x00], [0x00, 0x00, 0x02]]
+
+
+def test_grayscale() -> None:
+    image = np.full((8, 4), 255, dtype=np.uint8)
+    image[:, 1] = 0
+
+    commands = list(rasterize(image, pitch=Pitch.PICA))
+
+    assert bytes(commands[1]) == b"\x1bT16"
+    assert bytes(commands[2]) == bytes(PrintGraphicsData(b"\x00\xff"))
+    assert commands[3:] == [CR, LF]
+
+
+def test_skip_blank() -> None:
+    image = np.zeros((8 * 20, 100), dtype=np.bool_)
+    image[8 * 17, 40:50] = True
+
+    commands = [bytes(command) for command in rasterize(image, pitch=Pitch.PICA)]
+
+    assert commands[2:] == [
+        b"\x1f?",
+        b"\x1f2",
+        b"\x1bF0040",
+        bytes(PrintGraphicsData(b"\x01" * 10)),
+        b"\r",
+        b"\x1f3",
+    ]
+
+
+def test_page() -> None:
+    page = np.random.default_rng(0).random((11 * 72, 1280)) < 0.5
+
+    commands = list(rasterize(page))
+
+    assert len(commands) == 2 + 99 * 3
+
+
+def test_interleave() -> None:
+    image = np.zeros((16, 2), dtype=np.bool_)
+    image[0::2, 0] = True
+    image[1::2, 1] = True
+
+    commands = [
+        bytes(command)
+        for command in rasterize(image, pitch=Pitch.PICA, vertical_resolution=144)
+    ]
+
+    # Even rows, a 1/144 inch feed, then odd rows and a feed to the next strip
+    assert commands[1:] == [
+        b"\x1bT01",
+        bytes(PrintGraphicsData(b"\xff")),
+        b"\r",
+        b"\n",
+        bytes(PrintGraphicsData(b"\x00\xff")),
+        b"\r",
+        b"\x1f?",
+    ]
+
+
+def test_stream() -> None:
+    image = np.zeros((12, 4), dtype=np.bool_)
+    image[::2] = True
+
+    streamed = rasterize(iter(image), pitch=Pitch.PICA)
+    whole = rasterize(image, pitch=Pitch.PICA)
+
+    assert [bytes(c) for c in streamed] == [bytes(c) for c in whole]
@@ -0,0 +1,253 @@
+import asyncio
+from pathlib import Path
+from typing import Any, cast, List, Self
+
+import pytest
+
+from tests.test_connection import FakePort
+
+from imagewriter import service
+from imagewriter.connection import Connection
+from imagewriter.container import Container
+from imagewriter.emulator import VirtualPrinter
+from imagewriter.encoding import Bytes, Command
+from imagewriter.encoding.segment import segment
+from imagewriter.serial import AVAILABLE_WHEN_CTS_LOW, Serial
+from imagewriter.service import server
+from imagewriter.service.spool import Spool
+
+JOB = bytes(range(32, 127)) * 200
+
+
+@pytest.mark.asyncio
+async def test_server(tmp_path: Path) -> None:
+    printer = VirtualPrinter(time_scale=200)
+    printer.start()
+
+    container = Container(
+        printer.path,
+        serial=printer.serial_factory,
+        connection=printer.connection_factory,
+    )
+
+    srv = await server(container.connection, Spool(str(tmp_path)), "127.0.0.1", 0)
+
+    _, writer = await asyncio.open_connection("127.0.0.1", srv.port)
+    writer.write(JOB)
+    await writer.drain()
+    writer.close()
+    await writer.wait_closed()
+
+    received = await asyncio.to_thread(printer.wait_for_received, len(JOB), 30)
+
+    # Wait for the job to be checkpointed and removed from the spool
+    for _ in range(100):
+        if not list(tmp_path.iterdir()):
+            break
+        await asyncio.sleep(0.05)
+
+    await srv.close()
+    container.connection.shutdown()
+    printer.shutdown()
+
+    assert received
+    assert printer.output == JOB
+    assert printer.stats.overruns == 0
+    assert not list(tmp_path.iterdir()), "Printed jobs should be removed"
+
+
+@pytest.mark.asyncio
+async def test_resume(tmp_path: Path) -> None:
+    spool = Spool(str(tmp_path))
+    job = spool.create()
+    job.append(JOB)
+    job.finish()
+    job.confirm(1000)
+    job.close()
+
+    printer = VirtualPrinter(time_scale=200)
+    printer.start()
+
+    container = Container(
+        printer.path,
+        serial=printer.serial_factory,
+        connection=printer.connection_factory,
+    )
+
+    srv = await server(container.connection, Spool(str(tmp_path)), "127.0.0.1", 0)
+
+    received = await asyncio.to_thread(printer.wait_for_received, len(JOB) - 1000, 30)
+
+    await srv.close()
+    container.connection.shutdown()
+    printer.shutdown()
+
+    assert received
+    assert printer.output == JOB[1000:]
+
+
+class FailingConnection:
+    """
+    A connection which fails on its first write, and otherwise transmits
+    everything immediately.
+    """
+
+    def __init__(self: Self) -> None:
+        self.pending: int = 0
+        self.transmitted: int = 0
+        self.clear_to_send: bool = True
+        self.running: bool = True
+        self.writes: List[bytes] = list()
+
+    @property
+    def queued(self: Self) -> int:
+        return self.transmitted + self.pending
+
+    def write(self: Self, commands: List[Command]) -> None:
+        if not self.writes:
+            self.writes.append(b"")
+            raise RuntimeError("The printer went away")
+
+        data = b"".join(bytes(command) for command in commands)
+        self.writes.append(data)
+        self.transmitted += len(data)
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_skipped(tmp_path: Path) -> None:
+    spool = Spool(str(tmp_path))
+
+    for data in [b"First job", b"Second job"]:
+        job = spool.create()
+        job.append(data)
+        job.finish()
+        job.close()
+
+    connection = FailingConnection()
+    srv = await server(cast(Connection, connection), Spool(str(tmp_path)), port=0)
+
+    for _ in range(100):
+        if len(list(tmp_path.iterdir())) == 2:
+            break
+        await asyncio.sleep(0.05)
+
+    assert not srv.transmitter.done(), "Transmitter should keep running"
+    await srv.close()
+
+    assert b"".join(connection.writes) == b"Second job"
+    assert len(list(tmp_path.iterdir())) == 2, "Failed job should stay spooled"
+
+
+class FailingPort(FakePort):
+    """
+    A port which fails on its first write.
+    """
+
+    def write(self: Self, data: Any) -> int:
+        if not self.writes:
+            self.writes.append(b"")
+            raise OSError("The printer went away")
+
+        return super().write(data)
+
+
+@pytest.mark.asyncio
+async def test_writer_fails_after_last_write(tmp_path: Path) -> None:
+    spool = Spool(str(tmp_path))
+
+    for data in [b"First job", b"Second job"]:
+        job = spool.create()
+        job.append(data)
+        job.finish()
+        job.close()
+
+    port = FailingPort()
+    connection = Connection(cast(Serial, port))
+    srv = await server(connection, Spool(str(tmp_path)), port=0)
+
+    for _ in range(100):
+        if len(list(tmp_path.iterdir())) == 2:
+            break
+        await asyncio.sleep(0.05)
+
+    assert not srv.transmitter.done(), "Transmitter should keep running"
+    await srv.close()
+    connection.shutdown()
+
+    assert b"".join(port.writes) == b"Second job"
+    assert len(list(tmp_path.iterdir())) == 2, "Failed job should stay spooled"
+
+
+@pytest.mark.asyncio
+async def test_dropped_client(tmp_path: Path) -> None:
+    connection = FailingConnection()
+    connection.writes.append(b"")
+    srv = await server(
+        cast(Connection, connection), Spool(str(tmp_path)), "127.0.0.1", 0
+    )
+
+    _, writer = await asyncio.open_connection("127.0.0.1", srv.port)
+    writer.write(JOB[:1000])
+    await writer.drain()
+    writer.transport.abort()
+
+    for _ in range(100):
+        if not list(tmp_path.iterdir()):
+            break
+        await asyncio.sleep(0.05)
+
+    await srv.close()
+
+    assert not list(tmp_path.iterdir()), "Dropped jobs should be discarded"
+
+
+# Graphics and tab lists longer than a burst, which are split up when written
+GRAPHICS_JOB = (
+    b"\x1bG0300"
+    + bytes(range(256))
+    + bytes(44)
+    + b"\x1b("
+    + b",".join(b"%03d" % stop for stop in range(8, 488, 8))
+    + b"."
+    + b"Hello, world!\r\n"
+) * 4
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("chunk", [37, 250, 1000])
+async def test_graphics_chunks(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, chunk: int
+) -> None:
+    monkeypatch.setattr(service, "HIGH_WATER_MARK", chunk)
+
+    spool = Spool(str(tmp_path))
+    job = spool.create()
+    job.append(GRAPHICS_JOB)
+    job.finish()
+    job.close()
+
+    printer = VirtualPrinter(time_scale=200)
+    printer.start()
+
+    container = Container(
+        printer.path,
+        serial=printer.serial_factory,
+        connection=printer.connection_factory,
+    )
+
+    srv = await server(container.connection, Spool(str(tmp_path)), "127.0.0.1", 0)
+
+    expected = b"".join(
+        bytes(command)
+        for command in segment([Bytes(GRAPHICS_JOB)], AVAILABLE_WHEN_CTS_LOW)
+    )
+    received = await asyncio.to_thread(printer.wait_for_received, len(expected), 30)
+
+    await srv.close()
+    container.connection.shutdown()
+    printer.shutdown()
+
+    assert received
+    # Commands are split as if the job had been written whole, no matter
+    # where the chunks fall
+    assert printer.output == expected
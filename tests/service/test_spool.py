@@ -0,0 +1,36 @@
+from pathlib import Path
+
+from imagewriter.service.spool import Spool
+
+
+def test_recover(tmp_path: Path) -> None:
+    spool = Spool(str(tmp_path))
+
+    printed = spool.create()
+    printed.append(b"Hello world!\r\n")
+    printed.finish()
+    printed.confirm(printed.size)
+
+    interrupted = spool.create()
+    interrupted.append(b"Hello ")
+    interrupted.append(b"world!\r\n")
+    interrupted.finish()
+    interrupted.confirm(6)
+
+    receiving = spool.create()
+    receiving.append(b"Hello")
+
+    for job in [printed, interrupted, receiving]:
+        job.close()
+
+    jobs = Spool(str(tmp_path)).recover()
+
+    assert [job.id for job in jobs] == [interrupted.id]
+
+    job = jobs[0]
+    view = job.read(job.offset, 1024)
+    assert view == b"world!\r\n"
+    view.release()
+
+    job.remove()
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,151 @@
+import asyncio
+import os
+from typing import Any, cast, Generator, List, Optional, Self
+
+import pytest
+
+from imagewriter.aio import AsyncConnection
+from imagewriter.emulator import VirtualPrinter
+from imagewriter.encoding import Bytes
+from imagewriter.serial import (
+    AVAILABLE_WHEN_CTS_HIGH,
+    AVAILABLE_WHEN_CTS_LOW,
+    Serial,
+    SerialProtocol,
+)
+
+TEXT = b"The quick brown fox jumps over the lazy dog.\r\n" * 100
+
+
+@pytest.mark.asyncio
+async def test_write() -> None:
+    printer = VirtualPrinter(time_scale=100)
+    printer.start()
+
+    port = printer.serial_factory(printer.path, printer.dip_switches)
+    connection = AsyncConnection(port)
+
+    first = connection.write([Bytes(TEXT[:40])])
+    rest = connection.write([Bytes(TEXT[i : i + 40]) for i in range(40, len(TEXT), 40)])
+
+    await asyncio.wait_for(first, timeout=30)
+    assert connection.transmitted >= 40
+
+    await asyncio.wait_for(rest, timeout=30)
+    await connection.drain()
+
+    assert connection.pending == 0
+    assert connection.transmitted == len(TEXT)
+
+    await connection.stop()
+    printer.shutdown()
+
+    assert printer.output == TEXT
+    assert printer.stats.overruns == 0
+
+
+class PipePort:
+    """
+    A port which writes into a pipe, with a CTS line set by the test.
+    """
+
+    def __init__(self: Self) -> None:
+        self.protocol: SerialProtocol = SerialProtocol.HARDWARE_HANDSHAKE
+        self.rtscts: bool = True
+        self.xonxoff: bool = False
+        self.cts: bool = True
+        self.baudrate: int = 9600
+        self.write_timeout: Optional[float] = None
+        self.out_waiting: int = 0
+        self.writes: List[bytes] = list()
+        self.error: Optional[Exception] = None
+
+        self._read, self._write = os.pipe()
+        os.set_blocking(self._write, False)
+
+    def fileno(self: Self) -> int:
+        return self._write
+
+    def write(self: Self, data: Any) -> int:
+        if self.error:
+            raise self.error
+
+        n = os.write(self._write, data)
+        self.writes.append(bytes(data[:n]))
+        return n
+
+    def close(self: Self) -> None:
+        os.close(self._read)
+        os.close(self._write)
+
+
+@pytest.fixture
+def port() -> Generator[PipePort, None, None]:
+    port = PipePort()
+    yield port
+    port.close()
+
+
+@pytest.mark.asyncio
+async def test_waits_for_cts(port: PipePort) -> None:
+    port.cts = False
+    connection = AsyncConnection(cast(Serial, port))
+
+    written = connection.write([Bytes(b"Hello world!")])
+    await asyncio.sleep(0.1)
+
+    assert not written.done()
+    assert port.writes == []
+
+    port.cts = True
+    await asyncio.wait_for(written, timeout=5)
+    await connection.stop()
+
+    assert port.writes == [b"Hello world!"]
+
+
+@pytest.mark.asyncio
+async def test_bursts_shrink_while_cts_stays_high(port: PipePort) -> None:
+    connection = AsyncConnection(cast(Serial, port))
+
+    commands = [Bytes(bytes([n]) * 10) for n in range(20)]
+    await asyncio.wait_for(connection.write(commands), timeout=5)
+    await connection.stop()
+
+    assert len(port.writes[0]) == AVAILABLE_WHEN_CTS_HIGH
+    assert all(len(burst) <= AVAILABLE_WHEN_CTS_LOW for burst in port.writes[1:])
+
+
+@pytest.mark.asyncio
+async def test_interrupt(port: PipePort) -> None:
+    port.cts = False
+    connection = AsyncConnection(cast(Serial, port))
+
+    written = connection.write([Bytes(b"Hello world!")])
+
+    await asyncio.wait_for(connection.interrupt([Bytes(b"\x18")]), timeout=5)
+    assert port.writes == [b"\x18"]
+    assert port.rtscts, "Flow control should be restored"
+
+    async with connection.paused_writes():
+        port.cts = True
+        await asyncio.sleep(0.1)
+        assert port.writes == [b"\x18"], "Writes should be paused"
+
+    await asyncio.wait_for(written, timeout=5)
+    await connection.stop()
+
+    assert port.writes == [b"\x18", b"Hello world!"]
+
+
+@pytest.mark.asyncio
+async def test_write_error(port: PipePort) -> None:
+    port.error = OSError("The printer went away")
+    connection = AsyncConnection(cast(Serial, port))
+
+    written = connection.write([Bytes(b"Hello world!")])
+
+    with pytest.raises(OSError):
+        await asyncio.wait_for(written, timeout=5)
+
+    await connection.stop()
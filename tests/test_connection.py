@@ -0,0 +1,228 @@
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+from typing import Any, cast, List, Optional, Self
+
+from imagewriter.connection import Connection
+from imagewriter.encoding.base import Bytes
+from imagewriter.encoding.graphics import PrintGraphicsData
+from imagewriter.serial import (
+    AVAILABLE_WHEN_CTS_HIGH,
+    AVAILABLE_WHEN_CTS_LOW,
+    Serial,
+    SerialProtocol,
+)
+
+
+class FakePort:
+    def __init__(self: Self) -> None:
+        self.protocol: SerialProtocol = SerialProtocol.HARDWARE_HANDSHAKE
+        self.rtscts: bool = True
+        self.xonxoff: bool = False
+        self.cts: bool = True
+        self.baudrate: int = 9600
+        self.writes: List[bytes] = list()
+        # Seconds each flush takes per byte written
+        self.delay: float = 0.0
+        # If set, flushes wait for it
+        self.hold: Optional[threading.Event] = None
+
+    def write(self: Self, data: Any) -> int:
+        self.writes.append(bytes(data))
+        return len(data)
+
+    def flush(self: Self) -> None:
+        if self.hold is not None:
+            self.hold.wait(5)
+
+        if self.writes:
+            time.sleep(self.delay * len(self.writes[-1]))
+
+
+def connect(port: FakePort) -> Connection:
+    return Connection(cast(Serial, port))
+
+
+def test_bursts_keep_commands_whole() -> None:
+    port = FakePort()
+    connection = connect(port)
+
+    commands = [Bytes(bytes([n]) * 9) for n in range(30)]
+
+    with connection.paused_writes():
+        connection.write(commands)
+
+    assert connection.drain(timeout=5)
+    connection.shutdown()
+
+    assert b"".join(port.writes) == b"".join(bytes(cmd) for cmd in commands)
+    for burst in port.writes:
+        assert len(burst) <= AVAILABLE_WHEN_CTS_HIGH
+        assert len(burst) % 9 == 0, "Commands should not be split"
+    assert len(port.writes) < len(commands), "Commands should be coalesced"
+
+
+def test_waits_for_cts() -> None:
+    port = FakePort()
+    port.cts = False
+    connection = connect(port)
+
+    connection.write([Bytes(b"Hello world!")])
+
+    assert not connection.drain(timeout=0.1)
+    assert port.writes == []
+
+    port.cts = True
+
+    assert connection.drain(timeout=5)
+    connection.shutdown()
+
+    assert port.writes == [b"Hello world!"]
+
+
+def test_segments_long_commands() -> None:
+    port = FakePort()
+    connection = connect(port)
+
+    data = bytes(range(256)) * 2
+
+    connection.write([PrintGraphicsData(data)])
+
+    assert connection.drain(timeout=5)
+    connection.shutdown()
+
+    assert all(len(burst) <= AVAILABLE_WHEN_CTS_HIGH for burst in port.writes)
+    assert len(b"".join(port.writes)) > len(data)
+
+
+def test_urgent_commands_ignore_cts() -> None:
+    port = FakePort()
+    port.cts = False
+    connection = connect(port)
+
+    connection.write([Bytes(b"Hello world!")])
+
+    assert connection.interrupt([Bytes(b"\x18")], timeout=5)
+    assert port.writes == [b"\x18"]
+    assert port.rtscts, "Flow control should be restored"
+
+    port.cts = True
+
+    assert connection.drain(timeout=5)
+    connection.shutdown()
+
+    assert port.writes == [b"\x18", b"Hello world!"]
+    assert connection.stats.urgent_writes == 1
+
+
+def test_urgent_commands_jump_the_queue() -> None:
+    port = FakePort()
+    port.delay = 0.001
+    connection = Connection(cast(Serial, port), latency=0.005)
+
+    commands = [Bytes(bytes([n]) * 4) for n in range(250)]
+    connection.write(commands)
+    time.sleep(0.1)
+
+    assert connection.interrupt([Bytes(b"\x18")], timeout=5)
+    assert connection.drain(timeout=5)
+    connection.shutdown()
+
+    # Bursts are written in 4 byte pieces, and the urgent command goes out
+    # between two of them, along with the next piece
+    urgent = next(i for i, write in enumerate(port.writes) if write[:1] == b"\x18")
+    assert all(len(write) <= 4 for write in port.writes[:urgent])
+    assert len(port.writes[urgent]) <= 5
+    assert urgent < len(port.writes) - 1
+    assert connection.stats.urgent_writes == 1
+
+
+def test_bursts_shrink_while_cts_stays_high() -> None:
+    port = FakePort()
+    connection = connect(port)
+
+    commands = [Bytes(bytes([n]) * 10) for n in range(20)]
+
+    with connection.paused_writes():
+        connection.write(commands)
+
+    assert connection.drain(timeout=5)
+    connection.shutdown()
+
+    assert len(port.writes[0]) == AVAILABLE_WHEN_CTS_HIGH
+    assert all(len(burst) <= AVAILABLE_WHEN_CTS_LOW for burst in port.writes[1:])
+
+
+def test_long_commands_while_cts_stays_high() -> None:
+    port = FakePort()
+    connection = connect(port)
+
+    commands = [Bytes(bytes([n]) * size) for n, size in enumerate([100, 90, 90])]
+
+    with connection.paused_writes():
+        connection.write(commands)
+
+    assert connection.drain(timeout=5)
+    connection.shutdown()
+
+    assert b"".join(port.writes) == b"".join(bytes(cmd) for cmd in commands)
+    assert all(len(burst) <= AVAILABLE_WHEN_CTS_LOW for burst in port.writes[1:])
+
+
+def test_one_write_per_burst() -> None:
+    port = FakePort()
+    connection = connect(port)
+
+    commands = [Bytes(bytes([n]) * 9) for n in range(20)]
+
+    with connection.paused_writes():
+        connection.write(commands)
+
+    assert connection.drain(timeout=5)
+    connection.shutdown()
+
+    # 11 commands when CTS goes high, then 3 at a time while it stays high
+    assert [len(write) for write in port.writes] == [99, 27, 27, 27]
+
+
+def test_urgent_commands_share_a_write() -> None:
+    port = FakePort()
+    port.hold = threading.Event()
+    connection = Connection(cast(Serial, port), latency=0.005)
+
+    commands = [Bytes(bytes([n]) * 4) for n in range(10)]
+    connection.write(commands)
+
+    # Queue the urgent command while the first piece is being written
+    for _ in range(500):
+        if port.writes:
+            break
+        time.sleep(0.01)
+
+    connection.write([Bytes(b"\x18")], urgent=True)
+    port.hold.set()
+
+    assert connection.drain(timeout=5)
+    connection.shutdown()
+
+    assert port.writes[:2] == [bytes(commands[0]), b"\x18" + bytes(commands[1])]
+    assert len(port.writes) == len(commands)
+
+
+def test_exits_without_shutdown() -> None:
+    script = textwrap.dedent("""
+        from typing import cast
+
+        from imagewriter.connection import Connection
+        from imagewriter.encoding.base import Bytes
+        from imagewriter.serial import Serial
+        from tests.test_connection import FakePort
+
+        connection = Connection(cast(Serial, FakePort()))
+        connection.write([Bytes(b"Hello world!")])
+        connection.drain(timeout=5)
+        """)
+
+    subprocess.run([sys.executable, "-c", script], check=True, timeout=30)
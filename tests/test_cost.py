@@ -0,0 +1,71 @@
+import pytest
+
+from imagewriter.cost import CostModel, Estimate, Meter
+from imagewriter.encoding import (
+    Bytes,
+    Color,
+    PrintGraphicsData,
+    START_BOLDFACE,
+    STOP_BOLDFACE,
+)
+from imagewriter.quality import Quality
+
+LINE = Bytes(b"x" * 80 + b"\r\n")
+
+
+def test_text() -> None:
+    model = CostModel(baud_rate=9600, quality=Quality.DRAFT)
+    estimate = model.estimate([LINE] * 10)
+
+    assert estimate.serial == pytest.approx(820 * 10 / 9600)
+    assert estimate.text == pytest.approx(800 / 250)
+    assert estimate.total == estimate.printing
+
+    # Boldface is printed at Correspondence quality
+    bold = model.estimate([START_BOLDFACE, LINE, STOP_BOLDFACE])
+    assert bold.text == pytest.approx(80 / 180)
+
+
+def test_graphics_and_ribbon() -> None:
+    band = PrintGraphicsData(b"\xff" * 160)
+    usage = CostModel().measure(
+        [Color.CYAN.set(), band, Bytes(b"\r"), Color.BLACK.set(), band, LINE]
+    )
+
+    assert usage.passes == 2
+    assert usage.ribbon_shifts == 2
+    assert usage.characters == 80
+    assert usage.feeds == 1
+
+
+def test_form_feed_without_line_spacing() -> None:
+    usage = CostModel(form_length=11).measure([Bytes(b"\x1bT00hello\r\n\x0c")])
+
+    assert usage.feeds == 2
+    assert usage.feed_inches == pytest.approx(11)
+
+
+def test_meter_split_command() -> None:
+    band = bytes(PrintGraphicsData(b"\xff" * 160))
+    meter = Meter(CostModel())
+
+    first = meter.measure([band[:3]])
+    second = meter.measure([band[3:]])
+
+    assert first.passes == 0
+    assert second.passes == 1
+    assert second.graphics_inches == CostModel().measure([band]).graphics_inches
+
+
+def test_calibrate() -> None:
+    model = CostModel(baud_rate=9600)
+    jobs = [[LINE] * n for n in (10, 20, 40)]
+    usages = [model.measure(job) for job in jobs]
+
+    # The real printer is half as fast at text and feeds as the model thinks
+    samples = [(usage, 2 * model.price(usage).printing) for usage in usages]
+    calibrated = model.calibrate(samples)
+
+    for usage, seconds in samples:
+        estimate: Estimate = calibrated.price(usage)
+        assert estimate.total == pytest.approx(seconds)
@@ -0,0 +1,83 @@
+import subprocess
+import sys
+import textwrap
+import time
+
+from imagewriter.connection import Connection
+from imagewriter.container import Container
+from imagewriter.emulator import VirtualPrinter
+from imagewriter.encoding import Bytes
+from imagewriter.occupancy import BufferModel
+from imagewriter.quality import Quality
+
+TEXT = b"The quick brown fox jumps over the lazy dog.\r\n" * 100
+
+
+def test_flow_control() -> None:
+    # Near letter quality prints slowly enough for the buffer to fill
+    printer = VirtualPrinter(quality=Quality.NEAR_LETTER_QUALITY, time_scale=100)
+    printer.start()
+
+    container = Container(
+        printer.path,
+        serial=printer.serial_factory,
+        connection=printer.connection_factory,
+    )
+
+    container.connection.write(
+        [Bytes(TEXT[i : i + 40]) for i in range(0, len(TEXT), 40)]
+    )
+
+    assert container.connection.drain(timeout=30)
+    container.connection.shutdown()
+    printer.shutdown()
+
+    assert printer.output == TEXT
+    assert printer.stats.flow_control_stops > 0, "Buffer should have filled"
+    assert printer.stats.overruns == 0
+
+
+def test_overrun() -> None:
+    printer = VirtualPrinter(time_scale=100)
+    printer.start()
+
+    port = printer.serial_factory(printer.path, printer.dip_switches)
+    port.rtscts = False
+    port.write(TEXT)
+
+    assert printer.wait_for_received(len(TEXT), timeout=30)
+    printer.shutdown()
+
+    assert printer.stats.overruns > 0
+
+
+def test_buffer_model() -> None:
+    printer = VirtualPrinter(time_scale=100)
+    printer.start()
+
+    port = printer.serial_factory(printer.path, printer.dip_switches)
+    model = BufferModel(
+        capacity=printer.capacity,
+        clock=lambda: time.monotonic() * printer.time_scale,
+    )
+    connection = Connection(port, model=model)
+
+    connection.write([Bytes(TEXT[i : i + 40]) for i in range(0, len(TEXT), 40)])
+
+    assert connection.drain(timeout=30)
+    connection.shutdown()
+    printer.shutdown()
+
+    assert printer.output == TEXT
+    assert printer.stats.overruns == 0
+
+
+def test_exits_without_shutdown() -> None:
+    script = textwrap.dedent("""
+        from imagewriter.emulator import VirtualPrinter
+
+        printer = VirtualPrinter()
+        printer.start()
+        """)
+
+    subprocess.run([sys.executable, "-c", script], check=True, timeout=30)
@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+from typing import cast, List, Self, Tuple
+
+from serial import Serial
+
+from imagewriter.modem import ModemLines, ModemLineWatcher
+
+
+class FakeSerial:
+    def __init__(self: Self) -> None:
+        # Pseudo-terminals do not support TIOCMIWAIT
+        self._master, self._slave = os.openpty()
+        self.dtr: bool = True
+        self.dsr: bool = False
+        self.rts: bool = True
+        self.cts: bool = False
+
+    def fileno(self: Self) -> int:
+        return self._slave
+
+    def close(self: Self) -> None:
+        os.close(self._master)
+        os.close(self._slave)
+
+
+def test_falls_back_to_polling() -> None:
+    serial = FakeSerial()
+    watcher = ModemLineWatcher(cast(Serial, serial))
+
+    first = watcher.wait(None)
+    assert first == ModemLines(dtr=True, dsr=False, rts=True, cts=False)
+
+    threading.Timer(0.05, lambda: setattr(serial, "cts", True)).start()
+
+    start = time.monotonic()
+    second = watcher.wait(first)
+
+    assert second is not None and second.cts
+    assert time.monotonic() - start < 1
+    assert not watcher.blocking, "Watcher should have fallen back to polling"
+
+    threading.Timer(0.05, watcher.close).start()
+    assert watcher.wait(second) is None
+
+    serial.close()
+
+
+def test_transition_before_blocking() -> None:
+    serial = FakeSerial()
+    watcher = ModemLineWatcher(cast(Serial, serial))
+    watcher.blocking = True
+
+    counts: List[Tuple[int, ...]] = [(0, 0, 0, 0), (1, 0, 0, 0), (1, 0, 0, 0)]
+
+    def read_counts() -> Tuple[int, ...]:
+        # CTS changes after the lines are read, but before blocking
+        if len(counts) == 2:
+            serial.cts = True
+        return counts.pop(0)
+
+    def block() -> None:
+        raise AssertionError("Watcher should not block after a transition")
+
+    setattr(watcher, "_counts", read_counts)
+    setattr(watcher, "_block", block)
+
+    first = ModemLines(dtr=True, dsr=False, rts=True, cts=False)
+    second = watcher.wait(first)
+
+    assert second is not None and second.cts
+
+    serial.close()
@@ -0,0 +1,47 @@
+from typing import Self
+
+import pytest
+
+from imagewriter.cost import CostModel
+from imagewriter.occupancy import BufferModel
+from imagewriter.quality import Quality
+
+
+class FakeClock:
+    def __init__(self: Self) -> None:
+        self.now: float = 0.0
+
+    def __call__(self: Self) -> float:
+        return self.now
+
+
+def test_drains_at_print_speed() -> None:
+    clock = FakeClock()
+    model = BufferModel(cost=CostModel(quality=Quality.DRAFT), clock=clock)
+
+    model.sent(b"x" * 500)
+    assert model.level == 500
+
+    clock.now = 1.0
+    assert model.level == pytest.approx(250)
+
+    clock.now = 3.0
+    assert model.level == 0
+
+
+def test_cts_corrects_estimate() -> None:
+    clock = FakeClock()
+    model = BufferModel(capacity=2048, clock=clock)
+
+    # The printer is slower than the model thinks
+    model.sent(b"x" * 1000)
+    clock.now = 10.0
+
+    assert model.budget(True) == 2048
+    assert model.budget(False) == 30 - 27
+    assert model.level == 2048 - 30
+    assert model.corrections == 1
+
+    # The printer is faster than the model thinks
+    assert model.budget(True) == 100
+    assert model.corrections == 2